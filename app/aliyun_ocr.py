@@ -1,29 +1,80 @@
 import json
 import pathlib
+import threading
+from collections.abc import Mapping
 from io import BytesIO
 
-import alibabacloud_ocr_api20210707.client
-import alibabacloud_ocr_api20210707.models
-import alibabacloud_tea_openapi.models
-import alibabacloud_tea_util.models
+from app.common import read_file_content
+from app.metrics import METRICS
+from app.ocr_backend import OCRBackend
 
 
-class AliyunOCR:
-    def __init__(self, access_key_id, access_key_secret):
-        config = alibabacloud_tea_openapi.models.Config(
-            access_key_id=access_key_id, access_key_secret=access_key_secret
+def is_throttling_error(exc: Exception) -> bool:
+    # TeaException 的 code 形如 Throttling.User / Throttling.Api
+    code = getattr(exc, "code", None) or ""
+    return code.startswith("Throttling") or getattr(exc, "statusCode", None) == 429
+
+
+DEFAULT_ENDPOINT = "ocr-api.cn-hangzhou.aliyuncs.com"
+
+
+class AliyunOCR(OCRBackend):
+    name = "aliyun"
+
+    def __init__(
+        self,
+        access_key_id,
+        access_key_secret,
+        endpoint: str = DEFAULT_ENDPOINT,
+        protocol: str = "https",
+        timeout: float | None = None,
+    ):
+        self.access_key_id = access_key_id
+        self.access_key_secret = access_key_secret
+        # 压测时可以指向本地的 OCR 替身服务，如 endpoint = "127.0.0.1:9100"、protocol = "http"
+        self.endpoint = endpoint
+        self.protocol = protocol
+        # 连接和读取的超时（秒），None 时使用 SDK 的默认值
+        self.timeout = timeout
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Mapping, timeout: float | None = None) -> "AliyunOCR":
+        return cls(
+            access_key_id=config["access_key_id"],
+            access_key_secret=config["access_key_secret"],
+            endpoint=config.get("endpoint", DEFAULT_ENDPOINT),
+            protocol=config.get("protocol", "https"),
+            timeout=timeout,
         )
-        config.endpoint = "ocr-api.cn-hangzhou.aliyuncs.com"
-        self.client = alibabacloud_ocr_api20210707.client.Client(config)
-
-    def request(self, filename: bytes | str | pathlib.Path) -> str:
-        if isinstance(filename, (str, pathlib.Path)):
-            with open(filename, "rb") as f:
-                file_content = f.read()
-        elif isinstance(filename, bytes):
-            file_content = filename
-        else:
-            raise TypeError(f"Unknown type {type(filename)} for filename")
+
+    @property
+    def client(self):
+        # 阿里云 SDK 导入需要约 0.5 秒，第一次请求时才导入并创建客户端
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import alibabacloud_ocr_api20210707.client
+                    import alibabacloud_tea_openapi.models
+
+                    config = alibabacloud_tea_openapi.models.Config(
+                        access_key_id=self.access_key_id,
+                        access_key_secret=self.access_key_secret,
+                        protocol=self.protocol,
+                    )
+                    config.endpoint = self.endpoint
+                    self._client = alibabacloud_ocr_api20210707.client.Client(config)
+        return self._client
+
+    @METRICS.timed("ocr.request")
+    def recognize_general(
+        self, filename: bytes | memoryview | str | pathlib.Path
+    ) -> dict:
+        import alibabacloud_ocr_api20210707.models
+        import alibabacloud_tea_util.models
+
+        file_content = read_file_content(filename)
 
         body = BytesIO()
         body.write(file_content)
@@ -33,7 +84,10 @@ class AliyunOCR:
             alibabacloud_ocr_api20210707.models.RecognizeGeneralRequest(body=body)
         )
         runtime = alibabacloud_tea_util.models.RuntimeOptions()
+        if self.timeout is not None:
+            # SDK 的超时以毫秒为单位；超时后线程结束，被放弃的请求不会一直占用线程
+            runtime.connect_timeout = runtime.read_timeout = int(self.timeout * 1000)
         resp = self.client.recognize_general_with_options(
             recognize_general_request, runtime
         )
-        return json.loads(resp.body.data)["content"]
+        return json.loads(resp.body.data)
@@ -0,0 +1,186 @@
+import functools
+import hashlib
+import pathlib
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from io import BytesIO
+
+import arrow
+import fitz
+
+from app.billing_layout import BillingLayout, compose_billing_document
+from app.common import FITZ_LOCK, NamedFile
+from app.reconcile import PaymentItemData
+from app.upload_store import StoredFile
+from app.xlsx_template import XlsxTemplate
+
+APPLICATION_SHEET_NAME = "日常报销单"
+
+
+class ArtifactCache:
+    """生成文件的 LRU 缓存，同时限制条数和总字节数，线程安全。"""
+
+    def __init__(self, maxsize: int = 32, max_bytes: int = 256 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: Hashable, create: Callable[[], bytes]) -> bytes:
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+
+        data = create()
+
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = data
+                self._size += len(data)
+            while self._data and (
+                len(self._data) > self.maxsize or self._size > self.max_bytes
+            ):
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+        return data
+
+    def get(self, key: Hashable) -> bytes | None:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def fingerprint_payment_items(
+    payment_items: list[PaymentItemData], file_digest: Callable[[NamedFile], str]
+) -> str:
+    h = hashlib.sha256()
+    for item in payment_items:
+        h.update(
+            repr(
+                (
+                    item.payment_item.value,
+                    str(item.usd_amount),
+                    str(item.rmb_amount),
+                    item.service_start,
+                    item.service_through,
+                    [file_digest(file) for file in item.invoice_files],
+                    [file_digest(file) for file in item.billing_files],
+                )
+            ).encode()
+        )
+    return h.hexdigest()
+
+
+def fingerprint_file(path: str | pathlib.Path) -> tuple[str, int, int]:
+    stat = pathlib.Path(path).stat()
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+@functools.lru_cache(maxsize=16)
+def load_application_template(
+    path: str, fingerprint: tuple[str, int, int]
+) -> XlsxTemplate:
+    # 模板在进程内只读取、索引一次，文件变化（fingerprint 不同）时重新加载
+    return XlsxTemplate.load(path, APPLICATION_SHEET_NAME)
+
+
+def generate_reimbursement_application(
+    template: XlsxTemplate,
+    submitter: str,
+    payment_items: list[PaymentItemData],
+    today: arrow.Arrow,
+) -> bytes:
+    values = {
+        "C5": submitter,
+        "F5": today.format("YYYY.MM"),
+        "C42": submitter,
+        "F42": today.format("YYYY.MM.DD"),
+    }
+    for index, item in enumerate(payment_items):
+        row = index + 9
+        values[f"B{row}"] = item.service_start
+        values[f"C{row}"] = "200300"
+        values[f"D{row}"] = "软件"
+        values[f"E{row}"] = item.payment_item.capitalize()
+        values[f"G{row}"] = item.rmb_amount
+    return template.render(values)
+
+
+def build_billing_document(
+    payment_items: list[PaymentItemData], layout: BillingLayout = BillingLayout()
+) -> fitz.Document:
+    with FITZ_LOCK:
+        return compose_billing_document(
+            (file.getvalue() for item in payment_items for file in item.billing_files),
+            layout,
+        )
+
+
+def save_document(doc: fitz.Document) -> bytes:
+    fp = BytesIO()
+    with FITZ_LOCK:
+        doc.ez_save(fp)
+    return fp.getvalue()
+
+
+def generate_billing_pdf(
+    payment_items: list[PaymentItemData], layout: BillingLayout = BillingLayout()
+) -> bytes:
+    return save_document(build_billing_document(payment_items, layout))
+
+
+def open_document(file: NamedFile) -> fitz.Document:
+    if isinstance(file, StoredFile):
+        # PyMuPDF 的 stream 不接受 memoryview，已落盘的文件按路径打开
+        return fitz.Document(file.path)
+    return fitz.Document(stream=file.getvalue())
+
+
+def generate_allinone_pdf(
+    payment_items: list[PaymentItemData],
+    billing_pdf: bytes | fitz.Document,
+    open_invoice: Callable[[NamedFile], fitz.Document] = open_document,
+) -> bytes:
+    """billing_pdf 可以直接传入 build_billing_document 生成的文档，避免序列化再解析；
+    open_invoice 可以返回缓存中已打开的文档。
+    """
+    with FITZ_LOCK:
+        page_width, page_height = fitz.paper_size("A4")
+        allinone_pdf = fitz.Document(width=page_width, height=page_height)
+
+        for item_data in payment_items:
+            for file in item_data.invoice_files:
+                invoice_pdf = open_invoice(file)
+                for pno in item_data.payment_item.printing_pages:
+                    allinone_pdf.insert_pdf(invoice_pdf, from_page=pno, to_page=pno)
+            if allinone_pdf.page_count % 2 == 1:
+                allinone_pdf.new_page(pno=-1, width=page_width, height=page_height)
+
+        if isinstance(billing_pdf, bytes):
+            billing_pdf = fitz.Document(stream=billing_pdf)
+        allinone_pdf.insert_pdf(billing_pdf, rotate=90)
+        return save_document(allinone_pdf)
+
+
+def reimbursement_application_filename(submitter: str, today: arrow.Arrow) -> str:
+    return f"{submitter}-{today.format('YYYYMMDD')}.xlsx"
+
+
+def billing_pdf_filename(today: arrow.Arrow) -> str:
+    return f"信用卡消费截图-{today.format('YYYYMMDD')}.pdf"
+
+
+def allinone_pdf_filename(today: arrow.Arrow) -> str:
+    return f"打印用 AllInOne -{today.format('YYYYMMDD')}.pdf"
@@ -0,0 +1,110 @@
+import hashlib
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from io import BytesIO
+
+import fitz
+from PIL import Image, ImageOps
+
+
+@dataclass(frozen=True)
+class BillingLayout:
+    """信用卡消费截图 PDF 的版式：每页 columns x rows 个格子，图片按打印 DPI 缩小。"""
+
+    paper: str = "A4-L"
+    columns: int = 4
+    rows: int = 1
+    # 左右页边距和格子间距，单位为 pt
+    page_margin: float = 20
+    inner_margin: float = 10
+    dpi: int = 150
+    quality: int = 80
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> "BillingLayout":
+        return cls(
+            paper=config.get("paper", cls.paper),
+            columns=config.get("columns", cls.columns),
+            rows=config.get("rows", cls.rows),
+            page_margin=config.get("page_margin", cls.page_margin),
+            inner_margin=config.get("inner_margin", cls.inner_margin),
+            dpi=config.get("dpi", cls.dpi),
+            quality=config.get("quality", cls.quality),
+        )
+
+    @property
+    def images_per_page(self) -> int:
+        return self.columns * self.rows
+
+    def page_size(self) -> tuple[float, float]:
+        return fitz.paper_size(self.paper)
+
+    def image_rects(self) -> list[fitz.Rect]:
+        page_width, page_height = self.page_size()
+        width = (
+            page_width - 2 * self.page_margin - (self.columns - 1) * self.inner_margin
+        ) / self.columns
+        height = (page_height - (self.rows - 1) * self.inner_margin) / self.rows
+        return [
+            fitz.Rect(
+                self.page_margin + (width + self.inner_margin) * column,
+                (height + self.inner_margin) * row,
+                self.page_margin + (width + self.inner_margin) * column + width,
+                (height + self.inner_margin) * row + height,
+            )
+            for row in range(self.rows)
+            for column in range(self.columns)
+        ]
+
+
+def downsample_image(
+    content: bytes | memoryview, rect: fitz.Rect, layout: BillingLayout
+) -> bytes:
+    """把图片缩小到放进 rect 后按 layout.dpi 打印所需的像素数，并重新编码为 JPEG。
+
+    结果不比原图小时返回原图；insert_image 只接受 bytes，内存映射的原图在这里才复制。
+    """
+    with Image.open(BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image)
+        # insert_image 保持宽高比，图片实际占据的大小由较紧的一边决定
+        scale = min(rect.width / image.width, rect.height / image.height)
+        width = round(image.width * scale / 72 * layout.dpi)
+        height = round(image.height * scale / 72 * layout.dpi)
+        if width < image.width and height < image.height:
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        fp = BytesIO()
+        image.convert("RGB").save(
+            fp, format="JPEG", quality=layout.quality, optimize=True
+        )
+
+    data = fp.getvalue()
+    return data if len(data) < len(content) else bytes(content)
+
+
+def compose_billing_document(
+    contents: Iterable[bytes | memoryview], layout: BillingLayout
+) -> fitz.Document:
+    """逐张处理截图并排版，同一张图片只嵌入一次。
+
+    contents 可以是生成器，任一时刻只有一张解码后的原图在内存中，
+    文档里保存的是缩小后的图片。
+    """
+    page_width, page_height = layout.page_size()
+    image_rects = layout.image_rects()
+
+    doc = fitz.Document()
+    xrefs: dict[str, int] = {}
+    page = None
+    for idx, content in enumerate(contents):
+        slot = idx % layout.images_per_page
+        if page is None or slot == 0:
+            page = doc.new_page(pno=-1, width=page_width, height=page_height)
+        rect = image_rects[slot]
+        digest = hashlib.sha256(content).hexdigest()
+        if digest in xrefs:
+            page.insert_image(rect, xref=xrefs[digest])
+        else:
+            xrefs[digest] = page.insert_image(
+                rect, stream=downsample_image(content, rect, layout)
+            )
+    return doc
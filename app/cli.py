@@ -0,0 +1,230 @@
+"""命令行批量处理：解析目录中的账单 PDF 和信用卡消费截图，生成报销单和 PDF。
+
+    python -m app.cli data/2023-08 -o output/2023-08
+
+每解析完一个文件就向标准输出写一行 JSON，最后写入生成的文件。
+"""
+
+import argparse
+import pathlib
+import sys
+import tomllib
+
+import arrow
+
+from app.artifacts import (
+    APPLICATION_SHEET_NAME,
+    allinone_pdf_filename,
+    billing_pdf_filename,
+    build_billing_document,
+    fingerprint_payment_items,
+    generate_allinone_pdf,
+    generate_reimbursement_application,
+    reimbursement_application_filename,
+    save_document,
+)
+from app.billing_layout import BillingLayout
+from app.common import LocalFile, ParseResult
+from app.ledger import Ledger
+from app.metrics import METRICS
+from app.ocr_cache import OCRCache, sha256_digest
+from app.parse_billing import BillingParser
+from app.parse_invoice import InvoiceParser
+from app.preprocess import PreprocessConfig
+from app.reconcile import ReconcileError, reconcile
+from app.records import emit, result_record
+from app.resilient_ocr import make_ocr_client
+from app.xlsx_template import XlsxTemplate
+
+INVOICE_SUFFIXES = {".pdf"}
+BILLING_SUFFIXES = {".png", ".jpg", ".jpeg"}
+
+
+def emit_result(kind: str, file: LocalFile, result: ParseResult) -> None:
+    emit(result_record(result, type=kind, file=file.name))
+
+
+def file_digest(file: LocalFile) -> str:
+    return sha256_digest(file.getvalue())
+
+
+def collect_files(input_dir: pathlib.Path) -> tuple[list[LocalFile], list[LocalFile]]:
+    invoice_files, billing_files, digests = [], [], set()
+    for path in sorted(input_dir.iterdir()):
+        suffix = path.suffix.lower()
+        if suffix not in INVOICE_SUFFIXES | BILLING_SUFFIXES or not path.is_file():
+            continue
+        file = LocalFile.from_path(path)
+        digest = file_digest(file)
+        if digest in digests:
+            emit({"type": "duplicate", "file": file.name})
+            continue
+        digests.add(digest)
+        (invoice_files if suffix in INVOICE_SUFFIXES else billing_files).append(file)
+    return invoice_files, billing_files
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli",
+        description="批量解析账单和信用卡消费截图并生成报销文件",
+    )
+    parser.add_argument("input_dir", type=pathlib.Path, help="账单 PDF 和截图所在目录")
+    parser.add_argument(
+        "-o", "--output-dir", type=pathlib.Path, default=pathlib.Path("output")
+    )
+    parser.add_argument(
+        "--secrets",
+        type=pathlib.Path,
+        default=pathlib.Path(".streamlit/secrets.toml"),
+        help="与 Streamlit 共用的配置文件",
+    )
+    parser.add_argument("--submitter", help="报销人，默认取配置文件中的值")
+    parser.add_argument("--template", help="报销申请表模板路径，默认取配置文件中的值")
+    parser.add_argument(
+        "--allow-duplicates",
+        action="store_true",
+        help="台账中已报销过的文件也继续生成",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=pathlib.Path,
+        help="结束时把阶段耗时写入该文件，.json 后缀写 JSON，否则写 Prometheus 文本格式",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.secrets, "rb") as f:
+        secrets = tomllib.load(f)
+    metrics_path = args.metrics or secrets.get("metrics", {}).get("path")
+    try:
+        return process(args, secrets)
+    finally:
+        if metrics_path:
+            METRICS.write(metrics_path)
+
+
+def process(args: argparse.Namespace, secrets: dict) -> int:
+    submitter = args.submitter or secrets["reimbursement_application"]["submitter"]
+    template_path = (
+        args.template or secrets["reimbursement_application"]["template_path"]
+    )
+
+    invoice_files, billing_files = collect_files(args.input_dir)
+
+    billing_parser = BillingParser(
+        secrets["aliyun_ocr"]["access_key_id"],
+        secrets["aliyun_ocr"]["access_key_secret"],
+        ocr_cache=OCRCache.from_config(secrets.get("ocr_cache", {})),
+        preprocess_config=PreprocessConfig.from_config(secrets.get("preprocess", {})),
+        ocr_client=make_ocr_client(secrets.get("ocr", {}), secrets["aliyun_ocr"]),
+    )
+    invoice_result, billing_result, failed = [], [], False
+    billing_kw = dict(
+        max_workers=secrets["aliyun_ocr"].get("max_workers", 4),
+        qps=secrets["aliyun_ocr"].get("qps", 5),
+    )
+    tiles_per_request = secrets["aliyun_ocr"].get("tiles_per_request", 1)
+    billing_contents = [file.getvalue() for file in billing_files]
+    billing_results = (
+        enumerate(
+            billing_parser.parse_stitched(
+                billing_contents, tiles_per_request=tiles_per_request, **billing_kw
+            )
+        )
+        if tiles_per_request > 1
+        else billing_parser.iter_many(billing_contents, **billing_kw)
+    )
+    for idx, result in billing_results:
+        emit_result("billing", billing_files[idx], result)
+        if result.error is None:
+            billing_result.append((billing_files[idx], result.info))
+        failed = failed or result.error is not None
+    for idx, result in InvoiceParser().iter_many(
+        [file.getvalue() for file in invoice_files]
+    ):
+        emit_result("invoice", invoice_files[idx], result)
+        if result.error is None:
+            invoice_result.append((invoice_files[idx], result.info))
+        failed = failed or result.error is not None
+    if failed:
+        return 1
+
+    invoice_result.sort(key=lambda x: (x[1].payment_item, x[1].paid))
+    billing_result.sort(key=lambda x: (x[1].payment_item, x[1].usd_amount))
+    try:
+        payment_items = reconcile(invoice_result, billing_result)
+    except ReconcileError as e:
+        emit(
+            {
+                "type": "reconcile_error",
+                "error": str(e),
+                "unmatched_invoices": [file.name for file, _ in e.unmatched_invoices],
+                "unmatched_billings": [file.name for file, _ in e.unmatched_billings],
+            }
+        )
+        return 1
+
+    ledger = Ledger.from_config(secrets.get("ledger", {}))
+    if ledger is not None:
+        check = ledger.check(payment_items, file_digest)
+        for item, record in check.overlaps:
+            emit(
+                {
+                    "type": "ledger_overlap",
+                    "payment_item": item.payment_item,
+                    "period": [item.service_start, item.service_through],
+                    "reimbursed_period": [
+                        record.service_start,
+                        record.service_through,
+                    ],
+                    "submitter": record.submitter,
+                }
+            )
+        for file, record in check.duplicates:
+            emit(
+                {
+                    "type": "ledger_duplicate",
+                    "file": file.name,
+                    "reimbursed_file": record.file_name,
+                    "payment_item": record.payment_item,
+                    "submitter": record.submitter,
+                }
+            )
+        if check.duplicates and not args.allow_duplicates:
+            return 1
+
+    today = arrow.now(tz="Asia/Shanghai")
+    with METRICS.span("cli.application"):
+        template = XlsxTemplate.load(template_path, APPLICATION_SHEET_NAME)
+        application = generate_reimbursement_application(
+            template, submitter, payment_items, today
+        )
+    with METRICS.span("cli.billing_pdf"):
+        billing_document = build_billing_document(
+            payment_items, BillingLayout.from_config(secrets.get("billing_pdf", {}))
+        )
+        billing_pdf = save_document(billing_document)
+    with METRICS.span("cli.allinone_pdf"):
+        allinone_pdf = generate_allinone_pdf(payment_items, billing_document)
+    artifacts = {
+        reimbursement_application_filename(submitter, today): application,
+        billing_pdf_filename(today): billing_pdf,
+        allinone_pdf_filename(today): allinone_pdf,
+    }
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    for filename, data in artifacts.items():
+        path = args.output_dir / filename
+        path.write_bytes(data)
+        emit({"type": "artifact", "file": str(path), "size": len(data)})
+    if ledger is not None:
+        ledger.record(
+            fingerprint_payment_items(payment_items, file_digest),
+            submitter,
+            payment_items,
+            file_digest,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,39 +1,86 @@
+import pathlib
+import threading
+from dataclasses import dataclass
 from enum import StrEnum
+from typing import Generic, Protocol, TypeVar
 
+from app.vendor_rules import VENDOR_RULES, VendorRule
 
-class PaymentItem(StrEnum):
-    JIRA = "jira"
-    MAILGUN = "mailgun"
-    AZURE = "azure"
-    GITHUB = "github"
-    ONEPASSWD = "1password"
+T = TypeVar("T")
+
+# PyMuPDF 不是线程安全的，进程内打开、解析、生成和关闭文档都要持有这把锁；
+# 可重入，生成 PDF 的过程中打开缓存的文档时不会死锁
+FITZ_LOCK = threading.RLock()
+
+
+class _PaymentItem(StrEnum):
+    @property
+    def rule(self) -> VendorRule:
+        return VENDOR_RULES[self.value]
 
     @property
     def name(self):
-        return {
-            self.JIRA: "Jira",
-            self.MAILGUN: "Mailgun",
-            self.AZURE: "Azure",
-            self.GITHUB: "GitHub",
-            self.ONEPASSWD: "1Password",
-        }[self]
+        return self.rule.name
 
     @property
     def description(self):
-        return {
-            self.JIRA: "缺陷跟踪管理系统",
-            self.MAILGUN: "海外邮件发送服务",
-            self.AZURE: "微软 Azure 云服务",
-            self.GITHUB: "GitHub 组织账号",
-            self.ONEPASSWD: "密码管理工具",
-        }[self]
+        return self.rule.description
 
     @property
     def printing_pages(self):
-        return {
-            self.JIRA: (0, 1),
-            self.MAILGUN: (0, 1),
-            self.AZURE: (0, 1),
-            self.GITHUB: (0,),
-            self.ONEPASSWD: (0,),
-        }[self]
+        return self.rule.printing_pages
+
+
+# 账单类型由 vendor_rules.toml 生成，成员如 PaymentItem.GITHUB == "github"
+PaymentItem = _PaymentItem(
+    "PaymentItem",
+    [(rule.member, rule.key) for rule in VENDOR_RULES.values()],
+    module=__name__,
+    qualname="PaymentItem",
+)
+
+
+def read_file_content(
+    filename: bytes | memoryview | str | pathlib.Path,
+) -> bytes | memoryview:
+    if isinstance(filename, (str, pathlib.Path)):
+        with open(filename, "rb") as f:
+            return f.read()
+    elif isinstance(filename, (bytes, memoryview)):
+        # memoryview（如 UploadStore 的内存映射）原样返回，不复制
+        return filename
+    else:
+        raise TypeError(f"Unknown type {type(filename)} for filename")
+
+
+@dataclass
+class ParseResult(Generic[T]):
+    info: T | None
+    error: Exception | None
+    elapsed: float
+
+
+class NamedFile(Protocol):
+    """UploadStore 的 StoredFile 和命令行的 LocalFile 都满足这个协议。
+
+    StoredFile.getvalue() 返回只读的 memoryview，使用方不能假定得到的是 bytes。
+    """
+
+    name: str
+
+    def getvalue(self) -> bytes | memoryview:
+        ...
+
+
+@dataclass
+class LocalFile:
+    name: str
+    content: bytes
+
+    @classmethod
+    def from_path(cls, path: str | pathlib.Path) -> "LocalFile":
+        path = pathlib.Path(path)
+        return cls(name=path.name, content=path.read_bytes())
+
+    def getvalue(self) -> bytes:
+        return self.content
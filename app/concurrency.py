@@ -0,0 +1,21 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """线程安全的限速器，保证相邻两次 `acquire` 返回的间隔不小于 1 / qps 秒。"""
+
+    def __init__(self, qps: float | None) -> None:
+        self.interval = 1 / qps if qps else 0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
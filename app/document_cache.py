@@ -0,0 +1,63 @@
+import pathlib
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+
+import fitz
+
+from app.common import FITZ_LOCK
+
+
+class DocumentCache:
+    """按内容哈希缓存已打开的 fitz.Document，解析和拼接打印 PDF 时共用同一个句柄。
+
+    文档的打开和关闭都持有 FITZ_LOCK，使用文档的调用方同样要持有这把锁。
+    """
+
+    def __init__(self, maxsize: int = 64) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._docs: OrderedDict[str, fitz.Document] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(
+        self, digest: str, get_source: Callable[[], bytes | str | pathlib.Path]
+    ) -> fitz.Document:
+        """get_source 在未命中时才调用，返回文件内容或路径。"""
+        with self._lock:
+            if digest in self._docs:
+                self.hits += 1
+                self._docs.move_to_end(digest)
+                return self._docs[digest]
+            self.misses += 1
+
+        source = get_source()
+        with FITZ_LOCK:
+            if isinstance(source, (str, pathlib.Path)):
+                doc = fitz.Document(source)
+            else:
+                doc = fitz.Document(stream=source)
+
+        with self._lock:
+            doc = self._docs.setdefault(digest, doc)
+            # 被淘汰的文档不主动 close，可能仍有调用方持有，交给垃圾回收
+            while len(self._docs) > self.maxsize:
+                self._docs.popitem(last=False)
+        return doc
+
+    def retain(self, digests: Iterable[str]) -> None:
+        """关闭并移除不在 digests 中的文档（对应的上传文件已删除）。"""
+        digests = set(digests)
+        with self._lock:
+            released = [
+                self._docs.pop(digest)
+                for digest in list(self._docs)
+                if digest not in digests
+            ]
+        with FITZ_LOCK:
+            for doc in released:
+                doc.close()
+
+    def __len__(self) -> int:
+        return len(self._docs)
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections.abc import Hashable, Iterator, Sequence
+from typing import Generic, TypeVar
+
+from app.metrics import METRICS
+
+T = TypeVar("T")
+
+
+class Job(Generic[T]):
+    """在后台线程中消费一个产出 (序号, 结果) 的迭代器，结果按 keys[序号] 保存。
+
+    迭代器在后台线程中执行，不能调用 st.* 或读写 session_state，
+    用到的文件内容、缓存等要在创建迭代器之前准备好。
+    cancel() 之后在下一个结果到达时关闭迭代器：parser 的 iter_many 会取消排队中的任务，
+    正在执行的任务完成后结果被丢弃。
+    """
+
+    def __init__(
+        self, keys: Sequence[Hashable], iterator: Iterator[tuple[int, T]], name: str
+    ) -> None:
+        self.keys = list(keys)
+        self.name = name
+        self.error: BaseException | None = None
+        self._iterator = iterator
+        self._results: dict[Hashable, T] = {}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"job-{name}", daemon=True
+        )
+
+    def start(self) -> "Job[T]":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        start = time.perf_counter()
+        try:
+            for idx, result in self._iterator:
+                if self._cancelled.is_set():
+                    break
+                with self._lock:
+                    self._results[self.keys[idx]] = result
+        except BaseException as e:
+            self.error = e
+        finally:
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                close()
+            METRICS.observe(f"job.{self.name}", time.perf_counter() - start)
+            if self._cancelled.is_set():
+                METRICS.incr(f"job.{self.name}.cancelled")
+            self._done.set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def total(self) -> int:
+        return len(self.keys)
+
+    @property
+    def completed(self) -> int:
+        with self._lock:
+            return len(self._results)
+
+    def results(self) -> dict[Hashable, T]:
+        """已完成的结果，按完成顺序。"""
+        with self._lock:
+            return dict(self._results)
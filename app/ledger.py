@@ -0,0 +1,276 @@
+import pathlib
+import sqlite3
+import time
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass
+from decimal import Decimal
+
+from app.common import NamedFile
+from app.matching import to_cents
+from app.reconcile import PaymentItemData
+from app.sqlite_local import LocalConnection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reimbursement (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL UNIQUE,
+    submitter TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reimbursement_item (
+    id INTEGER PRIMARY KEY,
+    reimbursement_id INTEGER NOT NULL REFERENCES reimbursement (id),
+    payment_item TEXT NOT NULL,
+    usd_cents INTEGER NOT NULL,
+    rmb_cents INTEGER NOT NULL,
+    service_start TEXT NOT NULL,
+    service_through TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reimbursement_period (
+    item_id INTEGER NOT NULL REFERENCES reimbursement_item (id),
+    payment_item TEXT NOT NULL,
+    service_start TEXT NOT NULL,
+    service_through TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_reimbursement_period
+    ON reimbursement_period (payment_item, service_through);
+CREATE TABLE IF NOT EXISTS reimbursement_file (
+    item_id INTEGER NOT NULL REFERENCES reimbursement_item (id),
+    digest TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_reimbursement_file_digest
+    ON reimbursement_file (digest);
+"""
+
+# SQLite 单条语句的参数个数有上限，IN 查询分批进行
+QUERY_BATCH = 500
+
+
+def service_periods(item: PaymentItemData) -> list[tuple[str, str]]:
+    """每张账单各自的服务周期，没有逐张记录时使用整个报销项的周期。"""
+    return item.service_periods or [(item.service_start, item.service_through)]
+
+
+@dataclass
+class LedgerRecord:
+    reimbursement_id: int
+    submitter: str
+    created_at: float
+    payment_item: str
+    usd_amount: Decimal
+    service_start: str
+    service_through: str
+    # 重复文件查询时为命中的文件名，重叠周期查询时为 None
+    file_name: str | None = None
+
+
+@dataclass
+class LedgerCheck:
+    duplicates: list[tuple[NamedFile, LedgerRecord]]
+    overlaps: list[tuple[PaymentItemData, LedgerRecord]]
+
+
+class Ledger:
+    """已生成报销单的本地台账，保存在 SQLite 中。
+
+    记录每次报销的文件哈希、账单类型、金额和服务周期，
+    用于发现重复提交的文件和服务周期重叠的账单。
+    服务周期按账单逐张记录，同一次报销中不相邻的几个周期之间的空档不算已报销。
+    文件哈希和 (payment_item, service_through) 都建有索引，多年的记录也能毫秒级查询。
+    """
+
+    def __init__(self, path: str | pathlib.Path) -> None:
+        self.path = pathlib.Path(path)
+        self._db = LocalConnection(self.path, SCHEMA)
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> "Ledger | None":
+        if not config.get("enabled", True):
+            return None
+        return cls(path=config.get("path", "data/ledger.sqlite3"))
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    def record(
+        self,
+        fingerprint: str,
+        submitter: str,
+        payment_items: list[PaymentItemData],
+        file_digest: Callable[[NamedFile], str],
+        now: float | None = None,
+    ) -> int:
+        """记录一次报销，返回记录 id；相同 fingerprint 只记录一次。"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM reimbursement WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return row[0]
+
+            reimbursement_id = conn.execute(
+                "INSERT INTO reimbursement (fingerprint, submitter, created_at) "
+                "VALUES (?, ?, ?)",
+                (fingerprint, submitter, time.time() if now is None else now),
+            ).lastrowid
+            for item in payment_items:
+                item_id = conn.execute(
+                    "INSERT INTO reimbursement_item (reimbursement_id, payment_item, "
+                    "usd_cents, rmb_cents, service_start, service_through) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        reimbursement_id,
+                        str(item.payment_item),
+                        to_cents(item.usd_amount),
+                        to_cents(item.rmb_amount),
+                        item.service_start,
+                        item.service_through,
+                    ),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO reimbursement_period (item_id, payment_item, "
+                    "service_start, service_through) VALUES (?, ?, ?, ?)",
+                    [
+                        (item_id, str(item.payment_item), start, through)
+                        for start, through in service_periods(item)
+                    ],
+                )
+                conn.executemany(
+                    "INSERT INTO reimbursement_file (item_id, digest, kind, name) "
+                    "VALUES (?, ?, ?, ?)",
+                    [
+                        (item_id, file_digest(file), kind, file.name)
+                        for kind, files in (
+                            ("invoice", item.invoice_files),
+                            ("billing", item.billing_files),
+                        )
+                        for file in files
+                    ],
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return reimbursement_id
+
+    def find_files(
+        self, digests: Iterable[str], exclude: Iterable[int] = ()
+    ) -> dict[str, LedgerRecord]:
+        """返回已报销过的文件哈希及其最早的记录，exclude 中的报销记录不算。"""
+        conn = self._connect()
+        digests, exclude = list(dict.fromkeys(digests)), set(exclude)
+        found: dict[str, LedgerRecord] = {}
+        for start in range(0, len(digests), QUERY_BATCH):
+            batch = digests[start : start + QUERY_BATCH]
+            rows = conn.execute(
+                "SELECT f.digest, f.name, r.id, r.submitter, r.created_at, "
+                "i.payment_item, i.usd_cents, i.service_start, i.service_through "
+                "FROM reimbursement_file f "
+                "JOIN reimbursement_item i ON i.id = f.item_id "
+                "JOIN reimbursement r ON r.id = i.reimbursement_id "
+                f"WHERE f.digest IN ({', '.join('?' * len(batch))}) "
+                "ORDER BY r.created_at",
+                batch,
+            )
+            for digest, name, *record in rows:
+                if digest not in found and record[0] not in exclude:
+                    found[digest] = self._record(*record, file_name=name)
+        return found
+
+    def find_overlaps(
+        self,
+        payment_item: str,
+        service_start: str,
+        service_through: str,
+        exclude: Iterable[int] = (),
+    ) -> list[LedgerRecord]:
+        """返回同一账单类型中服务周期与 [service_start, service_through] 重叠的记录，
+        记录中的服务周期是重叠的那张账单的周期。
+
+        日期格式为 YYYY.MM.DD，可以直接按字符串比较。按月续费的账单首尾相接，
+        上一期的结束日就是下一期的开始日，只共用端点不算重叠；完全相同的周期仍算重叠。
+        """
+        exclude = set(exclude)
+        rows = self._connect().execute(
+            "SELECT r.id, r.submitter, r.created_at, "
+            "i.payment_item, i.usd_cents, p.service_start, p.service_through "
+            "FROM reimbursement_period p "
+            "JOIN reimbursement_item i ON i.id = p.item_id "
+            "JOIN reimbursement r ON r.id = i.reimbursement_id "
+            "WHERE p.payment_item = ? AND ("
+            "(p.service_through > ? AND p.service_start < ?) "
+            "OR (p.service_start = ? AND p.service_through = ?)) "
+            "ORDER BY p.service_start",
+            (
+                payment_item,
+                service_start,
+                service_through,
+                service_start,
+                service_through,
+            ),
+        )
+        return [self._record(*row) for row in rows if row[0] not in exclude]
+
+    def check(
+        self,
+        payment_items: list[PaymentItemData],
+        file_digest: Callable[[NamedFile], str],
+        exclude: Iterable[int] = (),
+    ) -> LedgerCheck:
+        exclude = set(exclude)
+        files = {
+            file_digest(file): file
+            for item in payment_items
+            for file in item.invoice_files + item.billing_files
+        }
+        duplicates = [
+            (files[digest], record)
+            for digest, record in self.find_files(files, exclude).items()
+        ]
+        overlaps = []
+        for item in payment_items:
+            records = {}
+            for start, through in service_periods(item):
+                for record in self.find_overlaps(
+                    str(item.payment_item), start, through, exclude
+                ):
+                    key = (
+                        record.reimbursement_id,
+                        record.service_start,
+                        record.service_through,
+                    )
+                    records.setdefault(key, record)
+            overlaps += [(item, record) for record in records.values()]
+        return LedgerCheck(duplicates=duplicates, overlaps=overlaps)
+
+    @staticmethod
+    def _record(
+        reimbursement_id: int,
+        submitter: str,
+        created_at: float,
+        payment_item: str,
+        usd_cents: int,
+        service_start: str,
+        service_through: str,
+        file_name: str | None = None,
+    ) -> LedgerRecord:
+        return LedgerRecord(
+            reimbursement_id=reimbursement_id,
+            submitter=submitter,
+            created_at=created_at,
+            payment_item=payment_item,
+            usd_amount=Decimal(usd_cents).scaleb(-2),
+            service_start=service_start,
+            service_through=service_through,
+            file_name=file_name,
+        )
+
+    def __len__(self) -> int:
+        return (
+            self._connect().execute("SELECT COUNT(*) FROM reimbursement").fetchone()[0]
+        )
@@ -0,0 +1,326 @@
+"""从邮箱导出（mbox 文件或 Maildir 目录）中批量提取并解析账单 PDF。
+
+    python -m app.mail_ingest billing-2023.mbox -o data/mail-invoices
+
+逐封读取邮件，不把整个归档载入内存；附件按 SHA-256 去重，已经入库的附件直接跳过。
+新附件保存到输出目录，解析结果写入目录下的 index.sqlite3，按账单类型和服务周期建索引，
+之后可以按账单类型取出 (文件, 解析结果) 直接用于校验。
+每处理一个附件就向标准输出写一行 JSON。
+"""
+
+import argparse
+import email.policy
+import mailbox
+import multiprocessing
+import os
+import pathlib
+import re
+import sqlite3
+import sys
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from decimal import Decimal
+from email.message import EmailMessage
+from email.parser import BytesFeedParser, BytesParser
+
+from app.common import LocalFile, ParseResult, PaymentItem
+from app.matching import to_cents
+from app.metrics import METRICS
+from app.ocr_cache import sha256_digest
+from app.parse_invoice import InvoiceInfo, observe_parse_elapsed, parse_invoice_timed
+from app.records import emit, result_record
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoice (
+    digest TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    message_id TEXT,
+    subject TEXT,
+    received TEXT,
+    payment_item TEXT,
+    paid_cents INTEGER,
+    service_start TEXT,
+    service_through TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_invoice_period
+    ON invoice (payment_item, service_through);
+"""
+
+INDEX_NAME = "index.sqlite3"
+READ_SIZE = 1024 * 1024
+# mbox 中每封邮件以 "From " 开头的一行分隔，正文中的同样行会被转义为 ">From "
+FROM_LINE_REGEX = re.compile(rb"^From .*\n", re.MULTILINE)
+
+
+def iter_mbox(path: str | pathlib.Path) -> Iterator[EmailMessage]:
+    """按块读取 mbox 文件，每读完一封邮件就产出，内存中只保留当前这一封。
+
+    mailbox.mbox 会先扫描整个文件建立目录，几 GB 的归档不适合；
+    逐行读取再逐行交给解析器也很慢，这里按块查找分隔行，整块交给解析器。
+    """
+    parser, tail = None, b""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_SIZE)
+            data = tail + block
+            # 块末尾不完整的一行留到下一块，分隔行不会被截断
+            cut = data.rfind(b"\n") + 1 if block else len(data)
+            data, tail = data[:cut], data[cut:]
+
+            pos = 0
+            for match in FROM_LINE_REGEX.finditer(data):
+                if parser is not None:
+                    parser.feed(data[pos : match.start()])
+                    yield parser.close()
+                parser = BytesFeedParser(policy=email.policy.default)
+                pos = match.end()
+            if parser is not None:
+                parser.feed(data[pos:])
+            if not block:
+                break
+    if parser is not None:
+        yield parser.close()
+
+
+def iter_maildir(path: str | pathlib.Path) -> Iterator[EmailMessage]:
+    maildir = mailbox.Maildir(path, factory=None, create=False)
+    parser = BytesParser(policy=email.policy.default)
+    for key in maildir.iterkeys():
+        with maildir.get_file(key) as f:
+            yield parser.parse(f)
+
+
+def iter_messages(path: str | pathlib.Path) -> Iterator[EmailMessage]:
+    path = pathlib.Path(path)
+    return iter_maildir(path) if path.is_dir() else iter_mbox(path)
+
+
+def iter_pdf_attachments(message: EmailMessage) -> Iterator[tuple[str, bytes]]:
+    """产出邮件中所有 PDF 附件的 (文件名, 内容)，包括嵌套在转发邮件里的附件。"""
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        filename = part.get_filename() or ""
+        if part.get_content_type() == "application/pdf" or (
+            filename.lower().endswith(".pdf")
+        ):
+            content = part.get_payload(decode=True)
+            if content:
+                yield filename or "attachment.pdf", content
+
+
+@dataclass
+class MailAttachment:
+    digest: str
+    name: str
+    content: bytes
+    message_id: str | None
+    subject: str | None
+    received: str | None
+
+
+class InvoiceIndex:
+    """已入库的邮件附件：文件保存在 directory 中，解析结果保存在 index.sqlite3 中。"""
+
+    def __init__(self, directory: str | pathlib.Path) -> None:
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.directory / INDEX_NAME, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def digests(self) -> set[str]:
+        return {row[0] for row in self.conn.execute("SELECT digest FROM invoice")}
+
+    def add(self, attachment: MailAttachment, result: ParseResult[InvoiceInfo]) -> str:
+        """保存附件和解析结果，返回保存的文件名；解析失败的附件同样保存，避免重复解析。"""
+        stem = re.sub(r"[^\w.-]+", "_", pathlib.Path(attachment.name).stem)
+        file_name = f"{attachment.digest[:12]}-{stem}.pdf"
+        (self.directory / file_name).write_bytes(attachment.content)
+
+        info = result.info
+        self.conn.execute(
+            "INSERT OR IGNORE INTO invoice (digest, file_name, message_id, subject, "
+            "received, payment_item, paid_cents, service_start, service_through, "
+            "error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                attachment.digest,
+                file_name,
+                attachment.message_id,
+                attachment.subject,
+                attachment.received,
+                None if info is None else str(info.payment_item),
+                None if info is None else to_cents(info.paid),
+                None if info is None else info.service_start,
+                None if info is None else info.service_through,
+                None if result.error is None else str(result.error),
+            ),
+        )
+        return file_name
+
+    def invoices(
+        self,
+        payment_item: PaymentItem | None = None,
+        since: str | None = None,
+    ) -> list[tuple[LocalFile, InvoiceInfo]]:
+        """按账单类型和服务截止日期（YYYY.MM.DD，含当天）取出解析成功的账单，可直接用于校验。"""
+        sql = (
+            "SELECT file_name, payment_item, paid_cents, service_start, "
+            "service_through FROM invoice WHERE payment_item IS NOT NULL"
+        )
+        params = []
+        if payment_item is not None:
+            sql += " AND payment_item = ?"
+            params.append(str(payment_item))
+        if since is not None:
+            sql += " AND service_through >= ?"
+            params.append(since)
+        sql += " ORDER BY payment_item, service_through"
+        return [
+            (
+                LocalFile.from_path(self.directory / file_name),
+                InvoiceInfo(
+                    payment_item=PaymentItem(item),
+                    paid=Decimal(paid_cents).scaleb(-2),
+                    service_start=service_start,
+                    service_through=service_through,
+                ),
+            )
+            for file_name, item, paid_cents, service_start, service_through in (
+                self.conn.execute(sql, params)
+            )
+        ]
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM invoice").fetchone()[0]
+
+
+def iter_new_attachments(
+    paths: Iterable[str | pathlib.Path], known: set[str]
+) -> Iterator[MailAttachment]:
+    """逐封读取邮件，产出内容哈希不在 known 中的 PDF 附件，产出的哈希随即加入 known。"""
+    for path in paths:
+        for message in iter_messages(path):
+            METRICS.incr("mail_ingest.messages")
+            for name, content in iter_pdf_attachments(message):
+                METRICS.incr("mail_ingest.attachments")
+                digest = sha256_digest(content)
+                if digest in known:
+                    METRICS.incr("mail_ingest.duplicates")
+                    continue
+                known.add(digest)
+                yield MailAttachment(
+                    digest=digest,
+                    name=name,
+                    content=content,
+                    message_id=message.get("Message-ID"),
+                    subject=message.get("Subject"),
+                    received=message.get("Date"),
+                )
+
+
+def parse_attachments(
+    attachments: Iterable[MailAttachment],
+    max_workers: int | None = None,
+    max_pending: int | None = None,
+) -> Iterator[tuple[MailAttachment, ParseResult[InvoiceInfo]]]:
+    """按完成顺序产出附件及其解析结果。
+
+    进程池在整个导入过程中只启动一次，同时在途的附件不超过 max_pending 个，
+    读取邮件和解析 PDF 并行进行，内存占用与归档大小无关。
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers <= 1:
+        for attachment in attachments:
+            yield attachment, parse_invoice_timed(attachment.content)
+        return
+
+    max_pending = max_pending or max_workers * 4
+    # 主进程持有索引库的 SQLite 连接，fork 出的子进程会继承它，使用 spawn 启动子进程
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        pending: dict[Future, MailAttachment] = {}
+
+        def drain(return_when: str) -> Iterator[tuple[MailAttachment, ParseResult]]:
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                result = future.result()
+                observe_parse_elapsed(result)
+                yield pending.pop(future), result
+
+        try:
+            for attachment in attachments:
+                if len(pending) >= max_pending:
+                    yield from drain(FIRST_COMPLETED)
+                pending[
+                    executor.submit(parse_invoice_timed, attachment.content)
+                ] = attachment
+            while pending:
+                yield from drain(FIRST_COMPLETED)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+
+def ingest(
+    paths: Iterable[str | pathlib.Path],
+    index: InvoiceIndex,
+    max_workers: int | None = None,
+) -> Iterator[tuple[MailAttachment, ParseResult[InvoiceInfo], str]]:
+    """把邮件归档中新的 PDF 附件解析入库，逐个产出 (附件, 解析结果, 保存的文件名)。"""
+    attachments = iter_new_attachments(paths, index.digests())
+    for attachment, result in parse_attachments(attachments, max_workers):
+        METRICS.incr(
+            "mail_ingest.parsed" if result.error is None else "mail_ingest.failed"
+        )
+        yield attachment, result, index.add(attachment, result)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.mail_ingest",
+        description="从 mbox 文件或 Maildir 目录中提取并解析账单 PDF",
+    )
+    parser.add_argument(
+        "paths", type=pathlib.Path, nargs="+", help="mbox 文件或 Maildir 目录"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=pathlib.Path,
+        default=pathlib.Path("data/mail-invoices"),
+        help="保存附件和索引的目录",
+    )
+    parser.add_argument("--max-workers", type=int, help="解析 PDF 的进程数")
+    args = parser.parse_args(argv)
+
+    index = InvoiceIndex(args.output_dir)
+    for attachment, result, file_name in ingest(args.paths, index, args.max_workers):
+        emit(
+            result_record(
+                result,
+                type="invoice",
+                file=file_name,
+                attachment=attachment.name,
+                subject=attachment.subject,
+            )
+        )
+    snapshot = METRICS.snapshot()["counters"]
+    emit(
+        {
+            "type": "summary",
+            **{
+                key: snapshot.get(f"mail_ingest.{key}", 0)
+                for key in ("messages", "attachments", "duplicates", "parsed", "failed")
+            },
+            "indexed": len(index),
+        }
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
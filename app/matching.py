@@ -0,0 +1,323 @@
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+
+def to_cents(amount: Decimal) -> int:
+    """精确转换为整数分，不足一分的金额视为错误而不是四舍五入。"""
+    cents = amount.scaleb(2)
+    if cents != cents.to_integral_value():
+        raise ValueError(f"Amount {amount} has fractions of a cent")
+    return int(cents)
+
+
+def find_subset(
+    target: int, values: Sequence[int], candidates: Sequence[int]
+) -> list[int] | None:
+    """在 candidates（values 的下标）中找一组和恰为 target 的元素，找不到返回 None。
+
+    用整数做位集的子集和动态规划：第 i 步的位集记录前 i 个候选能凑出的所有金额，
+    每步一次移位和按位或，耗时约为 候选数 × target / 64 次字运算。
+    """
+    candidates = [idx for idx in candidates if 0 < values[idx] <= target]
+    mask = (1 << (target + 1)) - 1
+    steps = [1]
+    for idx in candidates:
+        reachable = steps[-1]
+        steps.append((reachable | (reachable << values[idx])) & mask)
+        if steps[-1] >> target & 1:
+            break
+    if not steps[-1] >> target & 1:
+        return None
+
+    # 从后往前回溯：去掉第 pos 个候选后仍能凑出余额就不选它
+    subset, remain = [], target
+    for pos in range(len(steps) - 1, 0, -1):
+        if not steps[pos - 1] >> remain & 1:
+            idx = candidates[pos - 1]
+            subset.append(idx)
+            remain -= values[idx]
+    return subset[::-1]
+
+
+def iter_subsets(
+    target: int, values: Sequence[int], candidates: Sequence[int]
+) -> Iterator[list[int]]:
+    """逐个列出 candidates 中和恰为 target 的组合，target 须大于 0。
+
+    先用位集动态规划求出每个后缀能凑出的金额，回溯时只进入还能凑出余额的分支；
+    候选按金额从大到小排列，含大额元素的组合先列出。
+    金额相同的元素按先后取用，同一组金额只列出一次。
+    """
+    candidates = sorted(
+        (idx for idx in candidates if 0 < values[idx] <= target),
+        key=lambda idx: -values[idx],
+    )
+    mask = (1 << (target + 1)) - 1
+    # reach[k] 记录 candidates[k:] 能凑出的所有金额
+    reach = [1] * (len(candidates) + 1)
+    for k in range(len(candidates) - 1, -1, -1):
+        reach[k] = (reach[k + 1] | (reach[k + 1] << values[candidates[k]])) & mask
+    # skip[k] 是 k 之后第一个金额不同的位置，不选 candidates[k] 时同额的也都不选
+    skip = [len(candidates)] * (len(candidates) + 1)
+    for k in range(len(candidates) - 2, -1, -1):
+        same = values[candidates[k]] == values[candidates[k + 1]]
+        skip[k] = skip[k + 1] if same else k + 1
+
+    stack: list[tuple[int, int, tuple[int, ...]]] = [(0, target, ())]
+    while stack:
+        k, remain, chosen = stack.pop()
+        if remain == 0:
+            yield list(chosen)
+            continue
+        if not reach[k] >> remain & 1:
+            continue
+        value = values[candidates[k]]
+        stack.append((skip[k], remain, chosen))
+        if value <= remain:
+            stack.append((k + 1, remain - value, (*chosen, candidates[k])))
+
+
+def find_pair(
+    target: int, values: Sequence[int], candidates: Sequence[int]
+) -> list[int] | None:
+    """在 candidates 中找两个和恰为 target 的元素，找不到返回 None。"""
+    seen: dict[int, int] = {}
+    for idx in candidates:
+        if target - values[idx] in seen:
+            return [seen[target - values[idx]], idx]
+        seen.setdefault(values[idx], idx)
+    return None
+
+
+def find_triple(
+    target: int, values: Sequence[int], candidates: Sequence[int]
+) -> list[int] | None:
+    """在 candidates 中找三个和恰为 target 的元素，找不到返回 None。"""
+    candidates = list(candidates)
+    for pos, idx in enumerate(candidates):
+        pair = find_pair(target - values[idx], values, candidates[pos + 1 :])
+        if pair is not None:
+            return [idx, *pair]
+    return None
+
+
+# 精确搜索最多访问的状态数，和机器快慢无关，同样的输入总是得到同样的结果
+MAX_SEARCH_STEPS = 200
+
+
+@dataclass
+class Matching:
+    # 每组为 (账单下标列表, 消费下标列表)，除精确搜索没有结论时合并剩余条目的一组外，
+    # 至少有一边只有一个元素
+    groups: list[tuple[list[int], list[int]]] = field(default_factory=list)
+    unmatched_invoices: list[int] = field(default_factory=list)
+    unmatched_charges: list[int] = field(default_factory=list)
+
+
+class SearchLimitExceeded(Exception):
+    """精确搜索的步数超过上限，没有得出能否全部配对的结论。"""
+
+
+def _reachable(values: Sequence[int], limit: int) -> int:
+    """values 的子集能凑出的不超过 limit 的金额，以位集表示。"""
+    mask = (1 << (limit + 1)) - 1
+    reach = 1
+    for value in values:
+        reach = (reach | (reach << value)) & mask
+    return reach
+
+
+def _placeable(side: Sequence[int], other: Sequence[int]) -> bool:
+    """side 中每个金额是否都还有可能成组。
+
+    或者是 other 中某个子集的和，或者和 side 中的其他金额一起凑成 other 中更大的某个金额。
+    只是必要条件，用来尽早剪掉注定失败的分支。
+    """
+    if not side:
+        return True
+    reach_other = _reachable(other, max(side))
+    reach_side = _reachable(side, max(other, default=0))
+    larger = sorted(set(other), reverse=True)
+    for value in set(side):
+        if reach_other >> value & 1:
+            continue
+        if not any(
+            reach_side >> (total - value) & 1 for total in larger if total > value
+        ):
+            return False
+    return True
+
+
+def find_assignment(
+    invoices: Sequence[int],
+    charges: Sequence[int],
+    invoice_idxes: Sequence[int],
+    charge_idxes: Sequence[int],
+    guess: Sequence[tuple[list[int], list[int]]] = (),
+    max_steps: int = MAX_SEARCH_STEPS,
+) -> list[tuple[list[int], list[int]]] | None:
+    """把给定的账单和消费全部分成和相等的组，每组至少有一边只有一个元素；
+    不存在这样的分组时返回 None。
+
+    金额最大的条目只能是所在组中单独的一边，所以每次取剩下金额最大的条目，
+    逐个尝试另一边和恰好相等的组合并回溯；guess 中该条目所在的组（如贪心的结果）
+    最先尝试。剩下有条目已无法成组或剩余金额相同的状态已经失败过时立即回溯。
+    条目多、金额小时能凑出的巧合组合数是指数级的，
+    搜索的状态数超过 max_steps 时抛出 SearchLimitExceeded。
+    """
+    failed: set[tuple[tuple[int, ...], tuple[int, ...]]] = set()
+    steps = 0
+    invoice_guess = {group[0][0]: group[1] for group in guess if len(group[0]) == 1}
+    charge_guess = {group[1][0]: group[0] for group in guess if len(group[1]) == 1}
+
+    def with_guess(
+        subset: list[int] | None, available: list[int], subsets: Iterator[list[int]]
+    ) -> Iterator[list[int]]:
+        if subset is not None and set(subset) <= set(available):
+            yield subset
+        yield from subsets
+
+    def search(
+        invoice_idxes: list[int], charge_idxes: list[int]
+    ) -> list[tuple[list[int], list[int]]] | None:
+        nonlocal steps
+        steps += 1
+        if steps > max_steps:
+            raise SearchLimitExceeded
+        key = (
+            tuple(sorted(invoices[idx] for idx in invoice_idxes)),
+            tuple(sorted(charges[idx] for idx in charge_idxes)),
+        )
+        if key in failed:
+            return None
+        if not (_placeable(key[0], key[1]) and _placeable(key[1], key[0])):
+            failed.add(key)
+            return None
+        largest_invoice = max(key[0], default=0)
+        largest_charge = max(key[1], default=0)
+        if largest_invoice == largest_charge == 0:
+            # 金额为 0 的条目各自成组
+            return [([idx], []) for idx in invoice_idxes] + [
+                ([], [idx]) for idx in charge_idxes
+            ]
+
+        if largest_invoice >= largest_charge:
+            idx = max(invoice_idxes, key=lambda idx: invoices[idx])
+            for subset in with_guess(
+                invoice_guess.get(idx),
+                charge_idxes,
+                iter_subsets(invoices[idx], charges, charge_idxes),
+            ):
+                used = set(subset)
+                rest = search(
+                    [i for i in invoice_idxes if i != idx],
+                    [i for i in charge_idxes if i not in used],
+                )
+                if rest is not None:
+                    return [([idx], subset), *rest]
+        else:
+            idx = max(charge_idxes, key=lambda idx: charges[idx])
+            for subset in with_guess(
+                charge_guess.get(idx),
+                invoice_idxes,
+                iter_subsets(charges[idx], invoices, invoice_idxes),
+            ):
+                used = set(subset)
+                rest = search(
+                    [i for i in invoice_idxes if i not in used],
+                    [i for i in charge_idxes if i != idx],
+                )
+                if rest is not None:
+                    return [(subset, [idx]), *rest]
+        failed.add(key)
+        return None
+
+    if sum(invoices[idx] for idx in invoice_idxes) != sum(
+        charges[idx] for idx in charge_idxes
+    ):
+        return None
+    return search(list(invoice_idxes), list(charge_idxes))
+
+
+def match_amounts(invoices: Sequence[int], charges: Sequence[int]) -> Matching:
+    """把账单金额和消费金额（单位为分）分组配对。
+
+    先把金额相等的账单和消费一对一配对。之后依次尝试两个、三个、任意多个一组：
+    余下的账单从大到小，在余下的消费中找和恰好相等的一组（一张账单分多次扣款）；
+    余下的消费从大到小，在余下的账单中找和恰好相等的一组（一次扣款合并多张账单）。
+
+    条目多时任意多个一组很容易凑出巧合的组合，所以先用完小的组合再做子集和。
+    每一步都是贪心的，先选中的组合可能占用了别的账单需要的消费（如 12=5+7 之后
+    8、8 无法由 3、1、3、9 凑出，而 5+3、1+7、3+9 可以全部配对）。贪心剩下条目时
+    用 find_assignment 精确搜索：先只搜索剩下的条目，不行再放弃贪心的分组搜索全部条目
+    （金额相等的一对一配对也可能占用了别的组合需要的条目，如 1+2=3、6=2+4）；
+    确定无法全部配对时报告贪心剩下的未匹配项；搜索步数超过上限而没有结论时，
+    若剩下条目的总和相等，保留贪心的分组并把剩下的条目合并为一组，不视为不匹配。
+    """
+    matching = Matching()
+
+    by_amount: dict[int, list[int]] = defaultdict(list)
+    for idx, amount in enumerate(charges):
+        by_amount[amount].append(idx)
+    remaining_invoices = []
+    for idx, amount in enumerate(invoices):
+        if by_amount[amount]:
+            matching.groups.append(([idx], [by_amount[amount].pop(0)]))
+        else:
+            remaining_invoices.append(idx)
+    remaining_charges = sorted(idx for indexes in by_amount.values() for idx in indexes)
+
+    for find in (find_pair, find_triple, find_subset):
+        for idx in sorted(remaining_invoices, key=lambda idx: -invoices[idx]):
+            subset = find(invoices[idx], charges, remaining_charges)
+            # 金额为 0 的账单得到空组合，不需要对应的消费
+            if subset is not None:
+                matching.groups.append(([idx], subset))
+                remaining_invoices.remove(idx)
+                used = set(subset)
+                remaining_charges = [i for i in remaining_charges if i not in used]
+
+        for idx in sorted(remaining_charges, key=lambda idx: -charges[idx]):
+            subset = find(charges[idx], invoices, remaining_invoices)
+            if subset is not None:
+                matching.groups.append((subset, [idx]))
+                remaining_charges.remove(idx)
+                used = set(subset)
+                remaining_invoices = [i for i in remaining_invoices if i not in used]
+
+    if remaining_invoices or remaining_charges:
+        try:
+            groups = find_assignment(
+                invoices, charges, remaining_invoices, remaining_charges
+            )
+        except SearchLimitExceeded:
+            groups = None
+        if groups is not None:
+            matching.groups += groups
+            return matching
+        try:
+            groups = find_assignment(
+                invoices,
+                charges,
+                range(len(invoices)),
+                range(len(charges)),
+                guess=matching.groups,
+            )
+        except SearchLimitExceeded:
+            # 没有得出结论：总和相等时保留贪心的分组，剩下的条目合并为一组
+            if sum(invoices[idx] for idx in remaining_invoices) == sum(
+                charges[idx] for idx in remaining_charges
+            ):
+                matching.groups.append(
+                    (sorted(remaining_invoices), sorted(remaining_charges))
+                )
+                return matching
+            groups = None
+        if groups is not None:
+            return Matching(groups=groups)
+
+    matching.unmatched_invoices = sorted(remaining_invoices)
+    matching.unmatched_charges = sorted(remaining_charges)
+    return matching
@@ -0,0 +1,205 @@
+import json
+import math
+import pathlib
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager
+from functools import wraps
+from typing import ParamSpec, TypeVar
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+PROMETHEUS_PREFIX = "reimbursement"
+QUANTILES = (0.5, 0.95)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """最近秩法求分位数，values 为空时返回 0。"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+
+def prometheus_name(name: str) -> str:
+    return f"{PROMETHEUS_PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+
+class Metrics:
+    """进程内的阶段耗时和计数器。
+
+    每个阶段保留最近 window 次耗时用于计算 p50/p95，次数和总耗时一直累加。
+    collectors 在导出时调用，用于汇总各个缓存自己维护的命中计数；
+    gauges 同样在导出时调用，取的是当前值（如进行中的请求数），可增可减。
+    """
+
+    def __init__(self, window: int = 1000) -> None:
+        self.window = window
+        self._durations: dict[str, deque[float]] = {}
+        self._counts: dict[str, int] = {}
+        self._sums: dict[str, float] = {}
+        self._counters: dict[str, float] = {}
+        self._collectors: dict[str, Callable[[], Mapping[str, float]]] = {}
+        self._gauges: dict[str, Callable[[], Mapping[str, float]]] = {}
+        self._written_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            if stage not in self._durations:
+                self._durations[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+                self._sums[stage] = 0.0
+            self._durations[stage].append(seconds)
+            self._counts[stage] += 1
+            self._sums[stage] += seconds
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+        def decorator(func: Callable[P, R]) -> Callable[P, R]:
+            @wraps(func)
+            def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                with self.span(stage):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register_collector(
+        self, name: str, collect: Callable[[], Mapping[str, float]]
+    ) -> None:
+        """同名 collector 会被替换，Streamlit 每次 rerun 重新注册不会重复计数。"""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def register_gauges(
+        self, name: str, collect: Callable[[], Mapping[str, float]]
+    ) -> None:
+        """与 register_collector 相同，但 collect 返回的是当前值而不是累计值。"""
+        with self._lock:
+            self._gauges[name] = collect
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": self._counts[stage],
+                    "sum": self._sums[stage],
+                    "max": max(durations),
+                    **{
+                        f"p{round(q * 100)}": percentile(list(durations), q)
+                        for q in QUANTILES
+                    },
+                }
+                for stage, durations in self._durations.items()
+            }
+            counters = dict(self._counters)
+            collectors = dict(self._collectors)
+            gauge_collectors = dict(self._gauges)
+        for name, collect in collectors.items():
+            for key, value in collect().items():
+                counters[f"{name}.{key}"] = value
+        gauges = {
+            f"{name}.{key}": value
+            for name, collect in gauge_collectors.items()
+            for key, value in collect().items()
+        }
+        return {"stages": stages, "counters": counters, "gauges": gauges}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        stage_metric = f"{PROMETHEUS_PREFIX}_stage_seconds"
+        lines = [
+            f"# HELP {stage_metric} Duration of each processing stage.",
+            f"# TYPE {stage_metric} summary",
+        ]
+        for stage, data in snapshot["stages"].items():
+            label = f'stage="{stage}"'
+            for q in QUANTILES:
+                lines.append(
+                    f'{stage_metric}{{{label},quantile="{q}"}} '
+                    f'{data[f"p{round(q * 100)}"]}'
+                )
+            lines.append(f"{stage_metric}_sum{{{label}}} {data['sum']}")
+            lines.append(f"{stage_metric}_count{{{label}}} {data['count']}")
+        # 计数器按 Prometheus 的约定加 _total 后缀
+        for name, value in snapshot["counters"].items():
+            metric = f"{prometheus_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, value in snapshot["gauges"].items():
+            metric = prometheus_name(name)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str | pathlib.Path) -> None:
+        """按后缀选择格式：.json 写 JSON，其余写 Prometheus 文本格式。
+
+        先写临时文件再替换，node_exporter 的 textfile collector 不会读到半个文件；
+        临时文件名各不相同，多个 session 同时写入同一个文件时互不干扰。
+        """
+        path = pathlib.Path(path)
+        text = self.to_json() if path.suffix == ".json" else self.to_prometheus()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w",
+            encoding="utf-8",
+            dir=path.parent,
+            prefix=f".{path.name}.",
+            suffix=".tmp",
+            delete=False,
+        ) as f:
+            f.write(text)
+        tmp_path = pathlib.Path(f.name)
+        try:
+            # 临时文件默认只有属主可读，改成和直接写入的文件一样，collector 才能读取
+            tmp_path.chmod(0o644)
+            tmp_path.replace(path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def write_if_due(self, path: str | pathlib.Path, interval: float) -> bool:
+        """距上次写入 path 不足 interval 秒时跳过，返回是否写入。"""
+        now = time.monotonic()
+        with self._lock:
+            written_at = self._written_at.get(str(path))
+            if written_at is not None and now - written_at < interval:
+                return False
+            self._written_at[str(path)] = now
+        self.write(path)
+        return True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._sums.clear()
+            self._counters.clear()
+            self._collectors.clear()
+            self._gauges.clear()
+            self._written_at.clear()
+
+
+METRICS = Metrics()
@@ -0,0 +1,162 @@
+"""OCR 后端的统一接口，以及不依赖网络的两个后端。
+
+后端只需实现 recognize_general()，返回阿里云 RecognizeGeneral 格式的
+{"content": 全文, "prism_wordsInfo": [{"word", "x", "y", "width", "height"}, ...]}，
+request() 和 request_words() 在此基础上实现，BillingParser 只依赖这两个方法。
+
+- ReplayOCR：按图片的 SHA-256 回放录制的识别结果，用于离线运行和测试；
+  传入 backend 时未录制过的图片交给它识别并追加录制。
+- TesseractOCR：本机的 Tesseract，需要 pip install pytesseract 并安装 chi_sim 语言包。
+"""
+
+import json
+import pathlib
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from io import BytesIO
+
+from app.common import read_file_content
+from app.ocr_cache import sha256_digest
+
+
+@dataclass
+class OCRWord:
+    word: str
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class ReplayMissError(LookupError):
+    pass
+
+
+class OCRBackend:
+    # 指标名 ocr.<name> 中使用
+    name = "ocr"
+
+    def recognize_general(
+        self, filename: bytes | memoryview | str | pathlib.Path
+    ) -> dict:
+        raise NotImplementedError
+
+    def request(self, filename: bytes | memoryview | str | pathlib.Path) -> str:
+        return self.recognize_general(filename)["content"]
+
+    def request_words(
+        self, filename: bytes | memoryview | str | pathlib.Path
+    ) -> list[OCRWord]:
+        words = []
+        for info in self.recognize_general(filename).get("prism_wordsInfo", []):
+            if "pos" in info:
+                xs = [point["x"] for point in info["pos"]]
+                ys = [point["y"] for point in info["pos"]]
+                x, y = min(xs), min(ys)
+                width, height = max(xs) - x, max(ys) - y
+            else:
+                x, y, width, height = (
+                    info["x"],
+                    info["y"],
+                    info["width"],
+                    info["height"],
+                )
+            words.append(OCRWord(info["word"], x, y, width, height))
+        return words
+
+
+class ReplayOCR(OCRBackend):
+    """录制文件每行一个 JSON：{"digest": 图片的 SHA-256, "response": 识别结果}。"""
+
+    name = "replay"
+
+    def __init__(
+        self, path: str | pathlib.Path, backend: OCRBackend | None = None
+    ) -> None:
+        self.path = pathlib.Path(path)
+        self.backend = backend
+        if backend is not None:
+            # 录制模式下的指标记在被录制的后端名下
+            self.name = backend.name
+        self._responses: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._responses[record["digest"]] = record["response"]
+
+    def recognize_general(
+        self, filename: bytes | memoryview | str | pathlib.Path
+    ) -> dict:
+        content = read_file_content(filename)
+        digest = sha256_digest(content)
+        with self._lock:
+            response = self._responses.get(digest)
+        if response is not None:
+            return response
+        if self.backend is None:
+            raise ReplayMissError(f"No recorded OCR response for {digest[:12]}")
+        response = self.backend.recognize_general(content)
+        self.record(digest, response)
+        return response
+
+    def record(self, digest: str, response: dict) -> None:
+        with self._lock:
+            if digest in self._responses:
+                return
+            self._responses[digest] = response
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                record = {"digest": digest, "response": response}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._responses)
+
+
+class TesseractOCR(OCRBackend):
+    name = "tesseract"
+
+    def __init__(self, lang: str = "chi_sim+eng") -> None:
+        self.lang = lang
+
+    def recognize_general(
+        self, filename: bytes | memoryview | str | pathlib.Path
+    ) -> dict:
+        # 可选依赖，用到时才导入
+        try:
+            import pytesseract
+        except ImportError as e:
+            raise RuntimeError(
+                "本地 OCR 需要 pytesseract 和 Tesseract：pip install pytesseract"
+            ) from e
+        from PIL import Image
+
+        with Image.open(BytesIO(read_file_content(filename))) as image:
+            data = pytesseract.image_to_data(
+                image, lang=self.lang, output_type=pytesseract.Output.DICT
+            )
+
+        words, lines = [], defaultdict(list)
+        for idx, text in enumerate(data["text"]):
+            if not text.strip():
+                continue
+            words.append(
+                {
+                    "word": text,
+                    "x": data["left"][idx],
+                    "y": data["top"][idx],
+                    "width": data["width"][idx],
+                    "height": data["height"][idx],
+                }
+            )
+            line = (data["block_num"][idx], data["par_num"][idx], data["line_num"][idx])
+            lines[line].append(text)
+        return {
+            "content": "\n".join(" ".join(line) for line in lines.values()),
+            "prism_wordsInfo": words,
+        }
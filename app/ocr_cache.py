@@ -0,0 +1,147 @@
+import hashlib
+import pathlib
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+from app.sqlite_local import LocalConnection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_result (
+    digest TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_ocr_result_accessed_at ON ocr_result (accessed_at);
+CREATE TABLE IF NOT EXISTS ocr_counter (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def sha256_digest(content: bytes | memoryview) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+@dataclass
+class OCRCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class OCRCache:
+    """以图片 SHA-256 为键，保存在本地 SQLite 中的 OCR 结果缓存。
+
+    使用 WAL 模式，多个进程（Streamlit worker、CLI）可以同时读写同一个文件。
+    `stats` 是当前实例的计数，`counters()` 返回所有进程累计的计数。
+    """
+
+    def __init__(
+        self,
+        path: str | pathlib.Path,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_age: float = 180 * 24 * 3600,
+    ) -> None:
+        self.path = pathlib.Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats = OCRCacheStats()
+        self._stats_lock = threading.Lock()
+        self._db = LocalConnection(self.path, SCHEMA)
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> "OCRCache":
+        return cls(
+            path=config.get("path", "data/ocr_cache.sqlite3"),
+            max_entries=config.get("max_entries", 10000),
+            max_bytes=config.get("max_bytes", 64 * 1024 * 1024),
+            max_age=config.get("max_age_days", 180) * 24 * 3600,
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    def _count(self, conn: sqlite3.Connection, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self.stats, name, getattr(self.stats, name) + value)
+        conn.execute(
+            "INSERT INTO ocr_counter (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, value),
+        )
+
+    def get(self, digest: str) -> str | None:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT content FROM ocr_result WHERE digest = ? AND created_at >= ?",
+            (digest, now - self.max_age),
+        ).fetchone()
+        if row is None:
+            self._count(conn, "misses")
+            return None
+        conn.execute(
+            "UPDATE ocr_result SET accessed_at = ? WHERE digest = ?", (now, digest)
+        )
+        self._count(conn, "hits")
+        return row[0]
+
+    def put(self, digest: str, content: str) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO ocr_result "
+            "(digest, content, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (digest, content, len(content.encode()), now, now),
+        )
+        self.evict(now=now)
+
+    def evict(self, now: float | None = None) -> int:
+        conn = self._connect()
+        now = time.time() if now is None else now
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            evicted = conn.execute(
+                "DELETE FROM ocr_result WHERE created_at < ?", (now - self.max_age,)
+            ).rowcount
+
+            count, total_size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_result"
+            ).fetchone()
+            if count > self.max_entries or total_size > self.max_bytes:
+                # 按最近访问时间从旧到新淘汰，直到同时满足条数和体积限制
+                rows = conn.execute(
+                    "SELECT digest, size FROM ocr_result ORDER BY accessed_at"
+                )
+                stale = []
+                for digest, size in rows:
+                    if count <= self.max_entries and total_size <= self.max_bytes:
+                        break
+                    stale.append((digest,))
+                    count -= 1
+                    total_size -= size
+                conn.executemany("DELETE FROM ocr_result WHERE digest = ?", stale)
+                evicted += len(stale)
+
+            if evicted:
+                self._count(conn, "evictions", evicted)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def counters(self) -> OCRCacheStats:
+        rows = self._connect().execute("SELECT name, value FROM ocr_counter")
+        return OCRCacheStats(**dict(rows))
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM ocr_result").fetchone()[0]
@@ -1,20 +1,39 @@
 import pathlib
 import re
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from decimal import Decimal
 
-from app.aliyun_ocr import AliyunOCR
-from app.common import PaymentItem
+from app.aliyun_ocr import AliyunOCR, is_throttling_error
+from app.common import ParseResult, PaymentItem, read_file_content
+from app.concurrency import RateLimiter
+from app.metrics import METRICS
+from app.ocr_backend import OCRBackend, OCRWord
+from app.ocr_cache import OCRCache, sha256_digest
+from app.preprocess import PreprocessConfig, preprocess_image
+from app.stitch import compose_tiles, image_size, plan_batches, split_words
+from app.vendor_rules import VENDOR_RULES, KeywordMatcher, by_priority
 
-BILLING_KEYWORDS = {
-    "github": PaymentItem.GITHUB,
-    "mailgun": PaymentItem.MAILGUN,
-    "atlassian": PaymentItem.JIRA,
-    "1password": PaymentItem.ONEPASSWD,
-    "microsoft": PaymentItem.AZURE,
-}
-BILLING_RMB_AMOUNT_REGEX = r"￥(\d+\.\d{2})已入账"
-BILLING_USD_AMOUNT_REGEX = r"交易地金额：(\d+\.\d{2})"
+BILLING_MATCHER = KeywordMatcher(
+    {
+        keyword: PaymentItem(rule.key)
+        for rule in by_priority(VENDOR_RULES)
+        for keyword in rule.billing_keywords
+    }
+)
+BILLING_RMB_AMOUNT_REGEX = re.compile(r"￥(\d+\.\d{2})已入账")
+BILLING_USD_AMOUNT_REGEX = re.compile(r"交易地金额：(\d+\.\d{2})")
+
+
+@dataclass
+class OCRStats:
+    requests: int = 0
+    original_bytes: int = 0
+    upload_bytes: int = 0
+    latency: float = 0.0
 
 
 @dataclass
@@ -25,29 +44,122 @@ class BillingInfo:
 
 
 class BillingParser:
-    def __init__(self, aliyun_access_key_id, aliyun_access_key_secret) -> None:
-        self.aliyun_ocr_client = AliyunOCR(
+    def __init__(
+        self,
+        aliyun_access_key_id,
+        aliyun_access_key_secret,
+        ocr_cache: OCRCache | None = None,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        preprocess_config: PreprocessConfig | None = None,
+        ocr_client: OCRBackend | None = None,
+    ) -> None:
+        # 传入 ocr_client 时多个 parser 共用同一个客户端，也可以换成其他 OCR 后端
+        self.aliyun_ocr_client = ocr_client or AliyunOCR(
             access_key_id=aliyun_access_key_id,
             access_key_secret=aliyun_access_key_secret,
         )
+        self.ocr_cache = ocr_cache
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.preprocess_config = preprocess_config
+        self.ocr_stats = OCRStats()
+        self._stats_lock = threading.Lock()
+
+    def preprocess(self, file_content: bytes | memoryview) -> bytes | memoryview:
+        if self.preprocess_config is None:
+            return file_content
+        try:
+            return preprocess_image(file_content, self.preprocess_config)
+        except Exception:
+            # 预处理只是为了减小上传体积，失败时直接上传原图
+            return file_content
+
+    def request_ocr(
+        self,
+        file_content: bytes | memoryview,
+        rate_limiter: RateLimiter | None = None,
+        words: bool = False,
+    ) -> str | list[OCRWord]:
+        request = (
+            self.aliyun_ocr_client.request_words
+            if words
+            else self.aliyun_ocr_client.request
+        )
+        for attempt in range(self.max_retries + 1):
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                content = request(filename=file_content)
+            except Exception as e:
+                if attempt == self.max_retries or not is_throttling_error(e):
+                    raise
+                time.sleep(self.retry_backoff * 2**attempt)
+            else:
+                with self._stats_lock:
+                    self.ocr_stats.requests += 1
+                    self.ocr_stats.upload_bytes += len(file_content)
+                    self.ocr_stats.latency += time.perf_counter() - start
+                return content
+
+    def recognize(
+        self,
+        filename: bytes | memoryview | str | pathlib.Path,
+        rate_limiter: RateLimiter | None = None,
+        digest: str | None = None,
+    ) -> str:
+        file_content = read_file_content(filename)
+        if self.ocr_cache is None:
+            return self.request_preprocessed(file_content, rate_limiter)
 
-    def parse_info(self, filename: bytes | str | pathlib.Path) -> BillingInfo:
-        content = self.aliyun_ocr_client.request(filename=filename)
+        # 调用方已经算过 SHA-256 时直接使用，避免重复哈希；
+        # 缓存键始终是原图的哈希，与预处理参数无关
+        digest = digest or sha256_digest(file_content)
+        content = self.ocr_cache.get(digest)
+        if content is None:
+            content = self.request_preprocessed(file_content, rate_limiter)
+            self.ocr_cache.put(digest, content)
+        return content
+
+    def request_preprocessed(
+        self, file_content: bytes | memoryview, rate_limiter: RateLimiter | None = None
+    ) -> str:
+        content = self.request_ocr(
+            self.preprocess(file_content), rate_limiter=rate_limiter
+        )
+        with self._stats_lock:
+            self.ocr_stats.original_bytes += len(file_content)
+        return content
+
+    @METRICS.timed("billing.parse_info")
+    def parse_info(
+        self,
+        filename: bytes | memoryview | str | pathlib.Path,
+        rate_limiter: RateLimiter | None = None,
+        digest: str | None = None,
+    ) -> BillingInfo:
+        content = self.recognize(
+            filename=filename, rate_limiter=rate_limiter, digest=digest
+        )
+        return self.parse_content(content, filename)
+
+    @staticmethod
+    def parse_content(
+        content: str, filename: bytes | memoryview | str | pathlib.Path
+    ) -> BillingInfo:
         lower_content = content.replace(" ", "").lower()
 
-        for keyword in BILLING_KEYWORDS:
-            if keyword in lower_content:
-                payment_item = BILLING_KEYWORDS[keyword]
-                break
-        else:
+        payment_item = BILLING_MATCHER.match(lower_content)
+        if payment_item is None:
             raise ValueError(f"Unknown billing item for {filename}")
 
-        rmb_amount_match = re.search(BILLING_RMB_AMOUNT_REGEX, lower_content)
+        rmb_amount_match = BILLING_RMB_AMOUNT_REGEX.search(lower_content)
         if not rmb_amount_match:
             raise ValueError(f"Could not find RMB amount for {filename}")
         rmb_amount = Decimal(rmb_amount_match.group(1))
 
-        usd_amount_match = re.search(BILLING_USD_AMOUNT_REGEX, lower_content)
+        usd_amount_match = BILLING_USD_AMOUNT_REGEX.search(lower_content)
         if not usd_amount_match:
             raise ValueError(f"Could not find USD amount for {filename}")
         usd_amount = Decimal(usd_amount_match.group(1))
@@ -55,3 +167,151 @@ class BillingParser:
         return BillingInfo(
             payment_item=payment_item, usd_amount=usd_amount, rmb_amount=rmb_amount
         )
+
+    def iter_many(
+        self,
+        filenames: Iterable[bytes | memoryview | str | pathlib.Path],
+        max_workers: int = 4,
+        qps: float | None = 5,
+        digests: Iterable[str] | None = None,
+        rate_limiter: RateLimiter | None = None,
+    ) -> Iterator[tuple[int, ParseResult[BillingInfo]]]:
+        """按完成顺序逐个产出 (输入序号, 解析结果)。
+
+        rate_limiter 为进程内共享的限速器（多个 session 共用一个 OCR 账号的 QPS 上限），
+        传入时忽略 qps。
+        """
+        rate_limiter = rate_limiter or RateLimiter(qps)
+        filenames = list(filenames)
+        digests = list(digests) if digests is not None else [None] * len(filenames)
+
+        def parse_one(filename, digest) -> ParseResult[BillingInfo]:
+            start = time.perf_counter()
+            try:
+                info = self.parse_info(
+                    filename, rate_limiter=rate_limiter, digest=digest
+                )
+            except Exception as e:
+                return ParseResult(
+                    info=None, error=e, elapsed=time.perf_counter() - start
+                )
+            return ParseResult(
+                info=info, error=None, elapsed=time.perf_counter() - start
+            )
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(parse_one, filename, digest): idx
+                for idx, (filename, digest) in enumerate(zip(filenames, digests))
+            }
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                # 调用方提前关闭生成器（如后台任务被取消）时不再启动排队中的请求
+                executor.shutdown(cancel_futures=True)
+
+    def parse_many(
+        self,
+        filenames: Iterable[bytes | memoryview | str | pathlib.Path],
+        max_workers: int = 4,
+        qps: float | None = 5,
+        digests: Iterable[str] | None = None,
+        rate_limiter: RateLimiter | None = None,
+    ) -> list[ParseResult[BillingInfo]]:
+        filenames = list(filenames)
+        results = [None] * len(filenames)
+        for idx, result in self.iter_many(
+            filenames, max_workers, qps, digests, rate_limiter
+        ):
+            results[idx] = result
+        return results
+
+    def parse_stitched(
+        self,
+        filenames: Iterable[bytes | memoryview | str | pathlib.Path],
+        tiles_per_request: int = 4,
+        max_workers: int = 4,
+        qps: float | None = 5,
+        digests: Iterable[str] | None = None,
+        rate_limiter: RateLimiter | None = None,
+    ) -> list[ParseResult[BillingInfo]]:
+        """把多张截图横向拼成一张图只调用一次 OCR，按坐标拆回每张截图的文本。
+
+        拆分后解析失败的截图，以及拼接请求本身失败的截图，回退为逐张识别。
+        """
+        filenames = list(filenames)
+        contents = [read_file_content(filename) for filename in filenames]
+        digests = (
+            list(digests)
+            if digests is not None
+            else [sha256_digest(content) for content in contents]
+        )
+        results: list[ParseResult[BillingInfo] | None] = [None] * len(filenames)
+
+        pending = []
+        for idx, digest in enumerate(digests):
+            content = self.ocr_cache.get(digest) if self.ocr_cache else None
+            if content is None:
+                pending.append(idx)
+                continue
+            start = time.perf_counter()
+            try:
+                info = self.parse_content(content, filenames[idx])
+            except Exception:
+                pending.append(idx)
+            else:
+                results[idx] = ParseResult(
+                    info=info, error=None, elapsed=time.perf_counter() - start
+                )
+
+        uploads = {idx: self.preprocess(contents[idx]) for idx in pending}
+        batches = [
+            [pending[j] for j in batch]
+            for batch in plan_batches(
+                [image_size(uploads[idx]) for idx in pending], tiles_per_request
+            )
+        ]
+        rate_limiter = rate_limiter or RateLimiter(qps)
+
+        def parse_batch(batch: list[int]) -> None:
+            start = time.perf_counter()
+            grayscale = (
+                self.preprocess_config is None or self.preprocess_config.grayscale
+            )
+            composite, tiles = compose_tiles(
+                [uploads[idx] for idx in batch], grayscale=grayscale
+            )
+            words = self.request_ocr(composite, rate_limiter=rate_limiter, words=True)
+            elapsed = (time.perf_counter() - start) / len(batch)
+            with self._stats_lock:
+                self.ocr_stats.original_bytes += sum(len(contents[i]) for i in batch)
+
+            for idx, text in zip(batch, split_words(words, tiles)):
+                try:
+                    info = self.parse_content(text, filenames[idx])
+                except ValueError:
+                    continue
+                if self.ocr_cache is not None:
+                    self.ocr_cache.put(digests[idx], text)
+                results[idx] = ParseResult(info=info, error=None, elapsed=elapsed)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(parse_batch, batch)
+                for batch in batches
+                if len(batch) > 1
+            ]
+            for future in as_completed(futures):
+                # 拼接请求失败的截图留给下面逐张识别
+                future.exception()
+
+        fallback = [idx for idx, result in enumerate(results) if result is None]
+        for idx, result in self.iter_many(
+            [contents[idx] for idx in fallback],
+            max_workers=max_workers,
+            digests=[digests[idx] for idx in fallback],
+            rate_limiter=rate_limiter,
+        ):
+            results[fallback[idx]] = result
+        return results
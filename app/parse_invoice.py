@@ -1,52 +1,30 @@
+import multiprocessing
+import os
 import pathlib
-import re
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import AbstractContextManager, nullcontext
 from dataclasses import dataclass
 from decimal import Decimal
 
 import arrow
 from fitz import Document
 
-from app.common import PaymentItem
-
-PAID_REGEX = {
-    PaymentItem.GITHUB: r"Total\n\$(\d+\.\d{2}) USD\*",
-    PaymentItem.MAILGUN: r"PAID\n\$(\d+\.\d{2})",
-    PaymentItem.JIRA: r"Total Paid: USD (\d+\.\d{2})",
-    PaymentItem.ONEPASSWD: r"Amount paid\n\$([\d,]+\.\d{2}) USD",
-    PaymentItem.AZURE: r"Total Amount\nUSD ([\d,]+\.\d{2})",
-}
-
-SERVICE_START_REGEX = {
-    PaymentItem.GITHUB: r"Date\n(\d{4}-\d{2}-\d{2})",
-    PaymentItem.MAILGUN: r"Foundation\n\d\n.+?\n(\w+ \d{1,2}, \d{4}) - \w+ \d{1,2}, \d{4}",  # noqa: E501
-    PaymentItem.JIRA: r"Billing Period: (\w+ \d{1,2}, \d{4}) - \w+ \d{1,2}, \d{4}",
-    PaymentItem.ONEPASSWD: r"((?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},\s+\d{4})\s+to\s+(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},\s+\d{4}",  # noqa: E501
-    PaymentItem.AZURE: r"This invoice is for the billing period (\d{2}/\d{2}/\d{4}) - \d{2}/\d{2}/\d{4}",  # noqa: E501
-}
-
-SERVICE_THROUGH_REGEX = {
-    PaymentItem.GITHUB: r"For service through\n(\d{4}-\d{2}-\d{2})",
-    PaymentItem.MAILGUN: r"Foundation\n\d\n.+?\n\w+ \d{1,2}, \d{4} - (\w+ \d{1,2}, \d{4})",  # noqa: E501
-    PaymentItem.JIRA: r"Billing Period: \w+ \d{1,2}, \d{4} - (\w+ \d{1,2}, \d{4})",
-    PaymentItem.ONEPASSWD: r"(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},\s+\d{4}\s+to\s+((?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},\s+\d{4})",  # noqa: E501
-    PaymentItem.AZURE: r"This invoice is for the billing period \d{2}/\d{2}/\d{4} - (\d{2}/\d{2}/\d{4})",  # noqa: E501
-}
-
-DATE_FORMAT = {
-    PaymentItem.GITHUB: "YYYY-MM-DD",
-    PaymentItem.MAILGUN: "MMM D, YYYY",
-    PaymentItem.JIRA: "MMM D, YYYY",
-    PaymentItem.ONEPASSWD: "MMMM D, YYYY",
-    PaymentItem.AZURE: "MM/DD/YYYY",
-}
-
-INVOICE_KEYWORDS = {
-    "GitHub, Inc": PaymentItem.GITHUB,
-    "Mailgun": PaymentItem.MAILGUN,
-    "Atlassian Pty Ltd": PaymentItem.JIRA,
-    "1Password": PaymentItem.ONEPASSWD,
-    "Microsoft Corporation": PaymentItem.AZURE,
-}
+from app.common import FITZ_LOCK, ParseResult, PaymentItem
+from app.metrics import METRICS
+from app.vendor_rules import VENDOR_RULES, KeywordMatcher, by_priority
+
+# 少于这个数量的文件直接在当前进程解析
+MIN_POOL_BATCH = 4
+
+INVOICE_MATCHER = KeywordMatcher(
+    {
+        keyword: PaymentItem(rule.key)
+        for rule in by_priority(VENDOR_RULES)
+        for keyword in rule.invoice_keywords
+    }
+)
 
 
 @dataclass
@@ -62,45 +40,87 @@ class InvoiceParser:
         pass
 
     @staticmethod
-    def read_pdf(filename: bytes | str | pathlib.Path) -> str:
+    def open_pdf(
+        filename: bytes | str | pathlib.Path | Document,
+    ) -> AbstractContextManager[Document]:
+        # 调用方传入已打开的文档时由调用方负责关闭
+        if isinstance(filename, Document):
+            return nullcontext(filename)
         if isinstance(filename, bytes):
             params = {"stream": filename}
         elif isinstance(filename, (str, pathlib.Path)):
             params = {"filename": filename}
         else:
             raise TypeError(f"Unsupported type: {type(filename)}")
+        return Document(**params)
 
-        with Document(**params) as doc:
+    @classmethod
+    @METRICS.timed("invoice.read_pdf")
+    def read_pdf(cls, filename: bytes | str | pathlib.Path | Document) -> str:
+        with cls.open_pdf(filename) as doc:
             return "\n".join(page.get_text(sort=True) for page in doc)
 
-    def parse_info(self, filename: bytes | str | pathlib.Path) -> InvoiceInfo:
-        content = self.read_pdf(filename=filename)
+    @classmethod
+    @METRICS.timed("invoice.read_pdf")
+    def read_pdf_lazily(
+        cls,
+        filename: bytes | str | pathlib.Path | Document,
+        max_pages: int | None = None,
+    ) -> tuple[PaymentItem | None, str]:
+        """逐页提取文本，识别出账单类型且所需字段都已出现后停止读取后续页面。"""
+        payment_item, pages = None, []
+        with cls.open_pdf(filename) as doc:
+            for page in doc.pages(0, max_pages):
+                sort = payment_item is None or payment_item.rule.sort_text
+                pages.append(page.get_text(sort=sort))
+                content = "\n".join(pages)
+
+                if payment_item is None:
+                    payment_item = cls.detect_payment_item(content)
+                if payment_item is not None and all(
+                    regex.search(content) for regex in payment_item.rule.invoice_regexes
+                ):
+                    break
+        return payment_item, "\n".join(pages)
 
-        for keyword in INVOICE_KEYWORDS:
-            if keyword in content:
-                payment_item = INVOICE_KEYWORDS[keyword]
-                break
+    @staticmethod
+    def detect_payment_item(content: str) -> PaymentItem | None:
+        return INVOICE_MATCHER.match(content)
+
+    @METRICS.timed("invoice.parse_info")
+    def parse_info(
+        self,
+        filename: bytes | str | pathlib.Path | Document,
+        lazy: bool = True,
+        max_pages: int | None = None,
+    ) -> InvoiceInfo:
+        if lazy:
+            payment_item, content = self.read_pdf_lazily(filename, max_pages=max_pages)
         else:
+            content = self.read_pdf(filename=filename)
+            payment_item = self.detect_payment_item(content)
+        if payment_item is None:
             raise ValueError(f"Could not match any payment item for {filename}")
+        rule = payment_item.rule
 
-        paid_match = re.search(PAID_REGEX[payment_item], content)
+        paid_match = rule.paid_regex.search(content)
         if not paid_match:
             raise ValueError(f"Could not find paid amount for {filename}")
         paid = Decimal(paid_match.group(1).replace(",", ""))
 
-        service_start_match = re.search(SERVICE_START_REGEX[payment_item], content)
+        service_start_match = rule.service_start_regex.search(content)
         if not service_start_match:
             raise ValueError(f"Could not find service start date for {filename}")
         service_start = arrow.get(
-            service_start_match.group(1), DATE_FORMAT[payment_item]
+            service_start_match.group(1), rule.date_format
         ).format("YYYY.MM.DD")
 
-        service_through_match = re.search(SERVICE_THROUGH_REGEX[payment_item], content)
+        service_through_match = rule.service_through_regex.search(content)
         if not service_through_match:
             raise ValueError(f"Could not find service through date for {filename}")
         service_through = arrow.get(
             service_through_match.group(1),
-            DATE_FORMAT[payment_item],
+            rule.date_format,
         ).format("YYYY.MM.DD")
 
         return InvoiceInfo(
@@ -109,3 +129,74 @@ class InvoiceParser:
             service_start=service_start,
             service_through=service_through,
         )
+
+    def iter_many(
+        self,
+        filenames: Iterable[bytes | str | pathlib.Path | Document],
+        max_workers: int | None = None,
+        min_pool_batch: int = MIN_POOL_BATCH,
+    ) -> Iterator[tuple[int, ParseResult[InvoiceInfo]]]:
+        """按完成顺序逐个产出 (输入序号, 解析结果)。"""
+        filenames = list(filenames)
+        if max_workers is None:
+            max_workers = min(len(filenames), os.cpu_count() or 1)
+
+        # 文件太少时进程池的启动开销比解析本身还大，直接在当前进程解析；
+        # 已打开的 Document 不能传给子进程，也在当前进程解析
+        if (
+            max_workers <= 1
+            or len(filenames) < min_pool_batch
+            or any(isinstance(filename, Document) for filename in filenames)
+        ):
+            for idx, filename in enumerate(filenames):
+                yield idx, parse_invoice_timed(filename)
+            return
+
+        # Streamlit 进程中有多个线程，fork 不安全，使用 spawn 启动子进程
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {
+                executor.submit(parse_invoice_timed, filename): idx
+                for idx, filename in enumerate(filenames)
+            }
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    observe_parse_elapsed(result)
+                    yield futures[future], result
+            finally:
+                # 调用方提前关闭生成器（如后台任务被取消）时不再启动排队中的解析
+                executor.shutdown(cancel_futures=True)
+
+    def parse_many(
+        self,
+        filenames: Iterable[bytes | str | pathlib.Path | Document],
+        max_workers: int | None = None,
+        min_pool_batch: int = MIN_POOL_BATCH,
+    ) -> list[ParseResult[InvoiceInfo]]:
+        filenames = list(filenames)
+        results = [None] * len(filenames)
+        for idx, result in self.iter_many(filenames, max_workers, min_pool_batch):
+            results[idx] = result
+        return results
+
+
+def parse_invoice_timed(
+    filename: bytes | str | pathlib.Path | Document,
+) -> ParseResult[InvoiceInfo]:
+    with FITZ_LOCK:
+        start = time.perf_counter()
+        try:
+            info = InvoiceParser().parse_info(filename)
+        except Exception as e:
+            return ParseResult(info=None, error=e, elapsed=time.perf_counter() - start)
+        return ParseResult(info=info, error=None, elapsed=time.perf_counter() - start)
+
+
+def observe_parse_elapsed(result: ParseResult[InvoiceInfo]) -> None:
+    """补记子进程中的解析耗时。
+
+    子进程里记录的耗时不会回到主进程，从进程池取回结果后用结果中的耗时补记。
+    """
+    METRICS.observe("invoice.parse_info", result.elapsed)
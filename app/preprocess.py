@@ -0,0 +1,69 @@
+from collections.abc import Mapping
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+
+@dataclass(frozen=True)
+class PreprocessConfig:
+    # 裁剪区域，(left, top, right, bottom) 均为相对宽高的比例，None 表示不裁剪
+    crop: tuple[float, float, float, float] | None = None
+    max_width: int = 1080
+    grayscale: bool = True
+    quality: int = 85
+    min_quality: int = 50
+    max_bytes: int = 300 * 1024
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> "PreprocessConfig | None":
+        if not config.get("enabled", True):
+            return None
+        crop = config.get("crop")
+        return cls(
+            crop=tuple(crop) if crop else None,
+            max_width=config.get("max_width", cls.max_width),
+            grayscale=config.get("grayscale", cls.grayscale),
+            quality=config.get("quality", cls.quality),
+            min_quality=config.get("min_quality", cls.min_quality),
+            max_bytes=config.get("max_bytes", cls.max_bytes),
+        )
+
+
+def preprocess_image(
+    content: bytes | memoryview, config: PreprocessConfig
+) -> bytes | memoryview:
+    """裁剪、缩小、灰度化并重新编码为 JPEG，结果不比原图小时返回原图。"""
+    with Image.open(BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image)
+        if config.crop:
+            left, top, right, bottom = config.crop
+            image = image.crop(
+                (
+                    round(image.width * left),
+                    round(image.height * top),
+                    round(image.width * right),
+                    round(image.height * bottom),
+                )
+            )
+        if image.width > config.max_width:
+            image = image.resize(
+                (
+                    config.max_width,
+                    round(image.height * config.max_width / image.width),
+                ),
+                Image.Resampling.LANCZOS,
+            )
+        image = image.convert("L" if config.grayscale else "RGB")
+
+        # 从目标质量开始逐步降低，直到体积不超过上限或到达最低质量
+        quality = config.quality
+        while True:
+            fp = BytesIO()
+            image.save(fp, format="JPEG", quality=quality, optimize=True)
+            if fp.tell() <= config.max_bytes or quality <= config.min_quality:
+                break
+            quality = max(quality - 10, config.min_quality)
+
+    data = fp.getvalue()
+    return data if len(data) < len(content) else content
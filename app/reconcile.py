@@ -0,0 +1,129 @@
+import dataclasses
+from collections import defaultdict
+from decimal import Decimal
+
+from app.common import NamedFile, PaymentItem
+from app.matching import match_amounts, to_cents
+from app.parse_billing import BillingInfo
+from app.parse_invoice import InvoiceInfo
+
+
+class ReconcileError(ValueError):
+    def __init__(
+        self,
+        message: str,
+        unmatched_invoices: list[tuple[NamedFile, InvoiceInfo]] | None = None,
+        unmatched_billings: list[tuple[NamedFile, BillingInfo]] | None = None,
+    ) -> None:
+        super().__init__(message)
+        self.unmatched_invoices = unmatched_invoices or []
+        self.unmatched_billings = unmatched_billings or []
+
+
+@dataclasses.dataclass
+class PaymentItemData:
+    payment_item: PaymentItem
+    usd_amount: Decimal
+    rmb_amount: Decimal
+    service_start: str
+    service_through: str
+    invoice_files: list[NamedFile]
+    billing_files: list[NamedFile]
+    # 每张账单各自的服务周期，与 invoice_files 一一对应
+    service_periods: list[tuple[str, str]] = dataclasses.field(default_factory=list)
+
+
+def reconcile(
+    invoice_result: list[tuple[NamedFile, InvoiceInfo]],
+    billing_result: list[tuple[NamedFile, BillingInfo]],
+) -> list[PaymentItemData]:
+    invoices: dict[PaymentItem, list[tuple[NamedFile, InvoiceInfo]]] = defaultdict(list)
+    for file, invoice_info in invoice_result:
+        invoices[invoice_info.payment_item].append((file, invoice_info))
+
+    billings: dict[PaymentItem, list[tuple[NamedFile, BillingInfo]]] = defaultdict(list)
+    for file, billing_info in billing_result:
+        billings[billing_info.payment_item].append((file, billing_info))
+
+    payment_items, errors = [], []
+    unmatched_invoices, unmatched_billings = [], []
+    for payment_item in PaymentItem:
+        invoice_amount = sum(
+            [info.paid for _, info in invoices[payment_item]], start=Decimal(0)
+        )
+        billing_amount = sum(
+            [info.usd_amount for _, info in billings[payment_item]],
+            start=Decimal(0),
+        )
+        # 逐笔配对，总和相等但无法配对（例如 5+5 对 3+7）也视为不匹配
+        matching = match_amounts(
+            [to_cents(info.paid) for _, info in invoices[payment_item]],
+            [to_cents(info.usd_amount) for _, info in billings[payment_item]],
+        )
+        if matching.unmatched_invoices or matching.unmatched_charges:
+            item_invoices = [
+                invoices[payment_item][idx] for idx in matching.unmatched_invoices
+            ]
+            item_billings = [
+                billings[payment_item][idx] for idx in matching.unmatched_charges
+            ]
+            unmatched_invoices += item_invoices
+            unmatched_billings += item_billings
+            errors.append(
+                unmatched_message(
+                    payment_item,
+                    invoice_amount,
+                    billing_amount,
+                    item_invoices,
+                    item_billings,
+                )
+            )
+            continue
+        if invoice_amount != Decimal(0):
+            payment_items.append(
+                PaymentItemData(
+                    payment_item=payment_item,
+                    usd_amount=billing_amount,
+                    rmb_amount=sum(
+                        [info.rmb_amount for _, info in billings[payment_item]],
+                        start=Decimal(0),
+                    ),
+                    service_start=min(
+                        info.service_start for _, info in invoices[payment_item]
+                    ),
+                    service_through=max(
+                        info.service_through for _, info in invoices[payment_item]
+                    ),
+                    invoice_files=[file for file, _ in invoices[payment_item]],
+                    billing_files=[file for file, _ in billings[payment_item]],
+                    service_periods=[
+                        (info.service_start, info.service_through)
+                        for _, info in invoices[payment_item]
+                    ],
+                )
+            )
+    if errors:
+        raise ReconcileError("\n".join(errors), unmatched_invoices, unmatched_billings)
+    return payment_items
+
+
+def unmatched_message(
+    payment_item: PaymentItem,
+    invoice_amount: Decimal,
+    billing_amount: Decimal,
+    unmatched_invoices: list[tuple[NamedFile, InvoiceInfo]],
+    unmatched_billings: list[tuple[NamedFile, BillingInfo]],
+) -> str:
+    if invoice_amount != billing_amount:
+        message = f"[{payment_item}]账单金额 {invoice_amount} 与消费金额 {billing_amount} 不相等"
+    else:
+        message = f"[{payment_item}]账单金额与消费金额总和相等（{invoice_amount}），但无法逐笔配对"
+    if unmatched_invoices:
+        message += "；未配对的账单：" + "、".join(
+            f"{file.name}（USD {info.paid}）" for file, info in unmatched_invoices
+        )
+    if unmatched_billings:
+        message += "；未配对的消费截图：" + "、".join(
+            f"{file.name}（USD {info.usd_amount}）" for file, info in unmatched_billings
+        )
+    return message
@@ -0,0 +1,27 @@
+"""命令行、邮件导入和 HTTP 服务共用的 JSON 输出。"""
+
+import dataclasses
+import json
+import sys
+
+from app.common import ParseResult
+
+
+def dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def emit(record: dict) -> None:
+    """向标准输出写一行 JSON。"""
+    sys.stdout.write(dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+def result_record(result: ParseResult, **fields) -> dict:
+    """解析结果的 JSON 记录，fields 放在记录开头，如 type、file。"""
+    record = {**fields, "elapsed": round(result.elapsed, 3)}
+    if result.error is None:
+        record["info"] = dataclasses.asdict(result.info)
+    else:
+        record["error"] = str(result.error)
+    return record
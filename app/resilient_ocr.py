@@ -0,0 +1,263 @@
+"""在任意 OCR 后端外面加上截止时间、对冲请求、熔断和备用后端。
+
+- 截止时间：每次识别最多等待 timeout 秒，超时抛出 OCRTimeoutError，不被卡住的请求拖住整个页面；
+- 对冲请求：耗时超过该后端最近的 p95（且不少于 hedge_min_delay）仍未返回时，
+  再发一个相同的请求，先成功的为准；对冲请求不超过总请求数的 hedge_ratio；
+- 熔断：连续失败 failure_threshold 次后，reset_timeout 秒内直接失败（CircuitOpenError），
+  之后放行一次试探请求，成功即恢复；
+- 备用后端：主后端失败或熔断时改用 fallback（如本机 Tesseract 或录制回放）。
+
+被限流不算失败：服务在正常响应，异常原样抛给 BillingParser 退避重试。
+每个后端成功请求的耗时记为阶段 ocr.<name>，可以在指标中看到 p50/p95。
+"""
+
+import pathlib
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from app.aliyun_ocr import AliyunOCR, is_throttling_error
+from app.common import read_file_content
+from app.metrics import METRICS, percentile
+from app.ocr_backend import OCRBackend, ReplayOCR, TesseractOCR
+
+DEFAULT_TIMEOUT = 15.0
+
+
+class OCRTimeoutError(TimeoutError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """线程安全的熔断器：closed → 连续失败达到阈值 → open → 超时后放行一次试探 → closed 或 open。"""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._clock = clock
+        self._opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._trial or self._clock() - self._opened_at < self.reset_timeout:
+                return "open"
+            return "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            # 同一时刻只放行一次试探请求
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> bool:
+        """记一次失败，返回是否因此断开。"""
+        with self._lock:
+            self.failures += 1
+            if self._trial or (
+                self._opened_at is None and self.failures >= self.failure_threshold
+            ):
+                self._opened_at = self._clock()
+                self._trial = False
+                return True
+            return False
+
+
+class ResilientOCR(OCRBackend):
+    def __init__(
+        self,
+        backend: OCRBackend,
+        timeout: float | None = DEFAULT_TIMEOUT,
+        hedge_quantile: float | None = 0.95,
+        hedge_min_delay: float = 1.0,
+        hedge_ratio: float = 0.1,
+        hedge_min_samples: int = 20,
+        breaker: CircuitBreaker | None = None,
+        fallback: OCRBackend | None = None,
+        max_workers: int = 64,
+    ) -> None:
+        self.backend = backend
+        self.name = backend.name
+        self.timeout = timeout
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_ratio = hedge_ratio
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.fallback = fallback
+        self.calls = 0
+        self.hedges = 0
+        self._latencies: deque[float] = deque(maxlen=200)
+        self._lock = threading.Lock()
+        # 被放弃（超时或对冲落败）的请求仍在线程中跑完，线程数要留有余量
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"ocr-{self.name}"
+        )
+
+    def hedge_delay(self) -> float | None:
+        """发出对冲请求前等待的秒数；样本不足或未启用时返回 None。"""
+        if not self.hedge_quantile:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            latencies = list(self._latencies)
+        return max(percentile(latencies, self.hedge_quantile), self.hedge_min_delay)
+
+    def recognize_general(
+        self, filename: bytes | memoryview | str | pathlib.Path
+    ) -> dict:
+        content = read_file_content(filename)
+        if not self.breaker.allow():
+            METRICS.incr(f"ocr.{self.name}.rejected")
+            return self._fallback(
+                content, CircuitOpenError(f"OCR backend {self.name} is unavailable")
+            )
+        try:
+            response = self._hedged(content)
+        except Exception as e:
+            if is_throttling_error(e):
+                self.breaker.record_success()
+                raise
+            if self.breaker.record_failure():
+                METRICS.incr(f"ocr.{self.name}.circuit_opened")
+            return self._fallback(content, e)
+        self.breaker.record_success()
+        return response
+
+    def _fallback(self, content: bytes | memoryview, error: Exception) -> dict:
+        if self.fallback is None:
+            raise error
+        METRICS.incr(f"ocr.{self.name}.fallback")
+        return self._timed(self.fallback, content)
+
+    def _timed(self, backend: OCRBackend, content: bytes | memoryview) -> dict:
+        start = time.perf_counter()
+        try:
+            response = backend.recognize_general(content)
+        except Exception:
+            METRICS.incr(f"ocr.{backend.name}.errors")
+            raise
+        elapsed = time.perf_counter() - start
+        METRICS.observe(f"ocr.{backend.name}", elapsed)
+        if backend is self.backend:
+            with self._lock:
+                self._latencies.append(elapsed)
+        return response
+
+    def _hedged(self, content: bytes | memoryview) -> dict:
+        start = time.monotonic()
+        deadline = None if self.timeout is None else start + self.timeout
+        delay = self.hedge_delay()
+        hedge_at = None if delay is None else start + delay
+        with self._lock:
+            self.calls += 1
+
+        primary = self._executor.submit(self._timed, self.backend, content)
+        pending: set[Future] = {primary}
+        error: Exception | None = None
+        while pending:
+            wake = min((t for t in (hedge_at, deadline) if t is not None), default=None)
+            done, pending = wait(
+                pending,
+                timeout=None if wake is None else max(wake - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if future is not primary:
+                    METRICS.incr(f"ocr.{self.name}.hedge_wins")
+                return response
+
+            now = time.monotonic()
+            if pending and hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                with self._lock:
+                    allowed = self.hedges + 1 <= self.hedge_ratio * self.calls
+                    if allowed:
+                        self.hedges += 1
+                if allowed:
+                    METRICS.incr(f"ocr.{self.name}.hedged")
+                    pending.add(
+                        self._executor.submit(self._timed, self.backend, content)
+                    )
+            if pending and deadline is not None and now >= deadline:
+                METRICS.incr(f"ocr.{self.name}.timeouts")
+                raise OCRTimeoutError(
+                    f"OCR backend {self.name} did not respond in {self.timeout} s"
+                )
+        raise error
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def make_backend(
+    kind: str, config: Mapping, aliyun_config: Mapping | None = None
+) -> OCRBackend:
+    if kind == "aliyun":
+        if aliyun_config is None:
+            raise ValueError("backend = 'aliyun' requires the [aliyun_ocr] section")
+        return AliyunOCR.from_config(
+            aliyun_config, timeout=config.get("timeout", DEFAULT_TIMEOUT)
+        )
+    if kind == "replay":
+        return ReplayOCR(config["replay_path"])
+    if kind == "tesseract":
+        return TesseractOCR(lang=config.get("tesseract_lang", "chi_sim+eng"))
+    raise ValueError(f"Unknown OCR backend: {kind}")
+
+
+def make_ocr_client(
+    config: Mapping, aliyun_config: Mapping | None = None
+) -> ResilientOCR:
+    """按 [ocr] 配置创建 OCR 客户端，默认使用阿里云。"""
+    backend = make_backend(config.get("backend", "aliyun"), config, aliyun_config)
+    if config.get("record_path"):
+        # 主后端的识别结果录制下来，之后可以用 backend = "replay" 离线回放
+        backend = ReplayOCR(config["record_path"], backend=backend)
+    fallback = config.get("fallback")
+    return ResilientOCR(
+        backend,
+        timeout=config.get("timeout", DEFAULT_TIMEOUT),
+        hedge_quantile=config.get("hedge_quantile", 0.95),
+        hedge_min_delay=config.get("hedge_min_delay", 1.0),
+        hedge_ratio=config.get("hedge_ratio", 0.1),
+        breaker=CircuitBreaker(
+            failure_threshold=config.get("failure_threshold", 5),
+            reset_timeout=config.get("reset_timeout", 30.0),
+        ),
+        fallback=(
+            None if fallback is None else make_backend(fallback, config, aliyun_config)
+        ),
+    )
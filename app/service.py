@@ -0,0 +1,563 @@
+"""多人共用的 HTTP 服务：上传账单 PDF 和信用卡消费截图，解析、校验并生成报销文件。
+
+    python -m app.service --port 8080
+
+配置与 Streamlit 共用 .streamlit/secrets.toml。所有请求共用一个解析账单 PDF 的进程池、
+一个 OCR 客户端、OCR 缓存和限速器，报销单模板在进程内只加载一次；
+每个报销人在 [submitters.<key>] 中配置自己的姓名和模板。
+同时处理的请求数和排队的请求数都有上限（[service]），超出时立即返回 503。
+
+    POST /reimbursements?submitter=<key>  multipart 表单，invoice 和 billing 字段可以有多个
+    GET  /artifacts/<submitter>/<date>/<id>/<name>
+    GET  /healthz
+    GET  /metrics
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import hashlib
+import json
+import multiprocessing
+import os
+import pathlib
+import sys
+import time
+import tomllib
+from collections.abc import AsyncIterator, Mapping
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from urllib.parse import quote
+
+import arrow
+from aiohttp import web
+
+from app.artifacts import (
+    ArtifactCache,
+    allinone_pdf_filename,
+    billing_pdf_filename,
+    build_billing_document,
+    fingerprint_file,
+    fingerprint_payment_items,
+    generate_allinone_pdf,
+    generate_reimbursement_application,
+    load_application_template,
+    reimbursement_application_filename,
+    save_document,
+)
+from app.billing_layout import BillingLayout
+from app.common import ParseResult
+from app.concurrency import RateLimiter
+from app.ledger import Ledger
+from app.metrics import METRICS
+from app.ocr_backend import OCRBackend
+from app.ocr_cache import OCRCache
+from app.parse_billing import BillingInfo, BillingParser
+from app.parse_invoice import InvoiceInfo, observe_parse_elapsed, parse_invoice_timed
+from app.preprocess import PreprocessConfig
+from app.reconcile import PaymentItemData, ReconcileError, reconcile
+from app.records import dumps, result_record
+from app.resilient_ocr import ResilientOCR, make_ocr_client
+from app.upload_store import StoredFile, UploadStore, file_digest
+
+ARTIFACTS = ("application", "billing_pdf", "allinone_pdf")
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@dataclass(frozen=True)
+class Submitter:
+    name: str
+    template_path: str
+
+
+def load_submitters(secrets: Mapping) -> dict[str, Submitter]:
+    """[submitters.<key>] 中配置每个报销人的姓名和模板。
+
+    没有配置时沿用 [reimbursement_application] 中的报销人，key 为 "default"。
+    """
+    submitters = {
+        key: Submitter(name=config["name"], template_path=config["template_path"])
+        for key, config in secrets.get("submitters", {}).items()
+    }
+    if not submitters and "reimbursement_application" in secrets:
+        config = secrets["reimbursement_application"]
+        submitters["default"] = Submitter(
+            name=config["submitter"], template_path=config["template_path"]
+        )
+    return submitters
+
+
+class Backpressure:
+    """同时处理的请求不超过 max_active 个，排队的请求超过 max_queued 个时立即拒绝。
+
+    被拒绝的请求不读取请求体，客户端收到 503 后按 Retry-After 重试。
+    """
+
+    def __init__(self, max_active: int, max_queued: int) -> None:
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_active)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self._semaphore.locked() and self.queued >= self.max_queued:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(
+                text=json.dumps({"error": "服务繁忙，请稍后重试"}, ensure_ascii=False),
+                content_type="application/json",
+                headers={"Retry-After": "1"},
+            )
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    host: str = "127.0.0.1"
+    port: int = 8080
+    # 同时处理的请求数，以及排队等待的请求数上限
+    max_active: int = 4
+    max_queued: int = 16
+    # 解析账单 PDF 的进程数，不大于 1 时在线程中解析
+    invoice_workers: int = os.cpu_count() or 1
+    # OCR 并发数和每秒请求数上限，所有请求共享
+    ocr_workers: int = 8
+    ocr_qps: float | None = 5
+    max_body_mb: int = 256
+    # 上传文件临时目录的位置，默认使用系统临时目录
+    upload_dir: str | None = None
+
+    @classmethod
+    def from_config(cls, secrets: Mapping) -> "ServiceConfig":
+        config = secrets.get("service", {})
+        fields = {field.name for field in dataclasses.fields(cls)}
+        values = {key: value for key, value in config.items() if key in fields}
+        ocr = secrets.get("aliyun_ocr", {})
+        values.setdefault("ocr_workers", ocr.get("max_workers", cls.ocr_workers))
+        values.setdefault("ocr_qps", ocr.get("qps", cls.ocr_qps))
+        return cls(**values)
+
+
+class ReimbursementService:
+    def __init__(
+        self,
+        secrets: Mapping,
+        config: ServiceConfig | None = None,
+        ocr_client: OCRBackend | None = None,
+    ) -> None:
+        self.config = config or ServiceConfig.from_config(secrets)
+        self.submitters = load_submitters(secrets)
+
+        ocr_config = secrets["aliyun_ocr"]
+        self.billing_parser = BillingParser(
+            ocr_config["access_key_id"],
+            ocr_config["access_key_secret"],
+            ocr_cache=OCRCache.from_config(secrets.get("ocr_cache", {})),
+            preprocess_config=PreprocessConfig.from_config(
+                secrets.get("preprocess", {})
+            ),
+            ocr_client=ocr_client
+            or make_ocr_client(secrets.get("ocr", {}), ocr_config),
+        )
+        self.rate_limiter = RateLimiter(self.config.ocr_qps)
+        self.billing_layout = BillingLayout.from_config(secrets.get("billing_pdf", {}))
+        self.ledger = Ledger.from_config(secrets.get("ledger", {}))
+        cache_config = secrets.get("artifact_cache", {})
+        self.artifact_cache = ArtifactCache(
+            maxsize=cache_config.get("maxsize", 32),
+            max_bytes=cache_config.get("max_bytes", 256 * 1024 * 1024),
+        )
+        self.backpressure = Backpressure(self.config.max_active, self.config.max_queued)
+
+        # 进程池和线程池在服务启动时创建一次，所有请求共用
+        self.invoice_pool: Executor = (
+            ProcessPoolExecutor(
+                max_workers=self.config.invoice_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            if self.config.invoice_workers > 1
+            else ThreadPoolExecutor(max_workers=1)
+        )
+        self.ocr_pool = ThreadPoolExecutor(max_workers=self.config.ocr_workers)
+        self.artifact_pool = ThreadPoolExecutor(max_workers=self.config.max_active)
+
+        METRICS.register_gauges(
+            "service",
+            lambda: {
+                "active": self.backpressure.active,
+                "queued": self.backpressure.queued,
+            },
+        )
+        METRICS.register_collector(
+            "service", lambda: {"rejected": self.backpressure.rejected}
+        )
+        METRICS.register_collector(
+            "artifact_cache",
+            lambda: {
+                "hits": self.artifact_cache.hits,
+                "misses": self.artifact_cache.misses,
+            },
+        )
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=self.config.max_body_mb * 1024 * 1024)
+        app.router.add_post("/reimbursements", self.handle_reimbursement)
+        app.router.add_get(
+            "/artifacts/{submitter}/{date}/{artifact_id}/{name}", self.handle_artifact
+        )
+        app.router.add_get("/healthz", self.handle_health)
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.on_cleanup.append(self.close)
+        return app
+
+    async def close(self, app: web.Application | None = None) -> None:
+        for pool in (self.invoice_pool, self.ocr_pool, self.artifact_pool):
+            pool.shutdown(wait=False, cancel_futures=True)
+        if isinstance(self.billing_parser.aliyun_ocr_client, ResilientOCR):
+            self.billing_parser.aliyun_ocr_client.close()
+
+    @staticmethod
+    async def read_files(
+        request: web.Request, store: UploadStore
+    ) -> tuple[list[StoredFile], list[StoredFile]]:
+        """把上传的文件逐块写入 store，内容相同的文件只保留第一个。"""
+        invoice_files, billing_files, seen = [], [], set()
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name not in ("invoice", "billing"):
+                continue
+            with store.writer(part.filename or part.name) as writer:
+                while chunk := await part.read_chunk():
+                    writer.write(chunk)
+                file = writer.commit()
+            if file.digest in seen:
+                continue
+            seen.add(file.digest)
+            (invoice_files if part.name == "invoice" else billing_files).append(file)
+        return invoice_files, billing_files
+
+    async def parse_invoices(
+        self, files: list[StoredFile]
+    ) -> list[ParseResult[InvoiceInfo]]:
+        loop = asyncio.get_running_loop()
+        # 按路径打开文件，子进程不必接收序列化的文件内容
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self.invoice_pool, parse_invoice_timed, str(file.path)
+                )
+                for file in files
+            )
+        )
+        if isinstance(self.invoice_pool, ProcessPoolExecutor):
+            for result in results:
+                observe_parse_elapsed(result)
+        return list(results)
+
+    def parse_billing(self, file: StoredFile) -> ParseResult[BillingInfo]:
+        start = time.perf_counter()
+        try:
+            info = self.billing_parser.parse_info(
+                file.getvalue(), rate_limiter=self.rate_limiter, digest=file.digest
+            )
+        except Exception as e:
+            return ParseResult(info=None, error=e, elapsed=time.perf_counter() - start)
+        return ParseResult(info=info, error=None, elapsed=time.perf_counter() - start)
+
+    async def parse_billings(
+        self, files: list[StoredFile]
+    ) -> list[ParseResult[BillingInfo]]:
+        loop = asyncio.get_running_loop()
+        return list(
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(self.ocr_pool, self.parse_billing, file)
+                    for file in files
+                )
+            )
+        )
+
+    def artifact_key(
+        self, submitter_key: str, date: str, artifact_id: str, name: str
+    ) -> tuple:
+        return ("service", submitter_key, date, artifact_id, name)
+
+    def generate(
+        self,
+        submitter_key: str,
+        payment_items: list[PaymentItemData],
+        fingerprint: str,
+        today: arrow.Arrow,
+    ) -> str:
+        """生成三个文件放入缓存，返回下载地址中的 id。
+
+        id 由输入文件、模板和版式共同决定，相同的输入重复提交时直接复用缓存。
+        """
+        submitter = self.submitters[submitter_key]
+        template_fingerprint = fingerprint_file(submitter.template_path)
+        artifact_id = hashlib.sha256(
+            repr((fingerprint, template_fingerprint, self.billing_layout)).encode()
+        ).hexdigest()[:32]
+        date = today.format("YYYYMMDD")
+
+        def key(name: str) -> tuple:
+            return self.artifact_key(submitter_key, date, artifact_id, name)
+
+        with METRICS.span("service.application"):
+            self.artifact_cache.get_or_create(
+                key("application"),
+                lambda: generate_reimbursement_application(
+                    load_application_template(
+                        submitter.template_path, template_fingerprint
+                    ),
+                    submitter.name,
+                    payment_items,
+                    today,
+                ),
+            )
+
+        billing_document = None
+
+        def create_billing_pdf() -> bytes:
+            nonlocal billing_document
+            billing_document = build_billing_document(
+                payment_items, self.billing_layout
+            )
+            return save_document(billing_document)
+
+        with METRICS.span("service.billing_pdf"):
+            billing_pdf = self.artifact_cache.get_or_create(
+                key("billing_pdf"), create_billing_pdf
+            )
+        with METRICS.span("service.allinone_pdf"):
+            self.artifact_cache.get_or_create(
+                key("allinone_pdf"),
+                lambda: generate_allinone_pdf(
+                    payment_items,
+                    billing_pdf if billing_document is None else billing_document,
+                ),
+            )
+        return artifact_id
+
+    async def handle_reimbursement(self, request: web.Request) -> web.Response:
+        submitter_key = request.query.get("submitter", "default")
+        if submitter_key not in self.submitters:
+            raise web.HTTPBadRequest(
+                text=dumps({"error": f"未配置的报销人：{submitter_key}"}),
+                content_type="application/json",
+            )
+        allow_duplicates = request.query.get("allow_duplicates") in ("1", "true")
+
+        async with self.backpressure.slot():
+            # 上传的文件写入本次请求独占的临时目录，处理完即删除，
+            # 请求占用的内存与上传文件的大小无关
+            store = UploadStore(self.config.upload_dir)
+            try:
+                with METRICS.span("service.reimbursement"):
+                    return await self.process(
+                        request, store, submitter_key, allow_duplicates
+                    )
+            finally:
+                store.close()
+
+    async def process(
+        self,
+        request: web.Request,
+        store: UploadStore,
+        submitter_key: str,
+        allow_duplicates: bool,
+    ) -> web.Response:
+        invoice_files, billing_files = await self.read_files(request, store)
+        invoice_results, billing_results = await asyncio.gather(
+            self.parse_invoices(invoice_files),
+            self.parse_billings(billing_files),
+        )
+        response = {
+            "invoices": [
+                result_record(result, file=file.name)
+                for file, result in zip(invoice_files, invoice_results)
+            ],
+            "billings": [
+                result_record(result, file=file.name)
+                for file, result in zip(billing_files, billing_results)
+            ],
+        }
+        if not (invoice_files and billing_files):
+            response["error"] = "请上传账单 PDF 和信用卡消费截图。"
+            return web.json_response(response, status=400, dumps=dumps)
+        if any(
+            result.error is not None for result in invoice_results + billing_results
+        ):
+            response["error"] = "部分文件解析失败。"
+            return web.json_response(response, status=422, dumps=dumps)
+
+        invoice_result = sorted(
+            (
+                (file, result.info)
+                for file, result in zip(invoice_files, invoice_results)
+            ),
+            key=lambda x: (x[1].payment_item, x[1].paid),
+        )
+        billing_result = sorted(
+            (
+                (file, result.info)
+                for file, result in zip(billing_files, billing_results)
+            ),
+            key=lambda x: (x[1].payment_item, x[1].usd_amount),
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            payment_items = await loop.run_in_executor(
+                self.artifact_pool, reconcile, invoice_result, billing_result
+            )
+        except ReconcileError as e:
+            response["error"] = str(e)
+            response["unmatched_invoices"] = [
+                file.name for file, _ in e.unmatched_invoices
+            ]
+            response["unmatched_billings"] = [
+                file.name for file, _ in e.unmatched_billings
+            ]
+            return web.json_response(response, status=422, dumps=dumps)
+
+        response["payment_items"] = [
+            {
+                **dataclasses.asdict(item),
+                "invoice_files": [file.name for file in item.invoice_files],
+                "billing_files": [file.name for file in item.billing_files],
+            }
+            for item in payment_items
+        ]
+
+        if self.ledger is not None:
+            check = await loop.run_in_executor(
+                self.artifact_pool, self.ledger.check, payment_items, file_digest
+            )
+            response["ledger"] = {
+                "duplicates": [
+                    {"file": file.name, **dataclasses.asdict(record)}
+                    for file, record in check.duplicates
+                ],
+                "overlaps": [
+                    {"payment_item": item.payment_item, **dataclasses.asdict(record)}
+                    for item, record in check.overlaps
+                ],
+            }
+            if check.duplicates and not allow_duplicates:
+                response["error"] = "部分文件已经报销过。"
+                return web.json_response(response, status=409, dumps=dumps)
+
+        fingerprint = fingerprint_payment_items(payment_items, file_digest)
+        today = arrow.now(tz="Asia/Shanghai")
+        artifact_id = await loop.run_in_executor(
+            self.artifact_pool,
+            self.generate,
+            submitter_key,
+            payment_items,
+            fingerprint,
+            today,
+        )
+        date = today.format("YYYYMMDD")
+        response["artifacts"] = {
+            name: f"/artifacts/{submitter_key}/{date}/{artifact_id}/{name}"
+            for name in ARTIFACTS
+        }
+
+        if self.ledger is not None:
+            await loop.run_in_executor(
+                self.artifact_pool,
+                self.ledger.record,
+                fingerprint,
+                self.submitters[submitter_key].name,
+                payment_items,
+                file_digest,
+            )
+        return web.json_response(response, dumps=dumps)
+
+    async def handle_artifact(self, request: web.Request) -> web.Response:
+        submitter_key, date, artifact_id, name = (
+            request.match_info[key]
+            for key in ("submitter", "date", "artifact_id", "name")
+        )
+        data = self.artifact_cache.get(
+            self.artifact_key(submitter_key, date, artifact_id, name)
+        )
+        if data is None or submitter_key not in self.submitters:
+            raise web.HTTPNotFound(
+                text=dumps({"error": "文件不存在或已过期，请重新提交"}),
+                content_type="application/json",
+            )
+        today = arrow.get(date, "YYYYMMDD")
+        filename = {
+            "application": reimbursement_application_filename(
+                self.submitters[submitter_key].name, today
+            ),
+            "billing_pdf": billing_pdf_filename(today),
+            "allinone_pdf": allinone_pdf_filename(today),
+        }[name]
+        return web.Response(
+            body=data,
+            content_type=(
+                "application/pdf" if filename.endswith(".pdf") else XLSX_CONTENT_TYPE
+            ),
+            headers={
+                "Content-Disposition": "attachment; "
+                f"filename*=UTF-8''{quote(filename)}"
+            },
+        )
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "active": self.backpressure.active,
+                "queued": self.backpressure.queued,
+                "rejected": self.backpressure.rejected,
+            }
+        )
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=METRICS.to_prometheus(), content_type="text/plain", charset="utf-8"
+        )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.service",
+        description="多人共用的报销 HTTP 服务",
+    )
+    parser.add_argument(
+        "--secrets",
+        type=pathlib.Path,
+        default=pathlib.Path(".streamlit/secrets.toml"),
+        help="与 Streamlit 共用的配置文件",
+    )
+    parser.add_argument("--host", help="默认取配置文件 [service] 中的值")
+    parser.add_argument("--port", type=int, help="默认取配置文件 [service] 中的值")
+    args = parser.parse_args(argv)
+
+    with open(args.secrets, "rb") as f:
+        secrets = tomllib.load(f)
+    config = ServiceConfig.from_config(secrets)
+    config = dataclasses.replace(
+        config, host=args.host or config.host, port=args.port or config.port
+    )
+    service = ReimbursementService(secrets, config)
+    web.run_app(service.make_app(), host=config.host, port=config.port)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
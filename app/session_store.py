@@ -0,0 +1,89 @@
+from collections.abc import Callable, Hashable, Iterator, Mapping
+from typing import Generic, TypeVar
+
+from app.common import NamedFile, ParseResult
+from app.jobs import Job
+
+T = TypeVar("T")
+
+
+class ResultStore(Generic[T]):
+    """按文件哈希保存解析结果，只解析新增的文件，丢弃已移除文件的结果。
+
+    解析失败的结果也保存，不会在每次 rerun 时重新提交；
+    调用 retry_errors() 后，失败的文件在下次同步时重新解析。
+    """
+
+    def __init__(self) -> None:
+        self.results: dict[str, ParseResult[T]] = {}
+        self.errors: dict[str, ParseResult[T]] = {}
+        self.job: Job[ParseResult[T]] | None = None
+
+    def retry_errors(self) -> None:
+        """丢弃失败的结果，例如 OCR 超时或熔断之后由用户手动重试。"""
+        self.errors.clear()
+
+    def sync_in_background(
+        self,
+        files: Mapping[str, NamedFile],
+        iter_many: Callable[[list[NamedFile]], Iterator[tuple[int, ParseResult[T]]]],
+        name: str = "parse",
+    ) -> tuple[dict[str, ParseResult[T]], Job[ParseResult[T]] | None]:
+        """新增的文件交给后台任务解析，立即返回已经完成的结果（包括失败的结果）。
+
+        任务仍在运行时一并返回，调用方据此显示进度并稍后 rerun 取回新的结果。
+        任务中有文件被移除时取消任务，其余未完成的文件随即重新提交。
+        同一时间只有一个任务，任务运行期间新增的文件等它结束后再提交。
+        """
+        for store in (self.results, self.errors):
+            for digest in store.keys() - files.keys():
+                del store[digest]
+
+        if self.job is not None:
+            job, done = self.job, self.job.done
+            if job.error is not None:
+                self.job = None
+                raise job.error
+            for digest, result in job.results().items():
+                if digest in files:
+                    store = self.results if result.error is None else self.errors
+                    store[digest] = result
+            if not files.keys() >= set(job.keys):
+                job.cancel()
+            if done or job.cancelled:
+                self.job = None
+
+        if self.job is None:
+            new_digests = [
+                digest
+                for digest in files
+                if digest not in self.results and digest not in self.errors
+            ]
+            if new_digests:
+                self.job = Job(
+                    new_digests,
+                    iter_many([files[digest] for digest in new_digests]),
+                    name=name,
+                ).start()
+
+        results = {
+            digest: self.results.get(digest) or self.errors.get(digest)
+            for digest in files
+        }
+        return {
+            digest: result for digest, result in results.items() if result is not None
+        }, self.job
+
+
+class Memo(Generic[T]):
+    """只记住最近一次的输入和结果，输入不变时直接返回上次的结果。"""
+
+    def __init__(self) -> None:
+        self.key: Hashable = None
+        self.value: T | None = None
+
+    def get(self, key: Hashable, compute: Callable[[], T]) -> T:
+        if self.key is None or self.key != key:
+            self.value = compute()
+            self.key = key
+        return self.value
@@ -0,0 +1,27 @@
+import pathlib
+import sqlite3
+import threading
+
+
+class LocalConnection:
+    """每个线程各自持有一个连接的 SQLite 数据库，sqlite3 连接不能跨线程共享。
+
+    使用 WAL 模式和自动提交，多个进程（Streamlit worker、CLI）可以同时读写同一个文件。
+    """
+
+    def __init__(self, path: str | pathlib.Path, schema: str) -> None:
+        self.path = pathlib.Path(path)
+        self._local = threading.local()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.get() as conn:
+            conn.executescript(schema)
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
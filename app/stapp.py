@@ -1,75 +1,282 @@
+# 页面首次渲染（尚未上传文件）只需要 streamlit 本身，PyMuPDF、Pillow、openpyxl
+# 等较重的依赖在第一次用到时才导入，类型注解中的名字只在类型检查时导入
+from __future__ import annotations
+
 import dataclasses
 import pathlib
-from collections import defaultdict
+import time
+from collections.abc import Callable, Iterator
 from decimal import Decimal
-from io import BytesIO
+from functools import cached_property
+from typing import TYPE_CHECKING, TypeVar
 
-import arrow
-import fitz
-import openpyxl
 import streamlit as st
 from streamlit.runtime.uploaded_file_manager import UploadedFile
 
-from app.common import PaymentItem
-from app.parse_billing import BillingInfo, BillingParser
-from app.parse_invoice import InvoiceInfo, InvoiceParser
+from app.common import ParseResult
+from app.jobs import Job
+from app.metrics import METRICS
+from app.session_store import Memo, ResultStore
+from app.upload_store import StoredFile, UploadStore, file_digest
+
+if TYPE_CHECKING:
+    from app.artifacts import ArtifactCache
+    from app.billing_layout import BillingLayout
+    from app.concurrency import RateLimiter
+    from app.document_cache import DocumentCache
+    from app.ledger import Ledger
+    from app.ocr_backend import OCRBackend
+    from app.ocr_cache import OCRCache
+    from app.parse_billing import BillingInfo, BillingParser
+    from app.parse_invoice import InvoiceInfo, InvoiceParser
+    from app.reconcile import PaymentItemData
+
+T = TypeVar("T")
+
+# 后台任务运行期间每隔多少秒 rerun 一次，取回新完成的结果
+POLL_INTERVAL = 0.3
+# 生成的三个文件，对应 part4–part6
+ARTIFACTS = ("application", "billing_pdf", "allinone_pdf")
+
+
+# 以下资源在进程内共享，第一次用到时创建
+
+
+@st.cache_resource
+def get_artifact_cache(maxsize: int, max_bytes: int) -> ArtifactCache:
+    from app.artifacts import ArtifactCache
+
+    return ArtifactCache(maxsize=maxsize, max_bytes=max_bytes)
+
+
+@st.cache_resource
+def get_ledger(config: dict) -> Ledger | None:
+    from app.ledger import Ledger
+
+    return Ledger.from_config(config)
+
+
+@st.cache_resource
+def get_invoice_parser() -> InvoiceParser:
+    from app.parse_invoice import InvoiceParser
+
+    return InvoiceParser()
+
 
+@st.cache_resource
+def get_ocr_client(config: dict, aliyun_config: dict) -> OCRBackend:
+    from app.resilient_ocr import make_ocr_client
 
-@dataclasses.dataclass
-class PaymentItemData:
-    payment_item: PaymentItem
-    usd_amount: Decimal
-    rmb_amount: Decimal
-    service_start: str
-    service_through: str
-    invoice_files: list[UploadedFile]
-    billing_files: list[UploadedFile]
+    # 截止时间、对冲请求和熔断状态在进程内共享
+    return make_ocr_client(config, aliyun_config)
+
+
+@st.cache_resource
+def get_rate_limiter(qps: float | None) -> RateLimiter:
+    from app.concurrency import RateLimiter
+
+    # OCR 账号的 QPS 上限由进程内所有 session 共同遵守
+    return RateLimiter(qps)
+
+
+@st.cache_resource
+def get_ocr_cache(config: dict) -> OCRCache:
+    from app.ocr_cache import OCRCache
+
+    return OCRCache.from_config(config)
 
 
 class StreamlitApp:
     def __init__(self) -> None:
-        # parser 初始化
-        self.invoice_parser = InvoiceParser()
-        self.billing_parser = BillingParser(
-            st.secrets.aliyun_ocr.access_key_id, st.secrets.aliyun_ocr.access_key_secret
-        )
-
-        # 报销申请表 sheet 初始化
+        # 报销申请表模板只检查是否存在，第一次生成报销单时才读取
         application_tpl_path = pathlib.Path(
             st.secrets.reimbursement_application.template_path
         )
         if not application_tpl_path.exists() or not application_tpl_path.is_file():
             st.error("报销申请表模板文件不存在！")
             st.stop()
-        self.workbook = openpyxl.load_workbook(application_tpl_path, keep_vba=True)
-        self.worksheet = self.workbook["日常报销单"]
+        self.application_tpl_path = application_tpl_path
 
         self.application_submitter = st.secrets.reimbursement_application.submitter
 
-    @st.cache_data(persist=True)
-    def parse_billing_with_cache(_self, file_content: bytes) -> BillingInfo:
-        return _self.billing_parser.parse_info(file_content)
+        # OCR 并发数与每秒请求数上限
+        self.ocr_max_workers = st.secrets.aliyun_ocr.get("max_workers", 4)
+        self.ocr_qps = st.secrets.aliyun_ocr.get("qps", 5)
+        # 大于 1 时把多张截图拼成一张图识别，节省 OCR 调用次数
+        self.ocr_tiles_per_request = st.secrets.aliyun_ocr.get("tiles_per_request", 1)
+
+        # 上传文件写入 session 的临时目录，之后只通过内存映射读取，
+        # session 结束、存储被回收时删除目录；按 file_id 保存，每个文件只写入一次
+        self.upload_store = self.session_object(
+            "upload_store",
+            lambda: UploadStore(st.secrets.get("uploads", {}).get("directory")),
+        )
+        self.stored_files = self.session_object("stored_files", dict)
+        # 解析结果按文件哈希保存在 session 中，rerun 时只解析新增的文件
+        self.invoice_store = self.session_object("invoice_store", ResultStore)
+        self.billing_store = self.session_object("billing_store", ResultStore)
+        self.reconcile_memo = self.session_object("reconcile_memo", Memo)
+
+        # 阶段耗时和缓存计数，可定期导出到文件供 Prometheus 采集；
+        # 后台任务运行期间每 POLL_INTERVAL 秒 rerun 一次，这时最多每 interval 秒写一次
+        self.metrics_path = st.secrets.get("metrics", {}).get("path")
+        self.metrics_interval = st.secrets.get("metrics", {}).get("interval", 15)
+        self.polling = False
+
+    @cached_property
+    def invoice_parser(self) -> InvoiceParser:
+        return get_invoice_parser()
+
+    @cached_property
+    def billing_parser(self) -> BillingParser:
+        from app.parse_billing import BillingParser
+        from app.preprocess import PreprocessConfig
+
+        ocr_cache = get_ocr_cache(dict(st.secrets.get("ocr_cache", {})))
+        METRICS.register_collector(
+            "ocr_cache", lambda: dataclasses.asdict(ocr_cache.counters())
+        )
+        # OCR 客户端和缓存进程内共享；parser 属于 session，
+        # 后台任务跨越多次 rerun，OCR 统计计本 session 的所有请求
+        return self.session_object(
+            "billing_parser",
+            lambda: BillingParser(
+                st.secrets.aliyun_ocr.access_key_id,
+                st.secrets.aliyun_ocr.access_key_secret,
+                ocr_cache=ocr_cache,
+                preprocess_config=PreprocessConfig.from_config(
+                    st.secrets.get("preprocess", {})
+                ),
+                ocr_client=get_ocr_client(
+                    dict(st.secrets.get("ocr", {})), dict(st.secrets.aliyun_ocr)
+                ),
+            ),
+        )
+
+    @cached_property
+    def ledger(self) -> Ledger | None:
+        return get_ledger(dict(st.secrets.get("ledger", {})))
+
+    @cached_property
+    def billing_layout(self) -> BillingLayout:
+        from app.billing_layout import BillingLayout
+
+        return BillingLayout.from_config(st.secrets.get("billing_pdf", {}))
+
+    @cached_property
+    def document_cache(self) -> DocumentCache:
+        from app.document_cache import DocumentCache
 
-    def st_unique_file_uploader(self, *args, **kw) -> None | list[UploadedFile]:
+        # 已打开的账单 PDF，解析和生成打印 PDF 时共用；属于 session，
+        # 计数取最近一次 rerun 的 session
+        document_cache = self.session_object("document_cache", DocumentCache)
+        METRICS.register_collector(
+            "document_cache",
+            lambda: {"hits": document_cache.hits, "misses": document_cache.misses},
+        )
+        return document_cache
+
+    @cached_property
+    def artifact_cache(self) -> ArtifactCache:
+        # 生成的报销单和 PDF 按输入指纹缓存，进程内所有 session 共享
+        config = st.secrets.get("artifact_cache", {})
+        artifact_cache = get_artifact_cache(
+            maxsize=config.get("maxsize", 32),
+            max_bytes=config.get("max_bytes", 256 * 1024 * 1024),
+        )
+        METRICS.register_collector(
+            "artifact_cache",
+            lambda: {"hits": artifact_cache.hits, "misses": artifact_cache.misses},
+        )
+        return artifact_cache
+
+    @staticmethod
+    def session_object(key: str, factory: Callable[[], T]) -> T:
+        if key not in st.session_state:
+            st.session_state[key] = factory()
+        return st.session_state[key]
+
+    def store_upload(self, file: UploadedFile) -> StoredFile:
+        # 直接写出上传缓冲区，不复制内容；之后不再持有 UploadedFile
+        if file.file_id not in self.stored_files:
+            with file.getbuffer() as buffer:
+                self.stored_files[file.file_id] = self.upload_store.put(
+                    file.name, buffer
+                )
+        return self.stored_files[file.file_id]
+
+    def release_uploads(self, digests: set[str]) -> None:
+        """删除已从上传列表中移除的文件，关闭已打开的文档。"""
+        for file_id, file in list(self.stored_files.items()):
+            if file.digest not in digests:
+                del self.stored_files[file_id]
+        self.document_cache.retain(digests)
+        self.upload_store.retain(digests)
+
+    # 以下 iter_* 在脚本线程中准备好输入，返回的迭代器交给后台任务执行
+
+    def iter_invoice_files(
+        self, files: list[StoredFile]
+    ) -> Iterator[tuple[int, ParseResult[InvoiceInfo]]]:
+        from app.parse_invoice import MIN_POOL_BATCH
+
+        # 文件少时在当前进程解析，直接使用缓存中的文档；文件多时交给进程池
+        if len(files) < MIN_POOL_BATCH:
+            invoice_parser = self.invoice_parser
+            document_cache = self.document_cache
+
+            # 文档到后台线程中才打开，和其他 fitz 调用一样由 FITZ_LOCK 串行
+            def iter_cached():
+                yield from invoice_parser.iter_many(
+                    [
+                        document_cache.open(file.digest, lambda file=file: file.path)
+                        for file in files
+                    ]
+                )
+
+            return iter_cached()
+        # 子进程按路径读取文件，不必把内容序列化传过去
+        return self.invoice_parser.iter_many([str(file.path) for file in files])
+
+    def iter_billing_files(
+        self, files: list[StoredFile]
+    ) -> Iterator[tuple[int, ParseResult[BillingInfo]]]:
+        billing_parser = self.billing_parser
+        kw = dict(
+            max_workers=self.ocr_max_workers,
+            digests=[file.digest for file in files],
+            rate_limiter=get_rate_limiter(self.ocr_qps),
+        )
+        contents = [file.getvalue() for file in files]
+        if self.ocr_tiles_per_request > 1:
+            # 拼图识别一次返回全部结果，放在生成器里，到后台线程中才执行
+            def iter_stitched():
+                yield from enumerate(
+                    billing_parser.parse_stitched(
+                        contents, tiles_per_request=self.ocr_tiles_per_request, **kw
+                    )
+                )
+
+            return iter_stitched()
+        return billing_parser.iter_many(contents, **kw)
+
+    def st_unique_file_uploader(self, *args, **kw) -> dict[str, StoredFile]:
         file_or_files = st.file_uploader(*args, **kw)
         if file_or_files is None:
-            return None
+            return {}
         elif isinstance(file_or_files, UploadedFile):
-            return [file_or_files]
+            file_or_files = [file_or_files]
 
-        file_contents = set()
-        unique_files = []
+        unique_files = {}
         for file in file_or_files:
-            file_content = file.getvalue()
-            if file_content not in file_contents:
-                file_contents.add(file_content)
-                unique_files.append(file)
+            stored = self.store_upload(file)
+            unique_files.setdefault(stored.digest, stored)
         return unique_files
 
     def part1_input_data(
         self,
     ) -> tuple[
-        list[tuple[UploadedFile, InvoiceInfo]], list[tuple[UploadedFile, BillingInfo]]
+        list[tuple[StoredFile, InvoiceInfo]], list[tuple[StoredFile, BillingInfo]]
     ]:
         st.header("上传")
         col1, col2 = st.columns(2)
@@ -82,18 +289,25 @@ class StreamlitApp:
                 type=["pdf"],
                 accept_multiple_files=True,
             )
-            invoice_result = (
-                [
-                    (file, self.invoice_parser.parse_info(file.read()))
-                    for file in invoice_files
-                ]
-                if invoice_files
-                else []
+            invoice_results, invoice_job = self.invoice_store.sync_in_background(
+                invoice_files, self.iter_invoice_files, name="invoice"
             )
+            self.st_job_progress(invoice_job)
+            invoice_result, invoice_errors = [], []
+            for digest, file in invoice_files.items():
+                result = invoice_results.get(digest)
+                if result is None:
+                    continue
+                elif result.error is None:
+                    invoice_result.append((file, result.info))
+                else:
+                    invoice_errors.append((file, result.error))
             invoice_result.sort(key=lambda x: (x[1].payment_item, x[1].paid))
 
             st.write("账单解析结果：")
             st.table({file.name: info for file, info in invoice_result})
+            for file, error in invoice_errors:
+                st.error(f"{file.name} 解析失败：{error}")
 
         with col2:
             st.subheader("上传信用卡消费截图")
@@ -103,18 +317,45 @@ class StreamlitApp:
                 type=["png", "jpg", "jpeg"],
                 accept_multiple_files=True,
             )
-            billing_result = (
-                [
-                    (file, self.parse_billing_with_cache(file.read()))
-                    for file in billing_files
-                ]
-                if billing_files
-                else []
+            billing_results, billing_job = self.billing_store.sync_in_background(
+                billing_files, self.iter_billing_files, name="billing"
             )
+            self.st_job_progress(billing_job)
+            billing_result, billing_errors = [], []
+            for digest, file in billing_files.items():
+                result = billing_results.get(digest)
+                if result is None:
+                    continue
+                elif result.error is None:
+                    billing_result.append((file, result.info))
+                else:
+                    billing_errors.append((file, result.error))
             billing_result.sort(key=lambda x: (x[1].payment_item, x[1].usd_amount))
 
             st.write("信用卡消费截图解析结果：")
             st.table({file.name: info for file, info in billing_result})
+            for file, error in billing_errors:
+                st.error(f"{file.name} 解析失败：{error}")
+
+            ocr_stats = self.billing_parser.ocr_stats
+            if ocr_stats.requests:
+                st.caption(
+                    f"OCR 请求 {ocr_stats.requests} 次，"
+                    f"上传 {ocr_stats.upload_bytes / 1024:.0f} KB"
+                    f"（原图 {ocr_stats.original_bytes / 1024:.0f} KB），"
+                    f"平均耗时 {ocr_stats.latency / ocr_stats.requests * 1000:.0f} ms"
+                )
+
+        # 文件有变化时，取消为旧输入生成文件的任务，删除移除的文件
+        self.cancel_stale_artifact_job(invoice_files.keys() | billing_files.keys())
+        self.release_uploads(invoice_files.keys() | billing_files.keys())
+
+        if invoice_job is not None or billing_job is not None:
+            self.poll()
+
+        if invoice_errors or billing_errors:
+            st.button("重新解析失败的文件", on_click=self.retry_failed_files)
+            st.stop()
 
         if not (invoice_result and billing_result):
             st.info("请上传账单 PDF 和信用卡消费截图。")
@@ -122,63 +363,64 @@ class StreamlitApp:
 
         return invoice_result, billing_result
 
+    def retry_failed_files(self) -> None:
+        self.invoice_store.retry_errors()
+        self.billing_store.retry_errors()
+
+    @staticmethod
+    def st_job_progress(job: Job | None) -> None:
+        if job is not None:
+            st.progress(
+                job.completed / job.total,
+                text=f"正在解析 {job.completed}/{job.total} 个文件…",
+            )
+
+    def poll(self) -> None:
+        # 后台任务仍在运行：已完成的部分已经显示，稍后 rerun 取回新的结果
+        self.polling = True
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
+
     def part2_process_data(
         self,
-        invoice_result: list[tuple[UploadedFile, InvoiceInfo]],
-        billing_result: list[tuple[UploadedFile, BillingInfo]],
+        invoice_result: list[tuple[StoredFile, InvoiceInfo]],
+        billing_result: list[tuple[StoredFile, BillingInfo]],
     ) -> list[PaymentItemData]:
+        from app.reconcile import ReconcileError, reconcile
+
         st.header("校验")
-        st.write("按 payment_item 分别校验账单中金额和信用卡消费截图中金额匹配。")
-
-        invoices: dict[
-            PaymentItem, list[tuple[UploadedFile, InvoiceInfo]]
-        ] = defaultdict(list)
-        for file, invoice_info in invoice_result:
-            invoices[invoice_info.payment_item].append((file, invoice_info))
-
-        billings: dict[
-            PaymentItem, list[tuple[UploadedFile, BillingInfo]]
-        ] = defaultdict(list)
-        for file, billing_info in billing_result:
-            billings[billing_info.payment_item].append((file, billing_info))
-
-        payment_items = []
-        for payment_item in PaymentItem:
-            invoice_amount = sum(
-                [info.paid for _, info in invoices[payment_item]], start=Decimal(0)
-            )
-            billing_amount = sum(
-                [info.usd_amount for _, info in billings[payment_item]],
-                start=Decimal(0),
+        st.write("按 payment_item 把账单和信用卡消费截图逐笔配对，支持一张账单分多次扣款或一次扣款合并多张账单。")
+
+        # 输入文件没有变化时直接复用上次的校验结果
+        key = (
+            tuple((file.name, file.digest) for file, _ in invoice_result),
+            tuple((file.name, file.digest) for file, _ in billing_result),
+        )
+        fresh = self.reconcile_memo.key != key
+        try:
+            payment_items = self.reconcile_memo.get(
+                key, lambda: reconcile(invoice_result, billing_result)
             )
-            if invoice_amount != billing_amount:
-                st.error(
-                    f"[{payment_item}]账单金额 {invoice_amount} "
-                    f"与消费金额 {billing_amount} 不相等"
-                )
-                st.stop()
-            if invoice_amount != Decimal(0):
-                payment_items.append(
-                    PaymentItemData(
-                        payment_item=payment_item,
-                        usd_amount=billing_amount,
-                        rmb_amount=sum(
-                            [info.rmb_amount for _, info in billings[payment_item]],
-                            start=Decimal(0),
-                        ),
-                        service_start=min(
-                            info.service_start for _, info in invoices[payment_item]
-                        ),
-                        service_through=max(
-                            info.service_through for _, info in invoices[payment_item]
-                        ),
-                        invoice_files=[file for file, _ in invoices[payment_item]],
-                        billing_files=[file for file, _ in billings[payment_item]],
-                    )
+        except ReconcileError as e:
+            st.error(str(e))
+            if e.unmatched_invoices or e.unmatched_billings:
+                st.write("未配对的文件：")
+                st.table(
+                    [
+                        {"文件": file.name, "类型": "账单", "金额": info.paid}
+                        for file, info in e.unmatched_invoices
+                    ]
+                    + [
+                        {"文件": file.name, "类型": "消费截图", "金额": info.usd_amount}
+                        for file, info in e.unmatched_billings
+                    ]
                 )
+            st.stop()
 
         st.success("校验通过，金额匹配无误。")
-        st.balloons()
+        # 等待后台任务时会反复 rerun，只在校验结果更新时放一次气球
+        if fresh:
+            st.balloons()
 
         display_items = []
         for item in payment_items:
@@ -188,8 +430,67 @@ class StreamlitApp:
             display_items.append(data)
         st.table(display_items)
 
+        self.check_ledger(payment_items)
+
         return payment_items
 
+    def check_ledger(self, payment_items: list[PaymentItemData]) -> None:
+        if self.ledger is None:
+            return
+        # 本 session 中刚记录的报销不算重复，否则重新生成时会把自己判为重复提交
+        recorded = self.session_object("ledger_recorded", set)
+        result = self.ledger.check(payment_items, file_digest, exclude=recorded)
+
+        if result.overlaps:
+            st.warning("以下账单的服务周期与已报销的记录重叠，请确认不是重复报销：")
+            st.table(
+                [
+                    {
+                        "账单类型": item.payment_item.name,
+                        "本次周期": f"{item.service_start} - {item.service_through}",
+                        "已报销周期": f"{record.service_start} - "
+                        f"{record.service_through}",
+                        "已报销金额": record.usd_amount,
+                        "报销人": record.submitter,
+                    }
+                    for item, record in result.overlaps
+                ]
+            )
+
+        if result.duplicates:
+            st.error("以下文件已经报销过：")
+            st.table(
+                [
+                    {
+                        "文件": file.name,
+                        "已报销文件": record.file_name,
+                        "账单类型": record.payment_item,
+                        "服务周期": f"{record.service_start} - "
+                        f"{record.service_through}",
+                        "报销人": record.submitter,
+                    }
+                    for file, record in result.duplicates
+                ]
+            )
+            if not st.checkbox("确认需要再次报销这些文件"):
+                st.stop()
+
+    def record_reimbursement(self, payment_items: list[PaymentItemData]) -> None:
+        if self.ledger is None:
+            return
+        reimbursement_id = self.ledger.record(
+            self.payment_items_fingerprint(payment_items),
+            self.application_submitter,
+            payment_items,
+            file_digest,
+        )
+        self.session_object("ledger_recorded", set).add(reimbursement_id)
+
+    def payment_items_fingerprint(self, payment_items: list[PaymentItemData]) -> str:
+        from app.artifacts import fingerprint_payment_items
+
+        return fingerprint_payment_items(payment_items, file_digest)
+
     def part3_generate_copies(self, payment_items: list[PaymentItemData]):
         st.subheader("生成飞书审批文案")
 
@@ -216,131 +517,234 @@ class StreamlitApp:
             )
             st.code(item.rmb_amount)
 
-    def part4_generate_reimbursement_application(
-        self, payment_items: list[PaymentItemData]
-    ):
-        st.subheader("生成彩云报销单")
+    def start_artifact_job(self, payment_items: list[PaymentItemData]) -> Job[bytes]:
+        """在后台依次生成报销单、消费截图 PDF 和 All-in-One PDF，校验结果不变时复用。"""
+        import arrow
+
+        from app.artifacts import (
+            build_billing_document,
+            fingerprint_file,
+            generate_allinone_pdf,
+            generate_reimbursement_application,
+            load_application_template,
+            save_document,
+        )
 
         today = arrow.now(tz="Asia/Shanghai")
+        fingerprint = self.payment_items_fingerprint(payment_items)
+        billing_layout = self.billing_layout
+        # 版式配置（[billing_pdf]）变化时重新生成两个 PDF
+        key = (fingerprint, billing_layout, today.format("YYYY.MM.DD"))
+        current = st.session_state.get("artifact_job")
+        if current is not None and current["key"] == key:
+            return current["job"]
+        if current is not None:
+            current["job"].cancel()
+
+        # 后台线程中不能使用 st.*，缓存、模板和版式先在脚本线程中取好
+        artifact_cache = self.artifact_cache
+        document_cache = self.document_cache
+        submitter = self.application_submitter
+        template_fingerprint = fingerprint_file(self.application_tpl_path)
+        template = load_application_template(
+            str(self.application_tpl_path), template_fingerprint
+        )
+
+        def iter_artifacts() -> Iterator[tuple[int, bytes]]:
+            with METRICS.span("artifacts.application"):
+                yield 0, artifact_cache.get_or_create(
+                    (
+                        "reimbursement_application",
+                        template_fingerprint,
+                        submitter,
+                        today.format("YYYY.MM.DD"),
+                        fingerprint,
+                    ),
+                    lambda: generate_reimbursement_application(
+                        template, submitter, payment_items, today
+                    ),
+                )
+
+            # 本次新生成消费截图 PDF 时，文档对象直接插入 All-in-One PDF，不必再解析一遍
+            billing_document = None
+
+            def create_billing_pdf() -> bytes:
+                nonlocal billing_document
+                billing_document = build_billing_document(payment_items, billing_layout)
+                return save_document(billing_document)
+
+            with METRICS.span("artifacts.billing_pdf"):
+                billing_pdf = artifact_cache.get_or_create(
+                    ("billing_pdf", fingerprint, billing_layout), create_billing_pdf
+                )
+                yield 1, billing_pdf
+
+            with METRICS.span("artifacts.allinone_pdf"):
+                yield 2, artifact_cache.get_or_create(
+                    ("allinone_pdf", fingerprint, billing_layout),
+                    lambda: generate_allinone_pdf(
+                        payment_items,
+                        billing_pdf if billing_document is None else billing_document,
+                        open_invoice=lambda file: document_cache.open(
+                            file.digest, lambda: file.path
+                        ),
+                    ),
+                )
 
-        self.worksheet["C5"] = self.application_submitter
-        self.worksheet["F5"] = today.format("YYYY.MM")
-        self.worksheet["C42"] = self.application_submitter
-        self.worksheet["F42"] = today.format("YYYY.MM.DD")
+        job = Job(ARTIFACTS, iter_artifacts(), name="artifacts").start()
+        st.session_state["artifact_job"] = {
+            "key": key,
+            "digests": {
+                file.digest
+                for item in payment_items
+                for file in item.invoice_files + item.billing_files
+            },
+            "today": today,
+            "job": job,
+        }
+        return job
+
+    def cancel_stale_artifact_job(self, digests: set[str]) -> None:
+        current = st.session_state.get("artifact_job")
+        if current is not None and not current["digests"] <= digests:
+            current["job"].cancel()
+            del st.session_state["artifact_job"]
 
-        for index, item in enumerate(payment_items):
-            row = index + 9
-            self.worksheet[f"B{row}"] = item.service_start
-            self.worksheet[f"C{row}"] = "200300"
-            self.worksheet[f"D{row}"] = "软件"
-            self.worksheet[f"E{row}"] = item.payment_item.capitalize()
-            self.worksheet[f"G{row}"] = item.rmb_amount
+    def part4_generate_reimbursement_application(
+        self, payment_items: list[PaymentItemData], data: bytes | None
+    ):
+        from app.artifacts import reimbursement_application_filename
+
+        st.subheader("生成彩云报销单")
+        if data is None:
+            st.info("报销单生成中…")
+            return
 
-        fp = BytesIO()
-        self.workbook.save(fp)
-        filename = f"{self.application_submitter}-{today.format('YYYYMMDD')}.xlsx"
+        today = st.session_state["artifact_job"]["today"]
+        filename = reimbursement_application_filename(self.application_submitter, today)
 
         st.success("报销单生成成功！")
-        st.download_button(label="下载报销单", data=fp, file_name=filename)
+        # 下载报销单时记入台账
+        st.download_button(
+            label="下载报销单",
+            data=data,
+            file_name=filename,
+            on_click=self.record_reimbursement,
+            args=(payment_items,),
+        )
 
-    def part5_generate_billing_pdf(
-        self, payment_items: list[PaymentItemData]
-    ) -> BytesIO:
-        st.subheader("生成信用卡消费截图 PDF")
+    def part5_generate_billing_pdf(self, billing_pdf: bytes | None):
+        import arrow
 
-        billing_files = sum([item.billing_files for item in payment_items], start=[])
-
-        page_width, page_height = fitz.paper_size("A4-L")
-        images_per_page = 4
-        page_margin = 20
-        inner_margin = 10
-        image_rects = [
-            fitz.Rect(
-                (page_width - 2 * page_margin - (images_per_page - 1) * inner_margin)
-                / images_per_page
-                * idx
-                + page_margin
-                + inner_margin * idx,
-                0,
-                (page_width - 2 * page_margin - (images_per_page - 1) * inner_margin)
-                / images_per_page
-                * (idx + 1)
-                + page_margin
-                + inner_margin * idx,
-                page_height,
-            )
-            for idx in range(images_per_page)
-        ]
-
-        billing_pdf = fitz.Document()
-        current_page = None
-        for idx, file in enumerate(billing_files):
-            page_idx = idx % images_per_page
-            if not current_page or page_idx == 0:
-                current_page = billing_pdf.new_page(
-                    pno=-1, width=page_width, height=page_height
-                )
-            current_page.insert_image(image_rects[page_idx], stream=file.getvalue())
+        from app.artifacts import billing_pdf_filename
+
+        st.subheader("生成信用卡消费截图 PDF")
+        if billing_pdf is None:
+            st.info("信用卡消费截图 PDF 生成中…")
+            return
 
-        fp = BytesIO()
-        billing_pdf.ez_save(fp)
         st.success("信用卡消费截图 PDF 生成成功！")
         st.download_button(
             label="下载信用卡消费截图 PDF",
-            data=fp,
-            file_name=f"信用卡消费截图-{arrow.now(tz='Asia/Shanghai').format('YYYYMMDD')}.pdf",
+            data=billing_pdf,
+            file_name=billing_pdf_filename(arrow.now(tz="Asia/Shanghai")),
         )
-        return fp
-
-    def part6_generate_allinone_pdf_for_printing(
-        self, payment_items: list[PaymentItemData], billing_pdf: BytesIO
-    ):
-        st.subheader("生成用于打印的 All-in-One PDF")
 
-        page_width, page_height = fitz.paper_size("A4")
-        allinone_pdf = fitz.Document(width=page_width, height=page_height)
+    def part6_generate_allinone_pdf_for_printing(self, allinone_pdf: bytes | None):
+        import arrow
 
-        for item_data in payment_items:
-            for file in item_data.invoice_files:
-                invoice_pdf = fitz.Document(stream=file.getvalue())
-                for pno in item_data.payment_item.printing_pages:
-                    allinone_pdf.insert_pdf(invoice_pdf, from_page=pno, to_page=pno)
-            if allinone_pdf.page_count % 2 == 1:
-                allinone_pdf.new_page(pno=-1, width=page_width, height=page_height)
+        from app.artifacts import allinone_pdf_filename
 
-        allinone_pdf.insert_pdf(fitz.Document(stream=billing_pdf.getvalue()), rotate=90)
+        st.subheader("生成用于打印的 All-in-One PDF")
+        if allinone_pdf is None:
+            st.info("All-in-One PDF 生成中…")
+            return
 
-        fp = BytesIO()
-        allinone_pdf.ez_save(fp)
         st.success("All-in-One PDF 生成成功！")
         st.download_button(
             label="下载 All-in-One PDF",
-            data=fp,
-            file_name=f"打印用 AllInOne -{arrow.now(tz='Asia/Shanghai').format('YYYYMMDD')}.pdf",  # noqa: E501
+            data=allinone_pdf,
+            file_name=allinone_pdf_filename(arrow.now(tz="Asia/Shanghai")),
         )
 
+    def show_metrics(self) -> None:
+        with st.sidebar.expander("性能指标"):
+            snapshot = METRICS.snapshot()
+            st.dataframe(
+                [
+                    {
+                        "阶段": stage,
+                        "次数": data["count"],
+                        "p50 (ms)": round(data["p50"] * 1000),
+                        "p95 (ms)": round(data["p95"] * 1000),
+                        "最大 (ms)": round(data["max"] * 1000),
+                    }
+                    for stage, data in snapshot["stages"].items()
+                ],
+                hide_index=True,
+            )
+            st.dataframe(
+                [
+                    {"计数器": name, "值": value}
+                    for name, value in snapshot["counters"].items()
+                ],
+                hide_index=True,
+            )
+            st.download_button("导出 JSON", METRICS.to_json(), file_name="metrics.json")
+            st.download_button(
+                "导出 Prometheus", METRICS.to_prometheus(), file_name="metrics.prom"
+            )
+        if self.metrics_path:
+            METRICS.write_if_due(
+                self.metrics_path, self.metrics_interval if self.polling else 0
+            )
+
     def run(self):
         st.set_page_config(layout="wide")
         st.title("彩云报销小助手 V2.0")
         st.write("上传账单 PDF 和信用卡消费截图，自动生成报销单和飞书审批内容。")
 
-        invoice_result, billing_result = self.part1_input_data()
-
-        st.divider()
-
-        payment_items = self.part2_process_data(invoice_result, billing_result)
-
-        st.divider()
-
-        st.header("生成")
-        col1, col2 = st.columns(2)
-
-        with col1:
-            self.part3_generate_copies(payment_items)
-        with col2:
-            self.part4_generate_reimbursement_application(payment_items)
-            billing_pdf = self.part5_generate_billing_pdf(payment_items)
-            self.part6_generate_allinone_pdf_for_printing(payment_items, billing_pdf)
+        try:
+            with METRICS.span("stapp.part1"):
+                invoice_result, billing_result = self.part1_input_data()
+
+            st.divider()
+
+            with METRICS.span("stapp.part2"):
+                payment_items = self.part2_process_data(invoice_result, billing_result)
+
+            st.divider()
+
+            st.header("生成")
+            col1, col2 = st.columns(2)
+
+            with col1:
+                with METRICS.span("stapp.part3"):
+                    self.part3_generate_copies(payment_items)
+            with col2:
+                # 三个文件在后台生成，先完成的先显示下载按钮
+                job = self.start_artifact_job(payment_items)
+                done = job.done
+                if job.error is not None:
+                    # 失败的任务不再复用，下次 rerun 时重新生成
+                    del st.session_state["artifact_job"]
+                    raise job.error
+                artifacts = job.results()
+                with METRICS.span("stapp.part4"):
+                    self.part4_generate_reimbursement_application(
+                        payment_items, artifacts.get("application")
+                    )
+                with METRICS.span("stapp.part5"):
+                    self.part5_generate_billing_pdf(artifacts.get("billing_pdf"))
+                with METRICS.span("stapp.part6"):
+                    self.part6_generate_allinone_pdf_for_printing(
+                        artifacts.get("allinone_pdf")
+                    )
+            if not done:
+                self.poll()
+        finally:
+            # part1/part2 在缺少输入时会 st.stop()，指标面板仍然要显示
+            self.show_metrics()
 
 
 if __name__ == "__main__":
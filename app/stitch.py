@@ -0,0 +1,107 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from app.ocr_backend import OCRWord
+
+# 阿里云通用文字识别要求图片长宽均不超过 8192 像素
+MAX_COMPOSITE_SIZE = 8192
+
+
+@dataclass(frozen=True)
+class Tile:
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+    def contains(self, word: OCRWord) -> bool:
+        x = word.x + word.width / 2
+        y = word.y + word.height / 2
+        return self.left <= x < self.right and self.top <= y < self.bottom
+
+
+def image_size(content: bytes | memoryview) -> tuple[int, int]:
+    """返回图片尺寸；无法识别的图片返回超出上限的尺寸，使其单独成组。"""
+    try:
+        with Image.open(BytesIO(content)) as image:
+            return ImageOps.exif_transpose(image).size
+    except Exception:
+        return MAX_COMPOSITE_SIZE + 1, MAX_COMPOSITE_SIZE + 1
+
+
+def plan_batches(
+    sizes: Sequence[tuple[int, int]],
+    tiles_per_request: int,
+    gap: int = 64,
+    max_size: int = MAX_COMPOSITE_SIZE,
+) -> list[list[int]]:
+    """把图片按输入顺序分组，每组横向拼接后宽高都不超过 max_size。"""
+    batches, batch, width = [], [], 0
+    for idx, (w, h) in enumerate(sizes):
+        if w > max_size or h > max_size:
+            if batch:
+                batches.append(batch)
+                batch, width = [], 0
+            batches.append([idx])
+            continue
+        if batch and (len(batch) >= tiles_per_request or width + gap + w > max_size):
+            batches.append(batch)
+            batch, width = [], 0
+        width += w + (gap if batch else 0)
+        batch.append(idx)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def compose_tiles(
+    contents: Sequence[bytes | memoryview],
+    gap: int = 64,
+    grayscale: bool = True,
+    quality: int = 90,
+) -> tuple[bytes, list[Tile]]:
+    mode = "L" if grayscale else "RGB"
+    images = []
+    for content in contents:
+        with Image.open(BytesIO(content)) as image:
+            images.append(ImageOps.exif_transpose(image).convert(mode))
+
+    width = sum(image.width for image in images) + gap * (len(images) - 1)
+    height = max(image.height for image in images)
+    canvas = Image.new(mode, (width, height), "white")
+
+    tiles, left = [], 0
+    for image in images:
+        canvas.paste(image, (left, 0))
+        tiles.append(Tile(left, 0, left + image.width, image.height))
+        left += image.width + gap
+
+    fp = BytesIO()
+    canvas.save(fp, format="JPEG", quality=quality)
+    return fp.getvalue(), tiles
+
+
+def split_words(words: Sequence[OCRWord], tiles: Sequence[Tile]) -> list[str]:
+    """按坐标把拼接图的识别结果拆回各个子图，子图内按行从上到下、行内从左到右排列。"""
+    texts = []
+    for tile in tiles:
+        tile_words = sorted(
+            (word for word in words if tile.contains(word)), key=lambda w: w.y
+        )
+        lines: list[list[OCRWord]] = []
+        for word in tile_words:
+            # 中心点落在当前行首个词的上下范围内，视为同一行
+            center_y = word.y + word.height / 2
+            if lines and center_y < lines[-1][0].y + lines[-1][0].height:
+                lines[-1].append(word)
+            else:
+                lines.append([word])
+        texts.append(
+            " ".join(
+                word.word for line in lines for word in sorted(line, key=lambda w: w.x)
+            )
+        )
+    return texts
@@ -0,0 +1,184 @@
+"""上传文件的落盘存储。
+
+每个文件按 SHA-256 只写入临时目录一次，之后以只读内存映射的方式读取：
+Pillow、hashlib 和 OCR 客户端直接使用映射出的 memoryview，PyMuPDF 按路径打开，
+同一个文件不会在内存中出现多份副本，读到的页面由操作系统按需换入换出。
+存储被回收（Streamlit session 结束）或进程退出时删除临时目录。
+"""
+
+import hashlib
+import mmap
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import weakref
+
+from app.metrics import METRICS
+
+# 从上传缓冲区或请求体中逐块写入时每次读取的字节数
+CHUNK_SIZE = 1024 * 1024
+
+
+class StoredFile:
+    """满足 NamedFile 协议，getvalue() 返回只读的内存映射，不复制文件内容。
+
+    只是指向存储中文件的句柄，复制（包括 dataclasses.asdict 中的深复制）时返回自身。
+    """
+
+    def __init__(self, name: str, digest: str, store: "UploadStore") -> None:
+        self.name = name
+        self.digest = digest
+        self.store = store
+
+    def __repr__(self) -> str:
+        return f"StoredFile(name={self.name!r}, digest={self.digest[:12]!r})"
+
+    def __copy__(self) -> "StoredFile":
+        return self
+
+    def __deepcopy__(self, memo: dict) -> "StoredFile":
+        return self
+
+    @property
+    def path(self) -> pathlib.Path:
+        return self.store.path(self.digest)
+
+    def getvalue(self) -> memoryview:
+        return self.store.buffer(self.digest)
+
+
+def file_digest(file: StoredFile) -> str:
+    """供台账、文件指纹等按文件取哈希的地方使用，哈希在写入时已经算好。"""
+    return file.digest
+
+
+class UploadWriter:
+    """逐块写入一个文件，边写边计算 SHA-256，commit() 后按哈希放入存储。"""
+
+    def __init__(self, store: "UploadStore", name: str) -> None:
+        self.store = store
+        self.name = name
+        self._hash = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=store.directory)
+        self._file = os.fdopen(fd, "wb")
+        self._tmp_path = pathlib.Path(tmp_path)
+
+    def write(self, chunk: bytes | memoryview) -> None:
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self) -> StoredFile:
+        self._file.close()
+        return self.store._commit(self.name, self._hash.hexdigest(), self._tmp_path)
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "UploadWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.abort()
+
+
+def _cleanup(directory: pathlib.Path, maps: dict[str, mmap.mmap]) -> None:
+    for m in maps.values():
+        try:
+            m.close()
+        except BufferError:
+            # 仍有 memoryview（如缓存中的 PDF 文档）引用映射，随引用释放自动关闭；
+            # 文件删除后映射依然有效
+            pass
+    maps.clear()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class UploadStore:
+    """按内容寻址的上传文件存储，线程安全。
+
+    directory 是放置临时目录的位置，默认使用系统临时目录。
+    """
+
+    def __init__(self, directory: str | pathlib.Path | None = None) -> None:
+        if directory is not None:
+            pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+        self.directory = pathlib.Path(
+            tempfile.mkdtemp(prefix="uploads-", dir=directory)
+        )
+        self._maps: dict[str, mmap.mmap] = {}
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, _cleanup, self.directory, self._maps)
+
+    def path(self, digest: str) -> pathlib.Path:
+        return self.directory / digest
+
+    def writer(self, name: str) -> UploadWriter:
+        return UploadWriter(self, name)
+
+    def put(self, name: str, content: bytes | memoryview) -> StoredFile:
+        """写入一个已在内存中的文件（如 UploadedFile.getbuffer()），内容相同的只写一次。"""
+        digest = hashlib.sha256(content).hexdigest()
+        if self.path(digest).exists():
+            METRICS.incr("upload_store.hits")
+            return StoredFile(name=name, digest=digest, store=self)
+        with self.writer(name) as writer:
+            view = memoryview(content)
+            for start in range(0, len(view), CHUNK_SIZE):
+                writer.write(view[start : start + CHUNK_SIZE])
+            return writer.commit()
+
+    def _commit(self, name: str, digest: str, tmp_path: pathlib.Path) -> StoredFile:
+        path = self.path(digest)
+        with self._lock:
+            if path.exists():
+                METRICS.incr("upload_store.hits")
+                tmp_path.unlink()
+            else:
+                METRICS.incr("upload_store.writes")
+                os.replace(tmp_path, path)
+        return StoredFile(name=name, digest=digest, store=self)
+
+    def buffer(self, digest: str) -> memoryview:
+        """文件内容的只读 memoryview，同一个文件只映射一次。"""
+        with self._lock:
+            m = self._maps.get(digest)
+            if m is None:
+                with open(self.path(digest), "rb") as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        # 长度为 0 的文件不能映射
+                        return memoryview(b"")
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[digest] = m
+        return memoryview(m)
+
+    def retain(self, digests: set[str]) -> None:
+        """删除不在 digests 中的文件，用于上传列表中移除文件之后。"""
+        with self._lock:
+            for path in self.directory.iterdir():
+                if path.name in digests or path.suffix == ".part":
+                    continue
+                m = self._maps.pop(path.name, None)
+                if m is not None:
+                    try:
+                        m.close()
+                    except BufferError:
+                        pass
+                path.unlink(missing_ok=True)
+                METRICS.incr("upload_store.removed")
+
+    def __contains__(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def __len__(self) -> int:
+        return sum(1 for path in self.directory.iterdir() if path.suffix != ".part")
+
+    def close(self) -> None:
+        self._finalizer()
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
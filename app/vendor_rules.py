@@ -0,0 +1,93 @@
+import os
+import pathlib
+import re
+import tomllib
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_RULES_PATH = pathlib.Path(__file__).with_name("vendor_rules.toml")
+
+
+@dataclass(frozen=True)
+class VendorRule:
+    key: str
+    member: str
+    priority: int
+    name: str
+    description: str
+    printing_pages: tuple[int, ...]
+    invoice_keywords: tuple[str, ...]
+    billing_keywords: tuple[str, ...]
+    paid_regex: re.Pattern
+    service_start_regex: re.Pattern
+    service_through_regex: re.Pattern
+    date_format: str
+    sort_text: bool = True
+
+    @property
+    def invoice_regexes(self) -> tuple[re.Pattern, ...]:
+        return (self.paid_regex, self.service_start_regex, self.service_through_regex)
+
+
+class KeywordMatcher(Generic[T]):
+    """把所有关键字编译进一个正则，扫描一遍文本即可找出出现的全部关键字。
+
+    多个关键字同时出现时，返回 `keywords` 中排在前面的关键字对应的值。
+    """
+
+    def __init__(self, keywords: Mapping[str, T]) -> None:
+        self.keywords = dict(keywords)
+        self._order = {keyword: idx for idx, keyword in enumerate(self.keywords)}
+        # 零宽前瞻可以找出相互重叠的关键字，较长的关键字放在前面
+        alternation = "|".join(
+            re.escape(keyword)
+            for keyword in sorted(self.keywords, key=len, reverse=True)
+        )
+        self.pattern = re.compile(f"(?=({alternation}))")
+
+    def match(self, content: str) -> T | None:
+        if not self.keywords:
+            return None
+        found = {m.group(1) for m in self.pattern.finditer(content)}
+        if not found:
+            return None
+        return self.keywords[min(found, key=self._order.__getitem__)]
+
+
+def load_vendor_rules(path: str | pathlib.Path) -> dict[str, VendorRule]:
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+
+    rules = {}
+    for item in config["vendor"]:
+        rule = VendorRule(
+            key=item["key"],
+            member=item["member"],
+            priority=item.get("priority", len(rules)),
+            name=item["name"],
+            description=item["description"],
+            printing_pages=tuple(item["printing_pages"]),
+            invoice_keywords=tuple(item["invoice_keywords"]),
+            billing_keywords=tuple(item["billing_keywords"]),
+            paid_regex=re.compile(item["paid_regex"]),
+            service_start_regex=re.compile(item["service_start_regex"]),
+            service_through_regex=re.compile(item["service_through_regex"]),
+            date_format=item["date_format"],
+            sort_text=item.get("sort_text", True),
+        )
+        if rule.key in rules:
+            raise ValueError(f"Duplicate vendor key {rule.key} in {path}")
+        rules[rule.key] = rule
+    return rules
+
+
+def by_priority(rules: Mapping[str, VendorRule]) -> list[VendorRule]:
+    return sorted(rules.values(), key=lambda rule: rule.priority)
+
+
+VENDOR_RULES = load_vendor_rules(
+    os.environ.get("VENDOR_RULES_PATH", DEFAULT_RULES_PATH)
+)
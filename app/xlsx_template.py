@@ -0,0 +1,144 @@
+import pathlib
+import posixpath
+import re
+import zipfile
+from decimal import Decimal
+from io import BytesIO
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+NS = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+}
+
+SHEET_DATA_RE = re.compile(r"<sheetData\s*/>|<sheetData\b[^>]*>(.*?)</sheetData>", re.S)
+ROW_RE = re.compile(r'<row\b[^>]*?\sr="(\d+)"[^>]*?(?:/>|>(.*?)</row>)', re.S)
+CELL_RE = re.compile(r'<c\b[^>]*?\sr="([A-Z]+)(\d+)"[^>]*?(?:/>|>.*?</c>)', re.S)
+STYLE_RE = re.compile(r'\ss="(\d+)"')
+CELL_REF_RE = re.compile(r"([A-Z]+)(\d+)")
+CALC_PR_RE = re.compile(r"<calcPr\b([^>]*?)/>")
+
+CellValue = str | int | float | Decimal
+
+
+def column_index(column: str) -> int:
+    index = 0
+    for char in column:
+        index = index * 26 + ord(char) - ord("A") + 1
+    return index
+
+
+class XlsxTemplate:
+    """只读取并索引一次的 xlsx/xlsm 模板。
+
+    `render` 时只改写目标 sheet XML 中的单元格，其余部分（样式、VBA 工程等）
+    按原样写回 zip，不经过 openpyxl 的完整加载和保存。
+    """
+
+    def __init__(self, content: bytes, sheet_name: str) -> None:
+        with zipfile.ZipFile(BytesIO(content)) as zf:
+            self.entries = [(info, zf.read(info)) for info in zf.infolist()]
+        parts = {info.filename: data for info, data in self.entries}
+
+        self.sheet_path = self._find_sheet_path(parts, sheet_name)
+        self.sheet_xml = parts[self.sheet_path].decode("utf-8")
+        sheet_data_match = SHEET_DATA_RE.search(self.sheet_xml)
+        if sheet_data_match is None:
+            raise ValueError(f"Could not find sheetData in {self.sheet_path}")
+        self._sheet_data_span = sheet_data_match.span()
+        self.rows = {
+            int(m.group(1)): m.group(0)
+            for m in ROW_RE.finditer(sheet_data_match.group(1) or "")
+        }
+
+        # 让 Excel 打开时重新计算公式，否则合计等公式单元格会显示模板里的旧值
+        self.workbook_xml = CALC_PR_RE.sub(
+            lambda m: "<calcPr"
+            + re.sub(r'\sfullCalcOnLoad="\w+"', "", m.group(1))
+            + ' fullCalcOnLoad="1"/>',
+            parts["xl/workbook.xml"].decode("utf-8"),
+        )
+
+    @classmethod
+    def load(cls, path: str | pathlib.Path, sheet_name: str) -> "XlsxTemplate":
+        return cls(pathlib.Path(path).read_bytes(), sheet_name)
+
+    @staticmethod
+    def _find_sheet_path(parts: dict[str, bytes], sheet_name: str) -> str:
+        workbook = ElementTree.fromstring(parts["xl/workbook.xml"])
+        for sheet in workbook.iterfind("main:sheets/main:sheet", NS):
+            if sheet.get("name") == sheet_name:
+                rel_id = sheet.get(f"{{{NS['r']}}}id")
+                break
+        else:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+
+        rels = ElementTree.fromstring(parts["xl/_rels/workbook.xml.rels"])
+        for rel in rels.iterfind("rel:Relationship", NS):
+            if rel.get("Id") == rel_id:
+                target = rel.get("Target")
+                if target.startswith("/"):
+                    return target.lstrip("/")
+                return posixpath.normpath(posixpath.join("xl", target))
+        raise KeyError(f"Relationship {rel_id} does not exist.")
+
+    @staticmethod
+    def _cell_xml(ref: str, value: CellValue, old_cell: str | None) -> str:
+        style_match = STYLE_RE.search(old_cell) if old_cell else None
+        style = f' s="{style_match.group(1)}"' if style_match else ""
+        if isinstance(value, str):
+            return (
+                f'<c r="{ref}"{style} t="inlineStr">'
+                f'<is><t xml:space="preserve">{escape(value)}</t></is></c>'
+            )
+        return f'<c r="{ref}"{style}><v>{value}</v></c>'
+
+    def _patch_row(self, row: int, values: dict[str, CellValue]) -> str:
+        row_xml = self.rows.get(row)
+        if row_xml is None:
+            start_tag, cells_xml = f'<row r="{row}">', ""
+        else:
+            row_match = ROW_RE.fullmatch(row_xml)
+            cells_xml = row_match.group(2) or ""
+            start_tag = row_xml[: row_xml.index(">") + 1].replace("/>", ">")
+            # spans 只是列范围提示，新增单元格后可能不再准确，直接去掉
+            start_tag = re.sub(r'\sspans="[^"]*"', "", start_tag)
+
+        cells = {
+            column_index(m.group(1)): (m.group(1) + m.group(2), m.group(0))
+            for m in CELL_RE.finditer(cells_xml)
+        }
+        for ref, value in values.items():
+            column = CELL_REF_RE.fullmatch(ref).group(1)
+            old_cell = cells.get(column_index(column), (None, None))[1]
+            cells[column_index(column)] = (ref, self._cell_xml(ref, value, old_cell))
+        return start_tag + "".join(cells[key][1] for key in sorted(cells)) + "</row>"
+
+    def render(self, values: dict[str, CellValue]) -> bytes:
+        values_by_row: dict[int, dict[str, CellValue]] = {}
+        for ref, value in values.items():
+            ref_match = CELL_REF_RE.fullmatch(ref)
+            if ref_match is None:
+                raise ValueError(f"Invalid cell reference {ref}")
+            values_by_row.setdefault(int(ref_match.group(2)), {})[ref] = value
+
+        rows = dict(self.rows)
+        for row, row_values in values_by_row.items():
+            rows[row] = self._patch_row(row, row_values)
+        sheet_data = "<sheetData>" + "".join(rows[key] for key in sorted(rows))
+        start, end = self._sheet_data_span
+        sheet_xml = (
+            self.sheet_xml[:start] + sheet_data + "</sheetData>" + self.sheet_xml[end:]
+        )
+
+        fp = BytesIO()
+        with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for info, data in self.entries:
+                if info.filename == self.sheet_path:
+                    data = sheet_xml.encode("utf-8")
+                elif info.filename == "xl/workbook.xml":
+                    data = self.workbook_xml.encode("utf-8")
+                zf.writestr(info, data)
+        return fp.getvalue()
@@ -0,0 +1,106 @@
+"""冷启动导入耗时报告。
+
+    python -m benchmarks.importtime -o benchmarks/results/importtime.json
+
+在新进程中用 `python -X importtime` 导入 app.stapp，按累计耗时列出最慢的模块。
+首屏不需要的重依赖（PyMuPDF、阿里云 SDK 等）如果在导入时被加载，返回非 0 退出码。
+"""
+
+import argparse
+import json
+import pathlib
+import re
+import subprocess
+import sys
+from dataclasses import asdict, dataclass
+
+# 这些依赖应在第一次用到时才导入
+DEFERRED_MODULES = ("fitz", "pymupdf", "openpyxl", "arrow", "alibabacloud_tea_openapi")
+
+IMPORTTIME_REGEX = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+@dataclass
+class ImportTime:
+    module: str
+    # 单位为微秒，与 -X importtime 的输出一致
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> list[ImportTime]:
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_REGEX.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append(
+                ImportTime(
+                    module=module,
+                    self_us=int(self_us),
+                    cumulative_us=int(cumulative_us),
+                    depth=len(indent) // 2,
+                )
+            )
+    return imports
+
+
+def profile_import(module: str = "app.stapp") -> list[ImportTime]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(proc.stderr)
+
+
+def build_report(imports: list[ImportTime], module: str, top: int = 20) -> dict:
+    total = next(
+        (item.cumulative_us for item in imports if item.module == module), None
+    )
+    loaded = {item.module.split(".")[0] for item in imports}
+    return {
+        "module": module,
+        "total_us": total,
+        "deferred_loaded": [name for name in DEFERRED_MODULES if name in loaded],
+        "slowest": [
+            asdict(item)
+            for item in sorted(imports, key=lambda item: -item.cumulative_us)[:top]
+        ],
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.importtime", description="冷启动导入耗时报告"
+    )
+    parser.add_argument("--module", default="app.stapp")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("-o", "--output", type=pathlib.Path)
+    args = parser.parse_args(argv)
+
+    report = build_report(profile_import(args.module), args.module, args.top)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+    print(f"import {args.module}: {report['total_us'] / 1000:.1f} ms", file=sys.stderr)
+    for item in report["slowest"]:
+        print(
+            f"{item['cumulative_us'] / 1000:>9.1f} ms  "
+            f"{'  ' * item['depth']}{item['module']}",
+            file=sys.stderr,
+        )
+    if report["deferred_loaded"]:
+        print(
+            f"首屏导入了应延迟加载的模块：{', '.join(report['deferred_loaded'])}",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
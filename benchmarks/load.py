@@ -0,0 +1,199 @@
+"""HTTP 服务模式的压测：本地启动 OCR 替身和报销服务，模拟多人同时提交。
+
+    python -m benchmarks.load --clients 20 --files 10 --ocr-latency 0.3
+
+每个客户端提交不同的合成账单和截图（内容不重复，OCR 缓存不会命中），
+依次提交 --requests 次，遇到 503 按 Retry-After 重试。
+结果包括请求延迟的 p50/p95、被拒绝的次数、OCR 调用次数和服务端各阶段的耗时。
+"""
+
+import argparse
+import asyncio
+import json
+import pathlib
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+
+import aiohttp
+from aiohttp import web
+
+from app.metrics import METRICS, percentile
+from app.service import ReimbursementService, ServiceConfig
+from benchmarks.ocr_server import StandInOCR
+from benchmarks.run import save_template
+from benchmarks.synthetic import SyntheticBilling, SyntheticInvoice, make_dataset
+
+
+@dataclass
+class LoadResult:
+    clients: int
+    files: int
+    requests: int
+    seconds: float
+    throughput: float
+    p50: float
+    p95: float
+    # 收到 503 后重试的次数
+    rejected: int
+    failed: int
+    ocr_requests: int
+
+
+async def start_site(app: web.Application) -> tuple[web.AppRunner, int]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+def make_form(
+    invoices: list[SyntheticInvoice], billings: list[SyntheticBilling]
+) -> aiohttp.FormData:
+    form = aiohttp.FormData()
+    for idx, invoice in enumerate(invoices):
+        form.add_field("invoice", invoice.content, filename=f"invoice-{idx}.pdf")
+    for idx, billing in enumerate(billings):
+        form.add_field("billing", billing.content, filename=f"billing-{idx}.png")
+    return form
+
+
+async def run_client(
+    session: aiohttp.ClientSession,
+    url: str,
+    dataset: tuple[list[SyntheticInvoice], list[SyntheticBilling]],
+    requests: int,
+    latencies: list[float],
+) -> tuple[int, int]:
+    rejected = failed = 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        while True:
+            async with session.post(url, data=make_form(*dataset)) as response:
+                await response.read()
+                if response.status != 503:
+                    break
+                rejected += 1
+                await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+        latencies.append(time.perf_counter() - start)
+        failed += response.status != 200
+    return rejected, failed
+
+
+async def run_load(
+    clients: int,
+    files: int,
+    requests: int = 1,
+    ocr_latency: float = 0.0,
+    config: ServiceConfig | None = None,
+) -> LoadResult:
+    # 截图内容只取决于序号，生成一份数据集再切给各个客户端，保证互不重复
+    invoices, billings = make_dataset(clients * files)
+    datasets = [
+        (invoices[start : start + files], billings[start : start + files])
+        for start in range(0, clients * files, files)
+    ]
+    ocr = StandInOCR(billings, ocr_latency)
+    ocr_runner, ocr_port = await start_site(ocr.make_app())
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        template_path = save_template(directory)
+        secrets = {
+            "aliyun_ocr": {
+                "access_key_id": "load",
+                "access_key_secret": "load",
+                "endpoint": f"127.0.0.1:{ocr_port}",
+                "protocol": "http",
+            },
+            "submitters": {"load": {"name": "压测", "template_path": str(template_path)}},
+            "ocr_cache": {"path": str(directory / "ocr.sqlite3")},
+            "ledger": {"enabled": False},
+            "preprocess": {"enabled": False},
+        }
+        service = ReimbursementService(
+            secrets, config or ServiceConfig(ocr_qps=None, ocr_workers=32)
+        )
+        service_runner, service_port = await start_site(service.make_app())
+        url = f"http://127.0.0.1:{service_port}/reimbursements?submitter=load"
+
+        latencies: list[float] = []
+        start = time.perf_counter()
+        try:
+            async with aiohttp.ClientSession() as session:
+                outcomes = await asyncio.gather(
+                    *(
+                        run_client(session, url, dataset, requests, latencies)
+                        for dataset in datasets
+                    )
+                )
+        finally:
+            seconds = time.perf_counter() - start
+            await service_runner.cleanup()
+            await ocr_runner.cleanup()
+
+    return LoadResult(
+        clients=clients,
+        files=files,
+        requests=len(latencies),
+        seconds=seconds,
+        throughput=len(latencies) / seconds,
+        p50=percentile(latencies, 0.5),
+        p95=percentile(latencies, 0.95),
+        rejected=sum(rejected for rejected, _ in outcomes),
+        failed=sum(failed for _, failed in outcomes),
+        ocr_requests=ocr.requests,
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load", description="HTTP 服务模式的压测"
+    )
+    parser.add_argument("--clients", type=int, default=10, help="同时提交的客户端数")
+    parser.add_argument("--files", type=int, default=10, help="每次提交的账单数")
+    parser.add_argument("--requests", type=int, default=1, help="每个客户端提交的次数")
+    parser.add_argument("--ocr-latency", type=float, default=0.3)
+    parser.add_argument("--max-active", type=int, default=ServiceConfig.max_active)
+    parser.add_argument("--max-queued", type=int, default=ServiceConfig.max_queued)
+    parser.add_argument(
+        "--invoice-workers", type=int, default=ServiceConfig.invoice_workers
+    )
+    parser.add_argument("--ocr-workers", type=int, default=32)
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=pathlib.Path,
+        default=pathlib.Path("benchmarks/results/load.json"),
+    )
+    args = parser.parse_args(argv)
+
+    config = ServiceConfig(
+        max_active=args.max_active,
+        max_queued=args.max_queued,
+        invoice_workers=args.invoice_workers,
+        ocr_workers=args.ocr_workers,
+        ocr_qps=None,
+    )
+    result = asyncio.run(
+        run_load(args.clients, args.files, args.requests, args.ocr_latency, config)
+    )
+    report = {"result": asdict(result), "metrics": METRICS.snapshot()}
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+    print(
+        f"{result.requests} requests in {result.seconds:.1f} s "
+        f"({result.throughput:.2f} req/s)  "
+        f"p50 {result.p50 * 1000:.0f} ms  p95 {result.p95 * 1000:.0f} ms  "
+        f"rejected {result.rejected}  failed {result.failed}  "
+        f"ocr {result.ocr_requests}",
+        file=sys.stderr,
+    )
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
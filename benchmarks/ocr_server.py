@@ -0,0 +1,93 @@
+"""本地的阿里云 OCR 替身服务，用于压测，不消耗真实的 OCR 调用。
+
+    python -m benchmarks.ocr_server --port 9100 --count 1000 --latency 0.3
+
+按 RecognizeGeneral 的响应格式返回预置的文本：请求体（截图）的 SHA-256 命中
+make_dataset 生成的消费截图时返回对应的 OCR 文本，否则返回空文本。
+--latency 模拟每次识别的耗时，--max-concurrency 之外的请求返回 429 模拟限流。
+配置中把 [aliyun_ocr] 的 endpoint 设为 "127.0.0.1:9100"、protocol 设为 "http" 即可使用。
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import uuid
+
+from aiohttp import web
+
+from benchmarks.synthetic import SyntheticBilling, make_dataset
+
+
+class StandInOCR:
+    def __init__(
+        self,
+        billings: list[SyntheticBilling],
+        latency: float = 0.0,
+        max_concurrency: int | None = None,
+    ) -> None:
+        self.texts = {
+            hashlib.sha256(billing.content).hexdigest(): billing.ocr_text
+            for billing in billings
+        }
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.requests = 0
+        self.throttled = 0
+
+    async def recognize(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.max_concurrency is not None and self.active >= self.max_concurrency:
+            self.throttled += 1
+            return web.json_response(
+                {
+                    "RequestId": str(uuid.uuid4()),
+                    "Code": "Throttling.User",
+                    "Message": "Request was denied due to user flow control.",
+                },
+                status=429,
+            )
+
+        self.active += 1
+        try:
+            body = await request.read()
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+        text = self.texts.get(hashlib.sha256(body).hexdigest(), "")
+        return web.json_response(
+            {
+                "RequestId": str(uuid.uuid4()),
+                "Data": json.dumps(
+                    {"content": text, "prism_wordsInfo": []}, ensure_ascii=False
+                ),
+            }
+        )
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/{tail:.*}", self.recognize)
+        return app
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.ocr_server", description="本地的阿里云 OCR 替身服务"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--count", type=int, default=1000, help="预置的截图数量")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="每次识别的秒数")
+    parser.add_argument("--max-concurrency", type=int, help="超出时返回 429")
+    args = parser.parse_args(argv)
+
+    _, billings = make_dataset(args.count, seed=args.seed)
+    ocr = StandInOCR(billings, args.latency, args.max_concurrency)
+    web.run_app(ocr.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""解析、校验和生成报销文件的基准测试。
+
+    python -m benchmarks.run --sizes 10 100 1000 -o benchmarks/results/latest.json
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json
+
+结果写成 JSON：每个 (基准, 文件数) 一条记录，包含总耗时、吞吐量和 p50/p95。
+指定 --baseline 时与基线比较，p50 变慢超过 --tolerance 的记录视为回退，返回非 0 退出码。
+"""
+
+import argparse
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+
+import arrow
+import openpyxl
+
+from app.artifacts import (
+    APPLICATION_SHEET_NAME,
+    build_billing_document,
+    generate_allinone_pdf,
+    generate_reimbursement_application,
+    save_document,
+)
+from app.common import LocalFile, PaymentItem
+from app.ledger import Ledger
+from app.metrics import percentile
+from app.ocr_cache import sha256_digest
+from app.parse_billing import BillingParser
+from app.parse_invoice import InvoiceParser
+from app.reconcile import PaymentItemData, reconcile
+from app.xlsx_template import XlsxTemplate
+from benchmarks.synthetic import SyntheticBilling, SyntheticInvoice, make_dataset
+
+DEFAULT_SIZES = (10, 100, 1000)
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    files: int
+    samples: int
+    seconds: float
+    throughput: float
+    # 分位数的样本：逐文件基准为单个文件的耗时，批量基准为每轮的总耗时
+    p50: float
+    p95: float
+
+
+class CannedOCR:
+    """按截图内容返回预置的 OCR 文本，代替阿里云 OCR 客户端。"""
+
+    def __init__(self, billings: list[SyntheticBilling]) -> None:
+        self.texts = {billing.content: billing.ocr_text for billing in billings}
+
+    def request(self, filename: bytes) -> str:
+        return self.texts[filename]
+
+
+def per_file(name: str, func: Callable[[bytes], object], contents: list[bytes]):
+    latencies = []
+    for content in contents:
+        start = time.perf_counter()
+        func(content)
+        latencies.append(time.perf_counter() - start)
+    total = sum(latencies)
+    return BenchmarkResult(
+        name=name,
+        files=len(contents),
+        samples=len(latencies),
+        seconds=total,
+        throughput=len(contents) / total,
+        p50=percentile(latencies, 0.5),
+        p95=percentile(latencies, 0.95),
+    )
+
+
+def batch(name: str, files: int, func: Callable[[], object], repeat: int):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    p50 = percentile(durations, 0.5)
+    return BenchmarkResult(
+        name=name,
+        files=files,
+        samples=repeat,
+        seconds=sum(durations),
+        throughput=files / p50,
+        p50=p50,
+        p95=percentile(durations, 0.95),
+    )
+
+
+def save_template(directory: pathlib.Path) -> pathlib.Path:
+    workbook = openpyxl.Workbook()
+    workbook.active.title = APPLICATION_SHEET_NAME
+    path = directory / "template.xlsx"
+    workbook.save(path)
+    return path
+
+
+def make_template(directory: pathlib.Path) -> XlsxTemplate:
+    return XlsxTemplate.load(save_template(directory), APPLICATION_SHEET_NAME)
+
+
+def file_digest(file: LocalFile) -> str:
+    return sha256_digest(file.getvalue())
+
+
+def make_ledger(directory: pathlib.Path, years: int = 10) -> Ledger:
+    """每种账单每月报销一次的台账。"""
+    ledger = Ledger(directory / "ledger.sqlite3")
+    for month in range(years * 12):
+        year, month = 2014 + month // 12, month % 12 + 1
+        payment_items = [
+            PaymentItemData(
+                payment_item=payment_item,
+                usd_amount=Decimal("4.00"),
+                rmb_amount=Decimal("28.00"),
+                service_start=f"{year}.{month:02d}.01",
+                service_through=f"{year}.{month:02d}.28",
+                invoice_files=[
+                    LocalFile(
+                        name=f"{payment_item}.pdf",
+                        content=f"{payment_item}-{year}-{month}".encode(),
+                    )
+                ],
+                billing_files=[],
+            )
+            for payment_item in PaymentItem
+        ]
+        ledger.record(f"{year}-{month}", "张三", payment_items, file_digest)
+    return ledger
+
+
+def run_size(
+    invoices: list[SyntheticInvoice],
+    billings: list[SyntheticBilling],
+    template: XlsxTemplate,
+    repeat: int,
+) -> list[BenchmarkResult]:
+    count = len(invoices)
+    invoice_parser = InvoiceParser()
+    billing_parser = BillingParser("id", "secret")
+    billing_parser.aliyun_ocr_client = CannedOCR(billings)
+    invoice_contents = [invoice.content for invoice in invoices]
+    billing_contents = [billing.content for billing in billings]
+
+    results = [
+        per_file("invoice.parse_info", invoice_parser.parse_info, invoice_contents),
+        batch(
+            "invoice.parse_many",
+            count,
+            lambda: invoice_parser.parse_many(invoice_contents),
+            repeat,
+        ),
+        per_file(
+            "billing.parse_content",
+            lambda content: BillingParser.parse_content(
+                billing_parser.aliyun_ocr_client.request(content), "benchmark"
+            ),
+            billing_contents,
+        ),
+        batch(
+            "billing.parse_many",
+            count,
+            lambda: billing_parser.parse_many(billing_contents, qps=None),
+            repeat,
+        ),
+    ]
+
+    invoice_result = [
+        (LocalFile(name=f"invoice-{idx}.pdf", content=content), result.info)
+        for idx, (content, result) in enumerate(
+            zip(invoice_contents, invoice_parser.parse_many(invoice_contents))
+        )
+    ]
+    billing_result = [
+        (LocalFile(name=f"billing-{idx}.png", content=content), result.info)
+        for idx, (content, result) in enumerate(
+            zip(billing_contents, billing_parser.parse_many(billing_contents, qps=None))
+        )
+    ]
+    # 与 part1 一致，校验前按账单类型和金额排序
+    invoice_result.sort(key=lambda x: (x[1].payment_item, x[1].paid))
+    billing_result.sort(key=lambda x: (x[1].payment_item, x[1].usd_amount))
+    results.append(
+        batch(
+            "reconcile",
+            count,
+            lambda: reconcile(invoice_result, billing_result),
+            repeat,
+        )
+    )
+
+    payment_items = reconcile(invoice_result, billing_result)
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = make_ledger(pathlib.Path(directory))
+        results.append(
+            batch(
+                "ledger.check",
+                count,
+                lambda: ledger.check(payment_items, file_digest),
+                repeat,
+            )
+        )
+
+    today = arrow.get("2023-09-01")
+    billing_pdf = save_document(build_billing_document(payment_items))
+    results += [
+        batch(
+            "artifacts.application",
+            count,
+            lambda: generate_reimbursement_application(
+                template, "张三", payment_items, today
+            ),
+            repeat,
+        ),
+        batch(
+            "artifacts.billing_pdf",
+            count,
+            lambda: save_document(build_billing_document(payment_items)),
+            repeat,
+        ),
+        batch(
+            "artifacts.allinone_pdf",
+            count,
+            lambda: generate_allinone_pdf(payment_items, billing_pdf),
+            repeat,
+        ),
+    ]
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes: list[int], repeat: int = 3, seed: int = 0) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        template = make_template(pathlib.Path(directory))
+        for size in sizes:
+            invoices, billings = make_dataset(size, seed=seed)
+            results += run_size(invoices, billings, template, repeat)
+    return {
+        "meta": {
+            "time": arrow.now().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": [asdict(result) for result in results],
+    }
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    baseline_p50 = {
+        (result["name"], result["files"]): result["p50"]
+        for result in baseline["results"]
+    }
+    regressions = []
+    for result in report["results"]:
+        expected = baseline_p50.get((result["name"], result["files"]))
+        if expected and result["p50"] > expected * (1 + tolerance):
+            regressions.append(
+                f"{result['name']}[{result['files']}]: "
+                f"p50 {result['p50'] * 1000:.2f} ms > "
+                f"baseline {expected * 1000:.2f} ms"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="解析、校验和生成报销文件的基准测试",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeat", type=int, default=3, help="批量基准的重复轮数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=pathlib.Path,
+        default=pathlib.Path("benchmarks/results/latest.json"),
+    )
+    parser.add_argument("--baseline", type=pathlib.Path, help="用于比较的基线结果")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="p50 允许变慢的比例")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, repeat=args.repeat, seed=args.seed)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+    for result in report["results"]:
+        print(
+            f"{result['name']:<24}{result['files']:>6} files"
+            f"{result['throughput']:>12.1f} files/s"
+            f"  p50 {result['p50'] * 1000:>9.2f} ms"
+            f"  p95 {result['p95'] * 1000:>9.2f} ms",
+            file=sys.stderr,
+        )
+
+    if args.baseline:
+        regressions = find_regressions(
+            report, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print(f"回退：{regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
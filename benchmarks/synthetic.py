@@ -0,0 +1,176 @@
+"""按各账单的版式生成合成账单 PDF、消费截图和对应的 OCR 文本。"""
+
+import random
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+
+import arrow
+import fitz
+
+from app.common import PaymentItem
+
+
+def github_pages(paid: Decimal, start: date, through: date) -> list[list[str]]:
+    return [
+        [
+            "GitHub, Inc",
+            "Receipt",
+            "Date",
+            start.isoformat(),
+            "For service through",
+            through.isoformat(),
+            "Total",
+            f"${paid} USD*",
+        ]
+    ]
+
+
+def mailgun_pages(paid: Decimal, start: date, through: date) -> list[list[str]]:
+    return [
+        [
+            "Mailgun Technologies, Inc.",
+            "INVOICE",
+            "PAID",
+            f"${paid}",
+            "Foundation",
+            "1",
+            "Foundation 50k",
+            f"{fmt(start, 'MMM D, YYYY')} - {fmt(through, 'MMM D, YYYY')}",
+        ],
+        ["Thank you for your business."],
+    ]
+
+
+def jira_pages(paid: Decimal, start: date, through: date) -> list[list[str]]:
+    return [
+        [
+            "Atlassian Pty Ltd",
+            "Tax Invoice",
+            f"Billing Period: {fmt(start, 'MMM D, YYYY')} - "
+            f"{fmt(through, 'MMM D, YYYY')}",
+            "Jira Software (Cloud) Standard",
+        ],
+        [f"Total Paid: USD {paid}"],
+    ]
+
+
+def onepassword_pages(paid: Decimal, start: date, through: date) -> list[list[str]]:
+    return [
+        [
+            "1Password",
+            "Receipt",
+            f"{fmt(start, 'MMMM D, YYYY')} to {fmt(through, 'MMMM D, YYYY')}",
+            "Amount paid",
+            f"${paid:,} USD",
+        ]
+    ]
+
+
+def azure_pages(paid: Decimal, start: date, through: date) -> list[list[str]]:
+    # Azure 账单通常有多页明细，金额在第二页，之后的明细页解析时不需要读取
+    return [
+        [
+            "Microsoft Corporation",
+            "Invoice",
+            "This invoice is for the billing period "
+            f"{fmt(start, 'MM/DD/YYYY')} - {fmt(through, 'MM/DD/YYYY')}",
+        ],
+        ["Summary", "Total Amount", f"USD {paid:,}"],
+        *[[f"Usage details page {idx}"] * 20 for idx in range(3)],
+    ]
+
+
+INVOICE_PAGES: dict[PaymentItem, Callable[[Decimal, date, date], list[list[str]]]] = {
+    PaymentItem.GITHUB: github_pages,
+    PaymentItem.MAILGUN: mailgun_pages,
+    PaymentItem.JIRA: jira_pages,
+    PaymentItem.ONEPASSWD: onepassword_pages,
+    PaymentItem.AZURE: azure_pages,
+}
+
+# 消费截图 OCR 文本中出现的商户名
+BILLING_MERCHANTS: dict[PaymentItem, str] = {
+    PaymentItem.GITHUB: "GITHUB, INC.",
+    PaymentItem.MAILGUN: "MAILGUN TECHNOLOGIES",
+    PaymentItem.JIRA: "ATLASSIAN",
+    PaymentItem.ONEPASSWD: "1PASSWORD",
+    PaymentItem.AZURE: "MICROSOFT*AZURE",
+}
+
+
+def fmt(day: date, format: str) -> str:
+    return arrow.get(day).format(format)
+
+
+def make_invoice(payment_item: PaymentItem, paid: Decimal, start: date) -> bytes:
+    through = start + timedelta(days=30)
+    doc = fitz.Document()
+    for lines in INVOICE_PAGES[payment_item](paid, start, through):
+        page = doc.new_page()
+        for idx, line in enumerate(lines):
+            page.insert_text((72, 72 + idx * 20), line)
+    return doc.tobytes()
+
+
+def make_screenshot(idx: int, width: int = 90, height: int = 195) -> bytes:
+    # 颜色由序号决定，保证每张截图内容不同
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, height), False)
+    pixmap.set_rect(pixmap.irect, (idx % 256, idx // 256 % 256, 128))
+    return pixmap.tobytes("png")
+
+
+def billing_ocr_text(payment_item: PaymentItem, usd: Decimal, rmb: Decimal) -> str:
+    return f"{BILLING_MERCHANTS[payment_item]} 消费\n" f"￥{rmb}已入账\n" f"交易地金额：{usd}\n"
+
+
+@dataclass
+class SyntheticInvoice:
+    payment_item: PaymentItem
+    paid: Decimal
+    service_start: str
+    service_through: str
+    content: bytes
+
+
+@dataclass
+class SyntheticBilling:
+    payment_item: PaymentItem
+    usd_amount: Decimal
+    rmb_amount: Decimal
+    content: bytes
+    ocr_text: str
+
+
+def make_dataset(
+    count: int, seed: int = 0
+) -> tuple[list[SyntheticInvoice], list[SyntheticBilling]]:
+    """生成 count 份账单和一一对应、金额相等的消费截图，账单类型轮流出现。"""
+    rng = random.Random(seed)
+    payment_items = list(INVOICE_PAGES)
+    invoices, billings = [], []
+    for idx in range(count):
+        payment_item = payment_items[idx % len(payment_items)]
+        paid = Decimal(rng.randint(100, 500000)).scaleb(-2)
+        start = date(2023, 1, 1) + timedelta(days=rng.randint(0, 300))
+        invoices.append(
+            SyntheticInvoice(
+                payment_item=payment_item,
+                paid=paid,
+                service_start=start.strftime("%Y.%m.%d"),
+                service_through=(start + timedelta(days=30)).strftime("%Y.%m.%d"),
+                content=make_invoice(payment_item, paid, start),
+            )
+        )
+        rmb = (paid * Decimal("7.2")).quantize(Decimal("0.01"))
+        billings.append(
+            SyntheticBilling(
+                payment_item=payment_item,
+                usd_amount=paid,
+                rmb_amount=rmb,
+                content=make_screenshot(idx),
+                ocr_text=billing_ocr_text(payment_item, paid, rmb),
+            )
+        )
+    return invoices, billings
@@ -1 +1,49 @@
 # coding=utf-8
+import fitz
+import openpyxl
+import pytest
+
+
+def make_pdf(pages: list[list[str]]) -> bytes:
+    doc = fitz.Document()
+    for lines in pages:
+        page = doc.new_page()
+        for idx, line in enumerate(lines):
+            page.insert_text((72, 72 + idx * 20), line)
+    return doc.tobytes()
+
+
+def github_invoice_lines(paid: str = "4.00") -> list[str]:
+    return [
+        "GitHub, Inc",
+        "Date",
+        "2023-08-01",
+        "For service through",
+        "2023-08-31",
+        "Total",
+        f"${paid} USD*",
+    ]
+
+
+@pytest.fixture
+def github_invoice():
+    return make_pdf([github_invoice_lines()])
+
+
+def make_png(seed: int = 0, width: int = 90, height: int = 195) -> bytes:
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, height), False)
+    pixmap.set_rect(pixmap.irect, (seed % 256, 255 - seed % 256, 128))
+    return pixmap.tobytes("png")
+
+
+def billing_text(keyword: str, usd: str, rmb: str) -> str:
+    return f"{keyword} 消费\n￥{rmb}已入账\n交易地金额：{usd}\n"
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "日常报销单"
+    path = tmp_path / "template.xlsx"
+    workbook.save(path)
+    return path
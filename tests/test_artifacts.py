@@ -0,0 +1,101 @@
+# coding=utf-8
+import os
+from decimal import Decimal
+
+import fitz
+
+from app.artifacts import (
+    ArtifactCache,
+    build_billing_document,
+    fingerprint_file,
+    fingerprint_payment_items,
+    generate_allinone_pdf,
+    load_application_template,
+    save_document,
+)
+from app.common import LocalFile, PaymentItem
+from app.document_cache import DocumentCache
+from app.reconcile import PaymentItemData
+from tests.conftest import github_invoice_lines, make_pdf, make_png
+
+
+def test_artifact_cache_lru():
+    cache = ArtifactCache(maxsize=2)
+    cache.get_or_create("a", lambda: b"a")
+    cache.get_or_create("b", lambda: b"b")
+    cache.get_or_create("a", lambda: b"new")
+    cache.get_or_create("c", lambda: b"c")
+
+    assert cache.get_or_create("a", lambda: b"new") == b"a"
+    assert cache.get_or_create("b", lambda: b"new") == b"new"
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_artifact_cache_max_bytes():
+    cache = ArtifactCache(max_bytes=5)
+    cache.get_or_create("a", lambda: b"123")
+    cache.get_or_create("b", lambda: b"123")
+
+    assert len(cache) == 1
+
+
+def test_fingerprint_payment_items():
+    def item(usd: str, content: bytes) -> PaymentItemData:
+        return PaymentItemData(
+            payment_item=PaymentItem.GITHUB,
+            usd_amount=Decimal(usd),
+            rmb_amount=Decimal("7.00"),
+            service_start="2023.08.01",
+            service_through="2023.08.31",
+            invoice_files=[LocalFile(name="a.pdf", content=content)],
+            billing_files=[],
+        )
+
+    def fingerprint(*items):
+        return fingerprint_payment_items(list(items), lambda file: file.getvalue())
+
+    assert fingerprint(item("1.00", b"a")) == fingerprint(item("1.00", b"a"))
+    assert fingerprint(item("1.00", b"a")) != fingerprint(item("1.00", b"b"))
+    assert fingerprint(item("1.00", b"a")) != fingerprint(item("2.00", b"a"))
+
+
+def test_load_application_template(template_path):
+    def load():
+        return load_application_template(
+            str(template_path), fingerprint_file(template_path)
+        )
+
+    template = load()
+    assert load() is template
+    # 模板文件改动后重新加载
+    stat = template_path.stat()
+    os.utime(template_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert load() is not template
+
+
+def test_generate_allinone_pdf_from_documents():
+    item = PaymentItemData(
+        payment_item=PaymentItem.GITHUB,
+        usd_amount=Decimal("4.00"),
+        rmb_amount=Decimal("28.00"),
+        service_start="2023.08.01",
+        service_through="2023.08.31",
+        invoice_files=[
+            LocalFile(name="a.pdf", content=make_pdf([github_invoice_lines()]))
+        ],
+        billing_files=[LocalFile(name="a.png", content=make_png())],
+    )
+    billing_document = build_billing_document([item])
+    billing_pdf = save_document(billing_document)
+
+    cache = DocumentCache()
+    allinone_pdf = generate_allinone_pdf(
+        [item],
+        billing_document,
+        open_invoice=lambda file: cache.open(file.name, file.getvalue),
+    )
+
+    assert allinone_pdf == generate_allinone_pdf([item], billing_pdf)
+    # 发票 1 页 + 补齐的空白页 + 截图 1 页
+    assert fitz.Document(stream=allinone_pdf).page_count == 3
+    assert cache.misses == 1
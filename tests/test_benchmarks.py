@@ -0,0 +1,93 @@
+# coding=utf-8
+import asyncio
+
+from app.common import PaymentItem
+from app.parse_billing import BillingParser
+from app.parse_invoice import InvoiceParser
+from app.service import ServiceConfig
+from benchmarks.importtime import build_report, parse_importtime, profile_import
+from benchmarks.load import run_load
+from benchmarks.run import find_regressions, run_benchmarks
+from benchmarks.synthetic import INVOICE_PAGES, make_dataset
+
+
+def test_synthetic_invoices_match_vendor_rules():
+    invoices, billings = make_dataset(len(INVOICE_PAGES) * 2)
+    assert {invoice.payment_item for invoice in invoices} == set(PaymentItem)
+
+    parser = InvoiceParser()
+    for invoice, billing in zip(invoices, billings):
+        info = parser.parse_info(invoice.content)
+        assert (
+            info.payment_item,
+            info.paid,
+            info.service_start,
+            info.service_through,
+        ) == (
+            invoice.payment_item,
+            invoice.paid,
+            invoice.service_start,
+            invoice.service_through,
+        )
+
+        info = BillingParser.parse_content(billing.ocr_text, "synthetic")
+        assert (info.payment_item, info.usd_amount, info.rmb_amount) == (
+            billing.payment_item,
+            billing.usd_amount,
+            billing.rmb_amount,
+        )
+
+
+def test_run_benchmarks():
+    report = run_benchmarks([3], repeat=1)
+
+    assert {result["name"] for result in report["results"]} >= {
+        "invoice.parse_info",
+        "reconcile",
+        "artifacts.allinone_pdf",
+    }
+    assert all(result["files"] == 3 for result in report["results"])
+
+    baseline = {
+        "results": [
+            {**result, "p50": result["p50"] / 2} for result in report["results"]
+        ]
+    }
+    assert find_regressions(report, report, tolerance=0.25) == []
+    assert len(find_regressions(report, baseline, tolerance=0.25)) == len(
+        report["results"]
+    )
+
+
+def test_run_load():
+    config = ServiceConfig(max_active=1, max_queued=0, invoice_workers=1, ocr_qps=None)
+    result = asyncio.run(run_load(clients=3, files=2, config=config))
+
+    assert (result.requests, result.failed) == (3, 0)
+    # 只能同时处理一个请求且不排队，其余客户端收到 503 后重试
+    assert result.rejected > 0
+    assert result.ocr_requests == 6
+
+
+def test_parse_importtime():
+    imports = parse_importtime(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       100 |        100 |     fitz\n"
+        "import time:        50 |        150 |   app.artifacts\n"
+        "import time:        10 |        160 | app.stapp\n"
+    )
+    assert [(item.module, item.depth) for item in imports] == [
+        ("fitz", 2),
+        ("app.artifacts", 1),
+        ("app.stapp", 0),
+    ]
+
+    report = build_report(imports, "app.stapp", top=1)
+    assert report["total_us"] == 160
+    assert report["deferred_loaded"] == ["fitz"]
+    assert [item["module"] for item in report["slowest"]] == ["app.stapp"]
+
+
+def test_stapp_cold_start_defers_heavy_imports():
+    report = build_report(profile_import("app.stapp"), "app.stapp")
+    assert report["deferred_loaded"] == []
@@ -0,0 +1,60 @@
+# coding=utf-8
+import random
+from io import BytesIO
+
+import fitz
+import pytest
+from PIL import Image
+
+from app.artifacts import save_document
+from app.billing_layout import BillingLayout, compose_billing_document, downsample_image
+from tests.conftest import make_png
+
+
+def make_noise_png(width: int, height: int) -> bytes:
+    rng = random.Random(0)
+    image = Image.frombytes("L", (width, height), rng.randbytes(width * height))
+    fp = BytesIO()
+    image.save(fp, format="PNG")
+    return fp.getvalue()
+
+
+def test_image_rects():
+    rects = BillingLayout().image_rects()
+    assert len(rects) == 4
+    assert rects[0].x0 == 20 and rects[-1].x1 == pytest.approx(
+        fitz.paper_size("A4-L")[0] - 20
+    )
+    assert rects[1].x0 - rects[0].x1 == pytest.approx(10)
+
+    rects = BillingLayout.from_config(
+        {"paper": "A4", "columns": 2, "rows": 2}
+    ).image_rects()
+    assert len(rects) == 4
+    assert rects[0].y1 < rects[2].y0
+
+
+def test_downsample_image():
+    layout = BillingLayout(dpi=72)
+    content = make_noise_png(1000, 2000)
+    data = downsample_image(content, fitz.Rect(0, 0, 100, 100), layout)
+
+    with Image.open(BytesIO(data)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (50, 100)
+
+    # 已经足够小的图片原样保留
+    small = make_png(width=8, height=8)
+    assert downsample_image(small, fitz.Rect(0, 0, 100, 100), layout) == small
+
+
+def test_compose_dedup_images():
+    first, second = make_noise_png(400, 800), make_png(seed=1)
+    doc = compose_billing_document(
+        [first, second, first, first, second], BillingLayout()
+    )
+
+    assert doc.page_count == 2
+    xrefs = {image[0] for page in doc for image in page.get_images()}
+    assert len(xrefs) == 2
+    assert len(save_document(doc)) < len(first) + len(second)
@@ -0,0 +1,96 @@
+# coding=utf-8
+import json
+
+import fitz
+import openpyxl
+
+from app import cli
+from app.aliyun_ocr import AliyunOCR
+from tests.conftest import billing_text, github_invoice_lines, make_pdf, make_png
+
+
+def test_main(tmp_path, template_path, monkeypatch, capsys):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "github.pdf").write_bytes(make_pdf([github_invoice_lines("4.00")]))
+    (input_dir / "github.png").write_bytes(make_png(1))
+    (input_dir / "github-copy.png").write_bytes(make_png(1))
+    (input_dir / "notes.txt").write_text("ignored")
+
+    ocr_contents = {make_png(1): billing_text("GitHub", "4.00", "28.80")}
+    monkeypatch.setattr(
+        AliyunOCR,
+        "recognize_general",
+        lambda self, filename: {"content": ocr_contents[filename]},
+    )
+
+    secrets = tmp_path / "secrets.toml"
+    secrets.write_text(
+        f"""
+[aliyun_ocr]
+access_key_id = "id"
+access_key_secret = "secret"
+
+[reimbursement_application]
+template_path = "{template_path}"
+submitter = "张三"
+
+[preprocess]
+enabled = false
+
+[ocr_cache]
+path = "{tmp_path / 'ocr.sqlite3'}"
+
+[ledger]
+path = "{tmp_path / 'ledger.sqlite3'}"
+"""
+    )
+
+    output_dir = tmp_path / "output"
+    metrics = tmp_path / "metrics.json"
+    assert (
+        cli.main(
+            [
+                str(input_dir),
+                "-o",
+                str(output_dir),
+                "--secrets",
+                str(secrets),
+                "--metrics",
+                str(metrics),
+            ]
+        )
+        == 0
+    )
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [record["type"] for record in records] == [
+        "duplicate",
+        "billing",
+        "invoice",
+        "artifact",
+        "artifact",
+        "artifact",
+    ]
+    assert records[2]["info"]["paid"] == "4.00"
+
+    (xlsx,) = output_dir.glob("*.xlsx")
+    assert openpyxl.load_workbook(xlsx)["日常报销单"]["G9"].value == 28.8
+    (billing_pdf,) = output_dir.glob("信用卡消费截图-*.pdf")
+    assert fitz.Document(billing_pdf).page_count == 1
+    (allinone_pdf,) = output_dir.glob("打印用 AllInOne -*.pdf")
+    assert fitz.Document(allinone_pdf).page_count == 3
+    assert {"invoice.parse_info", "cli.allinone_pdf"} <= set(
+        json.loads(metrics.read_text())["stages"]
+    )
+
+    # 第二次提交同样的文件会被台账拦下
+    capsys.readouterr()
+    argv = [str(input_dir), "-o", str(output_dir), "--secrets", str(secrets)]
+    assert cli.main(argv) == 1
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert {
+        record["file"] for record in records if record["type"] == "ledger_duplicate"
+    } == {"github.pdf", "github-copy.png"}
+    assert any(record["type"] == "ledger_overlap" for record in records)
+    assert cli.main(argv + ["--allow-duplicates"]) == 0
@@ -0,0 +1,53 @@
+# coding=utf-8
+from decimal import Decimal
+
+from app.document_cache import DocumentCache
+from app.parse_invoice import InvoiceParser
+from tests.conftest import github_invoice_lines, make_pdf
+
+
+def test_document_cache_opens_once():
+    calls = []
+
+    def get_content(paid: str):
+        def get() -> bytes:
+            calls.append(paid)
+            return make_pdf([github_invoice_lines(paid)])
+
+        return get
+
+    cache = DocumentCache(maxsize=1)
+    doc = cache.open("a", get_content("1.00"))
+    assert cache.open("a", get_content("2.00")) is doc
+    cache.open("b", get_content("3.00"))
+    cache.open("a", get_content("4.00"))
+
+    assert calls == ["1.00", "3.00", "4.00"]
+    assert (cache.hits, cache.misses, len(cache)) == (1, 3, 1)
+
+
+def test_parse_cached_documents():
+    cache = DocumentCache()
+    docs = [
+        cache.open(
+            str(idx), lambda idx=idx: make_pdf([github_invoice_lines(f"{idx}.00")])
+        )
+        for idx in range(2)
+    ]
+
+    # 解析不会关闭缓存中的文档，之后仍可继续使用
+    for _ in range(2):
+        results = InvoiceParser().parse_many(docs)
+        assert [result.info.paid for result in results] == [Decimal(0), Decimal(1)]
+    assert not any(doc.is_closed for doc in docs)
+
+
+def test_retain_closes_released_documents():
+    cache = DocumentCache()
+    a = cache.open("a", lambda: make_pdf([github_invoice_lines("1.00")]))
+    b = cache.open("b", lambda: make_pdf([github_invoice_lines("2.00")]))
+
+    cache.retain({"b"})
+    assert a.is_closed and not b.is_closed
+    assert len(cache) == 1
+    assert cache.open("b", lambda: b"") is b
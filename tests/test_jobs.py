@@ -0,0 +1,52 @@
+# coding=utf-8
+import threading
+
+import pytest
+
+from app.jobs import Job
+
+
+def test_job_results():
+    job = Job(["a", "b", "c"], iter([(2, "C"), (0, "A"), (1, "B")]), name="test")
+    job.start()
+
+    assert job.wait(5)
+    assert job.done and not job.cancelled
+    assert job.error is None
+    assert (job.completed, job.total) == (3, 3)
+    assert list(job.results().items()) == [("c", "C"), ("a", "A"), ("b", "B")]
+
+
+def test_job_cancel():
+    release = threading.Event()
+    closed = []
+
+    def iterate():
+        try:
+            for idx in range(3):
+                yield idx, idx
+                release.wait(5)
+        finally:
+            closed.append(True)
+
+    job = Job(["a", "b", "c"], iterate(), name="test").start()
+    job.cancel()
+    release.set()
+
+    assert job.wait(5)
+    assert job.cancelled
+    assert job.completed <= 1
+    assert closed == [True]
+
+
+def test_job_error():
+    def iterate():
+        yield 0, "A"
+        raise RuntimeError("boom")
+
+    job = Job(["a", "b"], iterate(), name="test").start()
+
+    assert job.wait(5)
+    assert job.results() == {"a": "A"}
+    with pytest.raises(RuntimeError):
+        raise job.error
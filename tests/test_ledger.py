@@ -0,0 +1,102 @@
+# coding=utf-8
+import dataclasses
+from decimal import Decimal
+
+from app.common import LocalFile, PaymentItem
+from app.ledger import Ledger
+from app.ocr_cache import sha256_digest
+from app.reconcile import PaymentItemData
+
+
+def file_digest(file: LocalFile) -> str:
+    return sha256_digest(file.getvalue())
+
+
+def item(payment_item, usd, start, through, content=None) -> PaymentItemData:
+    content = content or f"{payment_item}-{start}".encode()
+    return PaymentItemData(
+        payment_item=payment_item,
+        usd_amount=Decimal(usd),
+        rmb_amount=Decimal(usd) * 7,
+        service_start=start,
+        service_through=through,
+        invoice_files=[LocalFile(name=f"{payment_item}.pdf", content=content)],
+        billing_files=[LocalFile(name=f"{payment_item}.png", content=content + b"p")],
+    )
+
+
+def test_record_is_idempotent(tmp_path):
+    ledger = Ledger(tmp_path / "ledger.sqlite3")
+    items = [item(PaymentItem.GITHUB, "4.00", "2023.08.01", "2023.08.31")]
+
+    first = ledger.record("a", "张三", items, file_digest)
+    assert ledger.record("a", "张三", items, file_digest) == first
+    assert len(Ledger(tmp_path / "ledger.sqlite3")) == 1
+
+
+def test_check_duplicates_and_overlaps(tmp_path):
+    ledger = Ledger(tmp_path / "ledger.sqlite3")
+    august = item(PaymentItem.GITHUB, "4.00", "2023.08.01", "2023.08.31")
+    reimbursement_id = ledger.record("a", "张三", [august], file_digest)
+
+    check = ledger.check([august], file_digest)
+    assert [file.name for file, _ in check.duplicates] == ["github.pdf", "github.png"]
+    record = check.duplicates[0][1]
+    assert (record.submitter, record.usd_amount) == ("张三", Decimal("4.00"))
+    assert len(check.overlaps) == 1
+
+    # 同一账单重新下载后哈希不同，仍能按服务周期发现
+    resubmitted = item(
+        PaymentItem.GITHUB, "4.00", "2023.08.15", "2023.09.14", content=b"new"
+    )
+    check = ledger.check([resubmitted], file_digest)
+    assert check.duplicates == []
+    assert [record.service_start for _, record in check.overlaps] == ["2023.08.01"]
+
+    september = item(PaymentItem.GITHUB, "4.00", "2023.09.01", "2023.09.30")
+    jira = item(PaymentItem.JIRA, "10.00", "2023.08.01", "2023.08.31")
+    check = ledger.check([september, jira], file_digest)
+    assert check.duplicates == check.overlaps == []
+
+    check = ledger.check([august], file_digest, exclude=[reimbursement_id])
+    assert check.duplicates == check.overlaps == []
+
+
+def test_back_to_back_periods_do_not_overlap(tmp_path):
+    ledger = Ledger(tmp_path / "ledger.sqlite3")
+    july = item(PaymentItem.JIRA, "10.00", "2023.07.12", "2023.08.12")
+    ledger.record("a", "张三", [july], file_digest)
+
+    # 按月续费：上一期的结束日是下一期的开始日
+    august = item(PaymentItem.JIRA, "10.00", "2023.08.12", "2023.09.12")
+    assert ledger.check([august], file_digest).overlaps == []
+
+    shifted = item(PaymentItem.JIRA, "10.00", "2023.08.11", "2023.09.11")
+    assert len(ledger.check([shifted], file_digest).overlaps) == 1
+
+    # 只有一天的周期与完全相同的周期仍算重叠
+    day = item(PaymentItem.GITHUB, "1.00", "2023.09.01", "2023.09.01")
+    ledger.record("b", "张三", [day], file_digest)
+    resubmitted = item(
+        PaymentItem.GITHUB, "1.00", "2023.09.01", "2023.09.01", content=b"new"
+    )
+    assert len(ledger.check([resubmitted], file_digest).overlaps) == 1
+
+
+def test_periods_are_recorded_per_invoice(tmp_path):
+    ledger = Ledger(tmp_path / "ledger.sqlite3")
+    # 一次报销一月和三月的账单，整个报销项的周期覆盖了二月
+    january_and_march = dataclasses.replace(
+        item(PaymentItem.GITHUB, "8.00", "2023.01.01", "2023.03.31"),
+        service_periods=[("2023.01.01", "2023.01.31"), ("2023.03.01", "2023.03.31")],
+    )
+    ledger.record("a", "张三", [january_and_march], file_digest)
+
+    february = item(PaymentItem.GITHUB, "4.00", "2023.02.01", "2023.02.28")
+    assert ledger.check([february], file_digest).overlaps == []
+
+    march = item(PaymentItem.GITHUB, "4.00", "2023.03.15", "2023.04.14")
+    check = ledger.check([march], file_digest)
+    assert [
+        (record.service_start, record.service_through) for _, record in check.overlaps
+    ] == [("2023.03.01", "2023.03.31")]
@@ -0,0 +1,117 @@
+# coding=utf-8
+import json
+import mailbox
+from decimal import Decimal
+from email.message import EmailMessage
+
+import pytest
+
+from app import mail_ingest
+from app.common import PaymentItem
+from app.mail_ingest import InvoiceIndex, ingest, iter_messages
+from tests.conftest import github_invoice_lines, make_pdf
+
+
+def make_message(subject: str, attachments: list[tuple[str, bytes, str]]):
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["Message-ID"] = f"<{subject}@example.com>"
+    message.set_content("Your invoice is attached.")
+    for name, content, mime in attachments:
+        maintype, subtype = mime.split("/")
+        message.add_attachment(
+            content, maintype=maintype, subtype=subtype, filename=name
+        )
+    return message
+
+
+@pytest.fixture
+def messages():
+    august = make_pdf([github_invoice_lines("4.00")])
+    september = make_pdf([github_invoice_lines("5.00")])
+    return [
+        make_message("august", [("invoice.pdf", august, "application/pdf")]),
+        make_message(
+            "resent",
+            [
+                ("invoice.pdf", august, "application/pdf"),
+                ("receipt.txt", b"From the team", "text/plain"),
+            ],
+        ),
+        make_message(
+            "september",
+            [
+                ("september", september, "application/octet-stream"),
+                ("invoice-09.pdf", september, "application/octet-stream"),
+                ("notes.pdf", make_pdf([["hello"]]), "application/pdf"),
+            ],
+        ),
+    ]
+
+
+@pytest.fixture(params=["mbox", "maildir"])
+def archive(request, tmp_path, messages):
+    if request.param == "mbox":
+        path = tmp_path / "billing.mbox"
+        box = mailbox.mbox(path)
+    else:
+        path = tmp_path / "Maildir"
+        box = mailbox.Maildir(path)
+    for message in messages:
+        box.add(message)
+    box.close()
+    return path
+
+
+def test_iter_messages(archive):
+    subjects = sorted(message["Subject"] for message in iter_messages(archive))
+    assert subjects == ["august", "resent", "september"]
+
+
+def test_ingest(archive, tmp_path):
+    index = InvoiceIndex(tmp_path / "invoices")
+
+    results = list(ingest([archive], index, max_workers=1))
+    assert sorted(attachment.name for attachment, _, _ in results) == [
+        "invoice-09.pdf",
+        "invoice.pdf",
+        "notes.pdf",
+    ]
+    assert [result.error is None for _, result, _ in results].count(False) == 1
+    assert len(index) == 3
+
+    invoices = index.invoices(PaymentItem.GITHUB)
+    assert sorted(info.paid for _, info in invoices) == [
+        Decimal("4.00"),
+        Decimal("5.00"),
+    ]
+    assert all(file.getvalue().startswith(b"%PDF") for file, _ in invoices)
+    assert index.invoices(since="2023.09.01") == []
+
+    # 再次导入时已入库的附件全部跳过
+    assert list(ingest([archive], index, max_workers=1)) == []
+
+
+def test_main(archive, tmp_path, capsys):
+    output_dir = tmp_path / "invoices"
+    assert (
+        mail_ingest.main([str(archive), "-o", str(output_dir), "--max-workers", "1"])
+        == 0
+    )
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [record["type"] for record in records].count("invoice") == 3
+    assert records[-1]["type"] == "summary"
+    assert records[-1]["indexed"] == 3
+    assert (output_dir / "index.sqlite3").exists()
+
+
+def test_parse_attachments_in_pool(archive):
+    attachments = list(mail_ingest.iter_new_attachments([archive], set()))
+
+    results = list(
+        mail_ingest.parse_attachments(attachments, max_workers=2, max_pending=1)
+    )
+    assert sorted(attachment.name for attachment, _ in results) == sorted(
+        attachment.name for attachment in attachments
+    )
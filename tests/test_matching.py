@@ -0,0 +1,147 @@
+# coding=utf-8
+import random
+from decimal import Decimal
+
+import pytest
+
+from app.matching import (
+    SearchLimitExceeded,
+    find_assignment,
+    find_subset,
+    iter_subsets,
+    match_amounts,
+    to_cents,
+)
+
+
+def test_to_cents():
+    assert to_cents(Decimal("4.00")) == 400
+    assert to_cents(Decimal("1234.5")) == 123450
+    with pytest.raises(ValueError):
+        to_cents(Decimal("0.001"))
+
+
+def test_find_subset():
+    values = [500, 300, 200, 700, 100]
+    subset = find_subset(1000, values, range(len(values)))
+    assert sum(values[idx] for idx in subset) == 1000
+    assert find_subset(1000, values, [0, 1]) is None
+    assert find_subset(0, values, []) == []
+
+
+def test_match_amounts():
+    matching = match_amounts([400, 1000, 700, 350, 999], [400, 600, 400, 1050, 1001])
+
+    assert sorted(matching.groups) == [
+        ([0], [0]),
+        ([1], [1, 2]),
+        ([2, 3], [3]),
+    ]
+    assert matching.unmatched_invoices == [4]
+    assert matching.unmatched_charges == [4]
+
+
+def test_iter_subsets():
+    values = [500, 300, 200, 300, 100]
+    subsets = list(iter_subsets(800, values, range(len(values))))
+    assert sorted(sorted(values[idx] for idx in subset) for subset in subsets) == [
+        [100, 200, 500],
+        [200, 300, 300],
+        [300, 500],
+    ]
+    assert list(iter_subsets(1500, values, range(len(values)))) == []
+
+
+def test_find_assignment():
+    assert find_assignment([500, 500], [300, 700], [0, 1], [0, 1]) is None
+    assert find_assignment([500, 500], [300, 600], [0, 1], [0, 1]) is None
+    assert find_assignment([0, 300], [300, 0], [0, 1], [0, 1]) == [
+        ([1], [0]),
+        ([0], []),
+        ([], [1]),
+    ]
+    # 步数上限和机器快慢无关，超过时没有结论
+    with pytest.raises(SearchLimitExceeded):
+        find_assignment(
+            [800, 800, 1200],
+            [500, 300, 100, 700, 300, 900],
+            [0, 1, 2],
+            range(6),
+            max_steps=1,
+        )
+
+
+def test_match_amounts_greedy_groups_are_undone():
+    cases = [
+        # 贪心先把 12 配给 5+7，剩下的 8、8 无法配对；可以配成 5+3、1+7、3+9
+        ([800, 800, 1200], [500, 300, 100, 700, 300, 900]),
+        # 金额相等的 2 和 2 一对一配对后无法配对；可以配成 1+2=3、6=2+4
+        ([100, 200, 600], [300, 200, 400]),
+    ]
+    for invoices, charges in cases:
+        matching = match_amounts(invoices, charges)
+
+        assert matching.unmatched_invoices == matching.unmatched_charges == []
+        assert sorted(idx for idxes, _ in matching.groups for idx in idxes) == list(
+            range(len(invoices))
+        )
+        assert sorted(idx for _, idxes in matching.groups for idx in idxes) == list(
+            range(len(charges))
+        )
+        for invoice_idxes, charge_idxes in matching.groups:
+            assert sum(invoices[idx] for idx in invoice_idxes) == sum(
+                charges[idx] for idx in charge_idxes
+            )
+
+
+def test_match_amounts_equal_sums_without_assignment():
+    matching = match_amounts([500, 500], [300, 700])
+    assert matching.unmatched_invoices == [0, 1]
+    assert matching.unmatched_charges == [0, 1]
+
+
+def test_match_amounts_hundreds_of_items():
+    rng = random.Random(0)
+    invoices = [rng.randint(100, 500000) for _ in range(500)]
+    charges = list(invoices)
+    # 少数账单分两次或三次扣款，另有一次扣款合并了两张账单
+    for idx in range(0, 30, 3):
+        amount = charges.pop(idx)
+        charges += [amount // 3, amount // 3, amount - amount // 3 * 2]
+    invoices += [1234, 4321]
+    charges.append(5555)
+    rng.shuffle(charges)
+
+    matching = match_amounts(invoices, charges)
+    assert matching.unmatched_invoices == matching.unmatched_charges == []
+    for invoice_idxes, charge_idxes in matching.groups:
+        assert sum(invoices[idx] for idx in invoice_idxes) == sum(
+            charges[idx] for idx in charge_idxes
+        )
+
+
+def test_match_amounts_hundreds_of_split_charges():
+    # 金额小、拆分多时巧合的组合很多，精确搜索得不出结论，总和相等就不视为不匹配
+    rng = random.Random(300)
+    invoices = [rng.randint(100, 50000) for _ in range(300)]
+    charges = []
+    for amount in invoices:
+        if rng.random() < 0.3:
+            part = rng.randint(1, amount - 1)
+            charges += [part, amount - part]
+        else:
+            charges.append(amount)
+    rng.shuffle(charges)
+
+    matching = match_amounts(invoices, charges)
+    assert matching.unmatched_invoices == matching.unmatched_charges == []
+    assert sorted(idx for idxes, _ in matching.groups for idx in idxes) == list(
+        range(len(invoices))
+    )
+    assert sorted(idx for _, idxes in matching.groups for idx in idxes) == list(
+        range(len(charges))
+    )
+    for invoice_idxes, charge_idxes in matching.groups:
+        assert sum(invoices[idx] for idx in invoice_idxes) == sum(
+            charges[idx] for idx in charge_idxes
+        )
@@ -0,0 +1,104 @@
+# coding=utf-8
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.metrics import Metrics, percentile
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0
+    assert percentile([3, 1, 2, 4], 0.5) == 2
+    assert percentile(list(range(1, 101)), 0.95) == 95
+
+
+def test_spans_and_counters():
+    metrics = Metrics(window=2)
+
+    @metrics.timed("stage")
+    def fail():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        fail()
+    for seconds in (1.0, 3.0):
+        metrics.observe("stage", seconds)
+    metrics.incr("requests", 2)
+    metrics.register_collector("cache", lambda: {"hits": 1})
+    metrics.register_collector("cache", lambda: {"hits": 5})
+
+    snapshot = metrics.snapshot()
+    stage = snapshot["stages"]["stage"]
+    # 只保留最近 window 次耗时计算分位数，次数和总和一直累加
+    assert (stage["count"], stage["p50"], stage["p95"]) == (3, 1.0, 3.0)
+    assert stage["sum"] > 4.0
+    assert snapshot["counters"] == {"requests": 2, "cache.hits": 5}
+    assert snapshot["gauges"] == {}
+
+
+def test_write(tmp_path):
+    metrics = Metrics()
+    metrics.observe("ocr.request", 0.5)
+    metrics.incr("ocr_cache.hits")
+
+    metrics.write(tmp_path / "metrics.json")
+    assert (
+        json.loads((tmp_path / "metrics.json").read_text())["stages"]["ocr.request"][
+            "count"
+        ]
+        == 1
+    )
+
+    metrics.write(tmp_path / "metrics.prom")
+    text = (tmp_path / "metrics.prom").read_text()
+    assert (
+        'reimbursement_stage_seconds{stage="ocr.request",quantile="0.95"} 0.5' in text
+    )
+    assert "# TYPE reimbursement_ocr_cache_hits_total counter" in text
+    assert "reimbursement_ocr_cache_hits_total 1" in text
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_write_concurrently(tmp_path):
+    metrics = Metrics()
+    metrics.incr("requests")
+    path = tmp_path / "metrics.prom"
+
+    # 多个 session 同时导出到同一个文件
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: metrics.write(path), range(64)))
+
+    assert "reimbursement_requests_total 1" in path.read_text()
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_write_if_due(tmp_path):
+    metrics = Metrics()
+    path = tmp_path / "metrics.prom"
+
+    assert metrics.write_if_due(path, interval=60)
+    path.unlink()
+    # 后台任务轮询时的 rerun 不会每次都重写文件
+    assert not metrics.write_if_due(path, interval=60)
+    assert not path.exists()
+    assert metrics.write_if_due(path, interval=0)
+    assert path.exists()
+
+
+def test_gauges():
+    metrics = Metrics()
+    active = [3]
+    metrics.register_gauges("service", lambda: {"active": active[0]})
+    metrics.register_collector("service", lambda: {"rejected": 1})
+    active[0] = 1
+
+    snapshot = metrics.snapshot()
+    assert snapshot["gauges"] == {"service.active": 1}
+    assert snapshot["counters"] == {"service.rejected": 1}
+    text = metrics.to_prometheus()
+    assert (
+        "# TYPE reimbursement_service_active gauge\nreimbursement_service_active 1"
+        in text
+    )
+    assert "# TYPE reimbursement_service_rejected_total counter" in text
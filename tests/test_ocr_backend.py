@@ -0,0 +1,64 @@
+# coding=utf-8
+import pytest
+
+from app.ocr_backend import OCRBackend, OCRWord, ReplayMissError, ReplayOCR
+from app.parse_billing import BillingParser
+from tests.conftest import billing_text, make_png
+
+
+class CannedBackend(OCRBackend):
+    name = "canned"
+
+    def __init__(self, responses: dict[bytes, dict]):
+        self.responses = responses
+        self.calls = 0
+
+    def recognize_general(self, filename: bytes) -> dict:
+        self.calls += 1
+        return self.responses[bytes(filename)]
+
+
+def test_request_words():
+    backend = CannedBackend(
+        {
+            b"1": {
+                "content": "GitHub",
+                "prism_wordsInfo": [
+                    {"word": "Git", "x": 1, "y": 2, "width": 3, "height": 4},
+                    {
+                        "word": "Hub",
+                        "pos": [
+                            {"x": 10, "y": 2},
+                            {"x": 20, "y": 2},
+                            {"x": 20, "y": 6},
+                            {"x": 10, "y": 6},
+                        ],
+                    },
+                ],
+            }
+        }
+    )
+    assert backend.request(b"1") == "GitHub"
+    assert backend.request_words(b"1") == [
+        OCRWord("Git", 1, 2, 3, 4),
+        OCRWord("Hub", 10, 2, 10, 4),
+    ]
+
+
+def test_replay_records_and_replays(tmp_path):
+    path = tmp_path / "replay.jsonl"
+    text = billing_text("GitHub", "4.00", "28.80")
+    backend = CannedBackend({make_png(1): {"content": text}})
+
+    recorder = ReplayOCR(path, backend=backend)
+    assert recorder.name == "canned"
+    assert recorder.request(make_png(1)) == text
+    assert recorder.request(memoryview(make_png(1))) == text
+    assert backend.calls == 1 and len(recorder) == 1
+
+    # 离线回放：不需要任何 OCR 服务
+    replay = ReplayOCR(path)
+    parser = BillingParser("id", "secret", ocr_client=replay)
+    assert parser.parse_info(make_png(1)).usd_amount == 4
+    with pytest.raises(ReplayMissError):
+        replay.request(make_png(2))
@@ -0,0 +1,53 @@
+# coding=utf-8
+import time
+
+from app.ocr_cache import OCRCache, sha256_digest
+
+
+def test_get_put(tmp_path):
+    cache = OCRCache(tmp_path / "ocr.sqlite3")
+    digest = sha256_digest(b"image")
+
+    assert cache.get(digest) is None
+    cache.put(digest, "content")
+    assert cache.get(digest) == "content"
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_shared_between_instances(tmp_path):
+    OCRCache(tmp_path / "ocr.sqlite3").put("a", "content")
+
+    cache = OCRCache(tmp_path / "ocr.sqlite3")
+    assert cache.get("a") == "content"
+    assert cache.counters().hits == 1
+
+
+def test_evict_by_entries(tmp_path):
+    cache = OCRCache(tmp_path / "ocr.sqlite3", max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats.evictions == 1
+
+
+def test_evict_by_bytes(tmp_path):
+    cache = OCRCache(tmp_path / "ocr.sqlite3", max_bytes=10)
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    cache.put("c", "12345")
+
+    assert len(cache) == 2
+    assert cache.get("a") is None
+
+
+def test_evict_by_age(tmp_path):
+    cache = OCRCache(tmp_path / "ocr.sqlite3", max_age=60)
+    cache.put("a", "content")
+
+    assert cache.evict(now=time.time() + 120) == 1
+    assert len(cache) == 0
@@ -0,0 +1,156 @@
+# coding=utf-8
+import threading
+from decimal import Decimal
+
+import pytest
+
+from app.common import PaymentItem
+from app.concurrency import RateLimiter
+from app.ocr_cache import OCRCache
+from app.parse_billing import BillingParser
+from app.preprocess import PreprocessConfig
+from tests.conftest import billing_text
+
+
+class ThrottlingError(Exception):
+    code = "Throttling.User"
+
+
+class FakeOCR:
+    """本地替身，按图片内容返回预置的 OCR 文本。"""
+
+    def __init__(self, contents: dict[bytes, str], throttle_times: int = 0):
+        self.contents = contents
+        self.throttle_times = throttle_times
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def request(self, filename: bytes) -> str:
+        with self._lock:
+            self.calls += 1
+            if self.throttle_times:
+                self.throttle_times -= 1
+                raise ThrottlingError()
+        return self.contents[filename]
+
+
+@pytest.fixture
+def make_parser():
+    def make_parser(ocr_client, **kw) -> BillingParser:
+        parser = BillingParser("id", "secret", retry_backoff=0, **kw)
+        parser.aliyun_ocr_client = ocr_client
+        return parser
+
+    return make_parser
+
+
+def test_parse_info(make_parser):
+    parser = make_parser(FakeOCR({b"1": billing_text("GitHub, Inc.", "4.00", "28.80")}))
+
+    info = parser.parse_info(b"1")
+    assert info.payment_item == PaymentItem.GITHUB
+    assert info.usd_amount == Decimal("4.00")
+    assert info.rmb_amount == Decimal("28.80")
+
+
+def test_parse_info_with_cache(make_parser, tmp_path):
+    ocr = FakeOCR({b"1": billing_text("MAILGUN", "35.00", "252.00")})
+    parser = make_parser(ocr, ocr_cache=OCRCache(tmp_path / "ocr.sqlite3"))
+
+    assert parser.parse_info(b"1") == parser.parse_info(b"1")
+    assert ocr.calls == 1
+
+
+def test_parse_many(make_parser):
+    contents = {
+        str(idx).encode(): billing_text("Atlassian", f"{idx}.00", f"{idx * 7}.00")
+        for idx in range(1, 21)
+    }
+    contents[b"bad"] = "nothing"
+    parser = make_parser(FakeOCR(contents, throttle_times=3))
+
+    filenames = list(contents)
+    results = parser.parse_many(filenames, max_workers=8, qps=None)
+
+    assert len(results) == len(filenames)
+    for filename, result in zip(filenames[:-1], results[:-1]):
+        assert result.error is None
+        assert result.info.usd_amount == Decimal(filename.decode())
+    assert isinstance(results[-1].error, ValueError)
+    assert results[-1].info is None
+
+
+def test_parse_many_retries_exhausted(make_parser):
+    parser = make_parser(
+        FakeOCR({b"1": billing_text("1Password", "1.00", "7.00")}, throttle_times=5),
+        max_retries=2,
+    )
+
+    (result,) = parser.parse_many([b"1"], qps=None)
+    assert isinstance(result.error, ThrottlingError)
+    assert parser.aliyun_ocr_client.calls == 3
+
+
+def test_iter_many_close_cancels_pending(make_parser):
+    contents = {
+        str(idx).encode(): billing_text("GitHub", f"{idx}.00", f"{idx * 7}.00")
+        for idx in range(1, 11)
+    }
+    ocr = FakeOCR(contents)
+    parser = make_parser(ocr)
+
+    results = parser.iter_many(list(contents), max_workers=1, qps=None)
+    next(results)
+    results.close()
+
+    # 只有已经开始的请求会完成，排队中的请求被取消
+    assert ocr.calls < len(contents)
+
+
+def test_parse_many_shares_rate_limiter(make_parser):
+    class CountingLimiter(RateLimiter):
+        acquired = 0
+
+        def acquire(self) -> None:
+            CountingLimiter.acquired += 1
+
+    contents = {
+        str(idx).encode(): billing_text("GitHub", f"{idx}.00", f"{idx * 7}.00")
+        for idx in range(1, 5)
+    }
+    # 两个 session 各自解析，共用进程内的同一个限速器
+    rate_limiter = CountingLimiter(qps=None)
+    for _ in range(2):
+        parser = make_parser(FakeOCR(contents))
+        parser.parse_many(list(contents), qps=1, rate_limiter=rate_limiter)
+    assert CountingLimiter.acquired == 2 * len(contents)
+
+
+def test_parse_many_with_digests(make_parser, tmp_path):
+    cache = OCRCache(tmp_path / "ocr.sqlite3")
+    parser = make_parser(
+        FakeOCR({b"1": billing_text("GitHub", "4.00", "28.80")}), ocr_cache=cache
+    )
+
+    parser.parse_many([b"1"], qps=None, digests=["precomputed"])
+    assert cache.get("precomputed") is not None
+
+
+def test_preprocess_before_ocr(make_parser):
+    from tests.test_preprocess import make_screenshot
+
+    content = make_screenshot(600, 1200)
+    uploads = []
+
+    class RecordingOCR:
+        def request(self, filename: bytes) -> str:
+            uploads.append(filename)
+            return billing_text("GitHub", "4.00", "28.80")
+
+    parser = make_parser(RecordingOCR(), preprocess_config=PreprocessConfig())
+    parser.parse_info(content)
+
+    assert len(uploads[0]) < len(content)
+    assert parser.ocr_stats.requests == 1
+    assert parser.ocr_stats.original_bytes == len(content)
+    assert parser.ocr_stats.upload_bytes == len(uploads[0])
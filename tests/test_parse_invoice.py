@@ -0,0 +1,51 @@
+# coding=utf-8
+from decimal import Decimal
+
+from app.common import PaymentItem
+from app.parse_invoice import InvoiceParser
+from tests.conftest import github_invoice_lines, make_pdf
+
+
+def test_parse_info(github_invoice):
+    info = InvoiceParser().parse_info(github_invoice)
+
+    assert info.payment_item == PaymentItem.GITHUB
+    assert info.paid == Decimal("4.00")
+    assert info.service_start == "2023.08.01"
+    assert info.service_through == "2023.08.31"
+
+
+def test_parse_many():
+    filenames = [make_pdf([github_invoice_lines(f"{idx}.00")]) for idx in range(4)]
+    filenames.append(make_pdf([["Unknown vendor"]]))
+
+    for max_workers in (1, 2):
+        results = InvoiceParser().parse_many(filenames, max_workers=max_workers)
+        assert [result.info.paid for result in results[:-1]] == [
+            Decimal(idx) for idx in range(4)
+        ]
+        assert isinstance(results[-1].error, ValueError)
+        assert all(result.elapsed > 0 for result in results)
+
+
+def test_read_pdf_lazily():
+    filename = make_pdf([github_invoice_lines(), ["Page 2"], ["Page 3"]])
+
+    payment_item, content = InvoiceParser.read_pdf_lazily(filename)
+    assert payment_item == PaymentItem.GITHUB
+    assert "Page 2" not in content
+
+    payment_item, content = InvoiceParser.read_pdf_lazily(
+        make_pdf([["Page 1"], github_invoice_lines(), ["Page 3"]]), max_pages=1
+    )
+    assert payment_item is None
+    assert content.strip() == "Page 1"
+
+
+def test_parse_info_lazy_equals_full():
+    lines = github_invoice_lines()
+    # 字段跨两页，但每个标签和它的值在同一页：每页文本以换行结尾，跨页会多出一个换行
+    filename = make_pdf([lines[:5], lines[5:], ["Page 3"]])
+
+    parser = InvoiceParser()
+    assert parser.parse_info(filename) == parser.parse_info(filename, lazy=False)
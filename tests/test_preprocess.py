@@ -0,0 +1,41 @@
+# coding=utf-8
+import os
+from io import BytesIO
+
+from PIL import Image
+
+from app.preprocess import PreprocessConfig, preprocess_image
+
+
+def make_screenshot(width: int = 1170, height: int = 2532) -> bytes:
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    fp = BytesIO()
+    image.save(fp, format="PNG")
+    return fp.getvalue()
+
+
+def test_preprocess_image():
+    content = make_screenshot()
+    config = PreprocessConfig(crop=(0, 0.1, 1, 0.6), max_width=540, max_bytes=100_000)
+
+    data = preprocess_image(content, config)
+    assert len(data) < len(content)
+    with Image.open(BytesIO(data)) as image:
+        assert image.format == "JPEG"
+        assert image.mode == "L"
+        assert image.size == (540, round(2532 * 0.5 * 540 / 1170))
+
+
+def test_preprocess_keeps_smaller_original():
+    fp = BytesIO()
+    Image.new("RGB", (8, 8), "white").save(fp, format="PNG")
+
+    assert preprocess_image(fp.getvalue(), PreprocessConfig()) == fp.getvalue()
+
+
+def test_from_config():
+    assert PreprocessConfig.from_config({"enabled": False}) is None
+    config = PreprocessConfig.from_config({"crop": [0, 0.1, 1, 0.9], "quality": 70})
+    assert config.crop == (0, 0.1, 1, 0.9)
+    assert config.quality == 70
+    assert config.max_width == 1080
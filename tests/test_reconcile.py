@@ -0,0 +1,83 @@
+# coding=utf-8
+from decimal import Decimal
+
+import pytest
+
+from app.common import LocalFile, PaymentItem
+from app.parse_billing import BillingInfo
+from app.parse_invoice import InvoiceInfo
+from app.reconcile import ReconcileError, reconcile
+
+
+def invoice(payment_item, paid, start="2023.08.01", through="2023.08.31"):
+    return (
+        LocalFile(name=f"{payment_item}-{paid}.pdf", content=b""),
+        InvoiceInfo(payment_item, Decimal(paid), start, through),
+    )
+
+
+def billing(payment_item, usd, rmb):
+    return (
+        LocalFile(name=f"{payment_item}-{usd}.png", content=b""),
+        BillingInfo(payment_item, Decimal(usd), Decimal(rmb)),
+    )
+
+
+def test_reconcile():
+    payment_items = reconcile(
+        [
+            invoice(PaymentItem.GITHUB, "4.00", through="2023.08.31"),
+            invoice(PaymentItem.GITHUB, "21.00", start="2023.07.15"),
+            invoice(PaymentItem.JIRA, "10.00"),
+        ],
+        [
+            billing(PaymentItem.GITHUB, "25.00", "180.00"),
+            billing(PaymentItem.JIRA, "10.00", "72.00"),
+        ],
+    )
+
+    assert [item.payment_item for item in payment_items] == [
+        PaymentItem.JIRA,
+        PaymentItem.GITHUB,
+    ]
+    github = payment_items[1]
+    assert github.usd_amount == Decimal("25.00")
+    assert github.rmb_amount == Decimal("180.00")
+    assert (github.service_start, github.service_through) == (
+        "2023.07.15",
+        "2023.08.31",
+    )
+    assert len(github.invoice_files) == 2
+
+
+def test_reconcile_mismatch():
+    with pytest.raises(ReconcileError, match="github"):
+        reconcile(
+            [invoice(PaymentItem.GITHUB, "4.00")],
+            [billing(PaymentItem.GITHUB, "5.00", "36.00")],
+        )
+
+
+def test_reconcile_reports_unmatched_files():
+    with pytest.raises(ReconcileError, match="无法逐笔配对") as exc_info:
+        reconcile(
+            [
+                invoice(PaymentItem.AZURE, "5.00"),
+                invoice(PaymentItem.AZURE, "5.00", start="2023.07.01"),
+                invoice(PaymentItem.GITHUB, "4.00"),
+            ],
+            [
+                billing(PaymentItem.AZURE, "3.00", "21.60"),
+                billing(PaymentItem.AZURE, "7.00", "50.40"),
+                billing(PaymentItem.GITHUB, "4.00", "28.80"),
+            ],
+        )
+
+    assert [file.name for file, _ in exc_info.value.unmatched_invoices] == [
+        "azure-5.00.pdf",
+        "azure-5.00.pdf",
+    ]
+    assert [file.name for file, _ in exc_info.value.unmatched_billings] == [
+        "azure-3.00.png",
+        "azure-7.00.png",
+    ]
@@ -0,0 +1,24 @@
+# coding=utf-8
+import json
+from dataclasses import dataclass
+
+from app.common import ParseResult
+from app.records import emit, result_record
+
+
+@dataclass
+class Info:
+    amount: str
+
+
+def test_result_record(capsys):
+    ok = result_record(ParseResult(Info("1.00"), error=None, elapsed=0.12345), file="a")
+    assert ok == {"file": "a", "elapsed": 0.123, "info": {"amount": "1.00"}}
+
+    failed = result_record(
+        ParseResult(info=None, error=ValueError("坏文件"), elapsed=1), type="invoice"
+    )
+    assert failed == {"type": "invoice", "elapsed": 1, "error": "坏文件"}
+
+    emit(failed)
+    assert json.loads(capsys.readouterr().out) == failed
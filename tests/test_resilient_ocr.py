@@ -0,0 +1,150 @@
+# coding=utf-8
+import threading
+import time
+
+import pytest
+
+from app.metrics import METRICS
+from app.ocr_backend import OCRBackend, ReplayOCR
+from app.ocr_cache import sha256_digest
+from app.resilient_ocr import (
+    CircuitBreaker,
+    CircuitOpenError,
+    OCRTimeoutError,
+    ResilientOCR,
+    make_ocr_client,
+)
+from tests.test_parse_billing import ThrottlingError
+
+
+class ScriptedBackend(OCRBackend):
+    """按调用顺序使用预置的耗时；error 不为空时抛出。"""
+
+    name = "scripted"
+
+    def __init__(self, delays: list[float], error: Exception | None = None):
+        self.delays = delays
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def recognize_general(self, filename) -> dict:
+        with self._lock:
+            idx = self.calls
+            self.calls += 1
+        time.sleep(self.delays[min(idx, len(self.delays) - 1)])
+        if self.error is not None:
+            raise self.error
+        return {"content": f"call {idx}"}
+
+
+def test_deadline():
+    ocr = ResilientOCR(ScriptedBackend([0.5]), timeout=0.05)
+    start = time.perf_counter()
+    with pytest.raises(OCRTimeoutError):
+        ocr.request(b"1")
+    assert time.perf_counter() - start < 0.3
+    ocr.close()
+
+
+def test_hedged_request():
+    METRICS.reset()
+    backend = ScriptedBackend([0.01, 0.5, 0.01])
+    ocr = ResilientOCR(
+        backend, hedge_min_samples=1, hedge_min_delay=0.05, hedge_ratio=1
+    )
+    assert ocr.request(b"1") == "call 0"
+    # 第二次请求超过 hedge_delay 仍未返回，对冲请求先完成
+    assert ocr.hedge_delay() == 0.05
+    start = time.perf_counter()
+    assert ocr.request(b"1") == "call 2"
+    assert time.perf_counter() - start < 0.3
+    counters = METRICS.snapshot()["counters"]
+    assert counters["ocr.scripted.hedged"] == counters["ocr.scripted.hedge_wins"] == 1
+    assert METRICS.snapshot()["stages"]["ocr.scripted"]["count"] >= 2
+    ocr.close()
+
+
+def test_hedge_budget():
+    backend = ScriptedBackend([0.01, 0.1])
+    ocr = ResilientOCR(
+        backend, hedge_min_samples=1, hedge_min_delay=0.01, hedge_ratio=0.1
+    )
+    ocr.request(b"1")
+    ocr.request(b"1")
+    # 2 次请求的 10% 不足 1 次，不发对冲请求
+    assert (ocr.hedges, backend.calls) == (0, 2)
+    ocr.close()
+
+
+def test_circuit_breaker():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        failure_threshold=2, reset_timeout=10, clock=lambda: now[0]
+    )
+    backend = ScriptedBackend([0], error=ConnectionError("down"))
+    ocr = ResilientOCR(backend, breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            ocr.request(b"1")
+    assert breaker.state == "open"
+    # 熔断期间直接失败，不再请求后端
+    with pytest.raises(CircuitOpenError):
+        ocr.request(b"1")
+    assert backend.calls == 2
+
+    # 超时后放行一次试探请求，失败则重新熔断
+    now[0] = 11
+    assert breaker.state == "half_open"
+    with pytest.raises(ConnectionError):
+        ocr.request(b"1")
+    assert breaker.state == "open" and backend.calls == 3
+
+    now[0] = 22
+    backend.error = None
+    assert ocr.request(b"1") == "call 3"
+    assert breaker.state == "closed" and breaker.failures == 0
+    ocr.close()
+
+
+def test_throttling_is_not_a_failure():
+    breaker = CircuitBreaker(failure_threshold=1)
+    ocr = ResilientOCR(ScriptedBackend([0], error=ThrottlingError()), breaker=breaker)
+    with pytest.raises(ThrottlingError):
+        ocr.request(b"1")
+    assert breaker.state == "closed"
+    ocr.close()
+
+
+def test_fallback(tmp_path):
+    replay = ReplayOCR(tmp_path / "replay.jsonl")
+    replay.record(sha256_digest(b"1"), {"content": "recorded"})
+    ocr = ResilientOCR(
+        ScriptedBackend([0], error=ConnectionError("down")),
+        breaker=CircuitBreaker(failure_threshold=1),
+        fallback=replay,
+    )
+    assert ocr.request(b"1") == "recorded"
+    # 熔断后直接使用备用后端
+    assert ocr.request(b"1") == "recorded"
+    assert ocr.backend.calls == 1
+    ocr.close()
+
+
+def test_make_ocr_client(tmp_path):
+    ocr = make_ocr_client(
+        {"backend": "replay", "replay_path": str(tmp_path / "replay.jsonl")}
+    )
+    assert isinstance(ocr.backend, ReplayOCR) and ocr.name == "replay"
+    ocr.close()
+
+    ocr = make_ocr_client(
+        {"timeout": 3, "record_path": str(tmp_path / "record.jsonl")},
+        {"access_key_id": "id", "access_key_secret": "secret"},
+    )
+    assert ocr.name == "aliyun" and ocr.backend.backend.timeout == 3
+    ocr.close()
+
+    with pytest.raises(ValueError):
+        make_ocr_client({"backend": "unknown"})
@@ -0,0 +1,140 @@
+# coding=utf-8
+import asyncio
+import pathlib
+
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.service import (
+    XLSX_CONTENT_TYPE,
+    Backpressure,
+    ReimbursementService,
+    ServiceConfig,
+)
+from tests.conftest import billing_text, github_invoice_lines, make_pdf, make_png
+from tests.test_parse_billing import FakeOCR
+
+
+@pytest.fixture
+def service(tmp_path, template_path):
+    secrets = {
+        "aliyun_ocr": {"access_key_id": "id", "access_key_secret": "secret"},
+        "submitters": {
+            "zhangsan": {"name": "张三", "template_path": str(template_path)},
+            "lisi": {"name": "李四", "template_path": str(template_path)},
+        },
+        "ocr_cache": {"path": str(tmp_path / "ocr.sqlite3")},
+        "ledger": {"path": str(tmp_path / "ledger.sqlite3")},
+        "preprocess": {"enabled": False},
+    }
+    ocr = FakeOCR(
+        {
+            make_png(1): billing_text("GitHub", "4.00", "28.80"),
+            make_png(2): billing_text("GitHub", "5.00", "36.00"),
+        }
+    )
+    return ReimbursementService(
+        secrets,
+        ServiceConfig(
+            invoice_workers=1, ocr_qps=None, upload_dir=str(tmp_path / "uploads")
+        ),
+        ocr_client=ocr,
+    )
+
+
+def make_form(invoices: list[bytes], billings: list[bytes]) -> aiohttp.FormData:
+    form = aiohttp.FormData()
+    for idx, content in enumerate(invoices):
+        form.add_field("invoice", content, filename=f"invoice-{idx}.pdf")
+    for idx, content in enumerate(billings):
+        form.add_field("billing", content, filename=f"billing-{idx}.png")
+    return form
+
+
+def test_reimbursement(service):
+    async def scenario():
+        async with TestClient(TestServer(service.make_app())) as client:
+            invoices = [
+                make_pdf([github_invoice_lines(paid)]) for paid in ("4.00", "5.00")
+            ]
+            form = make_form(invoices, [make_png(1), make_png(2), make_png(1)])
+            response = await client.post("/reimbursements?submitter=lisi", data=form)
+            assert response.status == 200
+            data = await response.json()
+            assert [record["info"]["usd_amount"] for record in data["billings"]] == [
+                "4.00",
+                "5.00",
+            ]
+            assert len(data["payment_items"]) == 1
+            assert data["ledger"] == {"duplicates": [], "overlaps": []}
+
+            response = await client.get(data["artifacts"]["application"])
+            assert response.status == 200
+            assert "%E6%9D%8E%E5%9B%9B" in response.headers["Content-Disposition"]
+            assert response.content_type == XLSX_CONTENT_TYPE
+            response = await client.get(data["artifacts"]["allinone_pdf"])
+            assert (await response.read()).startswith(b"%PDF")
+
+            # 同一批文件再次提交：已经报销过，返回 409
+            form = make_form(invoices, [make_png(1), make_png(2)])
+            response = await client.post("/reimbursements?submitter=lisi", data=form)
+            assert response.status == 409
+            assert len((await response.json())["ledger"]["duplicates"]) == 4
+
+    asyncio.run(scenario())
+    assert service.billing_parser.aliyun_ocr_client.calls == 2
+    # 每个请求的上传文件在请求结束后删除
+    assert not any(pathlib.Path(service.config.upload_dir).iterdir())
+
+
+def test_reimbursement_errors(service):
+    async def scenario():
+        async with TestClient(TestServer(service.make_app())) as client:
+            response = await client.post(
+                "/reimbursements?submitter=nobody", data=make_form([], [])
+            )
+            assert response.status == 400
+
+            form = make_form([make_pdf([github_invoice_lines("9.00")])], [make_png(1)])
+            response = await client.post("/reimbursements?submitter=lisi", data=form)
+            assert response.status == 422
+            data = await response.json()
+            assert data["unmatched_invoices"] == ["invoice-0.pdf"]
+
+            response = await client.get("/artifacts/lisi/20230901/missing/application")
+            assert response.status == 404
+
+            response = await client.get("/metrics")
+            text = await response.text()
+            assert "reimbursement_service_rejected_total" in text
+            assert "# TYPE reimbursement_service_active gauge" in text
+
+    asyncio.run(scenario())
+
+
+def test_backpressure():
+    async def scenario():
+        backpressure = Backpressure(max_active=1, max_queued=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with backpressure.slot():
+                await release.wait()
+
+        active = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert (backpressure.active, backpressure.queued) == (1, 1)
+
+        with pytest.raises(aiohttp.web.HTTPServiceUnavailable):
+            async with backpressure.slot():
+                pass
+        assert backpressure.rejected == 1
+
+        release.set()
+        await asyncio.gather(active, queued)
+        assert (backpressure.active, backpressure.queued) == (0, 0)
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+# coding=utf-8
+import threading
+
+from app.common import LocalFile, ParseResult
+from app.session_store import Memo, ResultStore
+
+
+def test_result_store_sync_in_background():
+    release = threading.Event()
+
+    def iter_many(files):
+        for idx, file in enumerate(files):
+            release.wait(5)
+            if file.name == "bad":
+                yield idx, ParseResult(info=None, error=ValueError(), elapsed=0)
+            else:
+                yield idx, ParseResult(info=file.name, error=None, elapsed=0)
+
+    store = ResultStore()
+    files = {name: LocalFile(name=name, content=b"") for name in ("a", "b", "bad")}
+
+    results, job = store.sync_in_background(files, iter_many)
+    assert results == {} and job.total == 3
+    release.set()
+    assert job.wait(5)
+
+    results, job = store.sync_in_background(files, iter_many)
+    assert job is None
+    assert [result.info for result in results.values()] == ["a", "b", None]
+    # 失败的结果同样保存，不会在每次 rerun 时重新提交
+    assert set(store.errors) == {"bad"}
+    _, job = store.sync_in_background(files, iter_many)
+    assert job is None
+
+    # 手动重试后重新提交失败的文件
+    store.retry_errors()
+    _, job = store.sync_in_background(files, iter_many)
+    assert job.keys == ["bad"]
+    assert job.wait(5)
+    store.sync_in_background(files, iter_many)
+    assert set(store.errors) == {"bad"}
+
+    release.clear()
+    files["c"] = LocalFile(name="c", content=b"")
+    files["d"] = LocalFile(name="d", content=b"")
+    _, job = store.sync_in_background(files, iter_many)
+    assert job.keys == ["c", "d"]
+
+    # 移除任务中的文件时取消任务，剩下的文件重新提交
+    del files["c"]
+    _, resubmitted = store.sync_in_background(files, iter_many)
+    assert job.cancelled
+    assert resubmitted.keys == ["d"]
+    release.set()
+    assert job.wait(5) and resubmitted.wait(5)
+    results, _ = store.sync_in_background(files, iter_many)
+    assert list(results) == ["a", "b", "bad", "d"]
+
+
+def test_memo():
+    calls = []
+    memo = Memo()
+
+    assert memo.get(("a",), lambda: calls.append(1) or 1) == 1
+    assert memo.get(("a",), lambda: calls.append(2) or 2) == 1
+    assert memo.get(("b",), lambda: calls.append(3) or 3) == 3
+    assert calls == [1, 3]
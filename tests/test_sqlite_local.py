@@ -0,0 +1,18 @@
+# coding=utf-8
+from concurrent.futures import ThreadPoolExecutor
+
+from app.sqlite_local import LocalConnection
+
+
+def test_local_connection_per_thread(tmp_path):
+    db = LocalConnection(tmp_path / "data" / "db.sqlite3", "CREATE TABLE t (x);")
+    conn = db.get()
+    assert db.get() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other = executor.submit(db.get).result()
+        executor.submit(lambda: other.execute("INSERT INTO t VALUES (1)")).result()
+    assert other is not conn
+    # 自动提交，其他线程的写入立即可见
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
@@ -0,0 +1,119 @@
+# coding=utf-8
+from decimal import Decimal
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.ocr_backend import OCRWord
+from app.parse_billing import BillingParser
+from app.stitch import Tile, compose_tiles, plan_batches, split_words
+from tests.conftest import billing_text
+
+SHADES = [0, 40, 80, 120, 160]
+
+
+def make_image(shade: int, width: int = 300, height: int = 600) -> bytes:
+    fp = BytesIO()
+    Image.new("L", (width, height), shade).save(fp, format="PNG")
+    return fp.getvalue()
+
+
+class PositionedOCR:
+    """本地替身：按灰度区分拼接图中的各个子图，在对应位置返回预置文本。"""
+
+    def __init__(self, texts: dict[int, str]):
+        self.texts = texts
+        self.requests = 0
+        self.word_requests = 0
+
+    def text_for(self, pixel: int) -> str:
+        return self.texts[min(self.texts, key=lambda shade: abs(shade - pixel))]
+
+    def request(self, filename: bytes) -> str:
+        self.requests += 1
+        with Image.open(BytesIO(filename)) as image:
+            return self.text_for(image.convert("L").getpixel((0, 0)))
+
+    def request_words(self, filename: bytes) -> list[OCRWord]:
+        self.word_requests += 1
+        with Image.open(BytesIO(filename)) as image:
+            image = image.convert("L")
+            row = [image.getpixel((x, 10)) for x in range(image.width)]
+
+        words, x = [], 0
+        while x < len(row):
+            if row[x] > 240:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x] <= 240:
+                x += 1
+            lines = self.text_for(row[(start + x) // 2]).splitlines()
+            words.extend(
+                OCRWord(line, start + 5, 20 + 30 * idx, 100, 20)
+                for idx, line in enumerate(lines)
+            )
+        return words
+
+
+def test_plan_batches():
+    sizes = [(3000, 100)] * 3 + [(9000, 100), (100, 100)]
+
+    assert plan_batches(sizes, 4) == [[0, 1], [2], [3], [4]]
+    assert plan_batches([(100, 100)] * 5, 2) == [[0, 1], [2, 3], [4]]
+
+
+def test_compose_and_split():
+    composite, tiles = compose_tiles([make_image(0, 100, 200), make_image(0, 50, 80)])
+
+    with Image.open(BytesIO(composite)) as image:
+        assert image.size == (100 + 64 + 50, 200)
+    assert tiles == [Tile(0, 0, 100, 200), Tile(164, 0, 214, 80)]
+
+    words = [
+        OCRWord("已入账", 60, 11, 30, 10),
+        OCRWord("￥1.00", 10, 10, 40, 10),
+        OCRWord("第一行", 10, 0, 40, 10),
+        OCRWord("右图", 170, 10, 30, 10),
+    ]
+    assert split_words(words, tiles) == ["第一行 ￥1.00 已入账", "右图"]
+
+
+@pytest.fixture
+def parser():
+    parser = BillingParser("id", "secret", retry_backoff=0)
+    parser.aliyun_ocr_client = PositionedOCR(
+        {
+            shade: billing_text("GitHub", f"{idx}.00", f"{idx * 7}.00")
+            for idx, shade in enumerate(SHADES, start=1)
+        }
+        | {200: "no amount"}
+    )
+    return parser
+
+
+def test_parse_stitched(parser):
+    results = parser.parse_stitched(
+        [make_image(shade) for shade in SHADES], tiles_per_request=4, qps=None
+    )
+
+    assert [result.info.usd_amount for result in results] == [
+        Decimal(idx) for idx in range(1, 6)
+    ]
+    assert parser.aliyun_ocr_client.word_requests == 1
+    assert parser.aliyun_ocr_client.requests == 1
+
+
+def test_parse_stitched_fallback(parser):
+    results = parser.parse_stitched(
+        [make_image(0), make_image(200), b"not an image"],
+        tiles_per_request=4,
+        qps=None,
+    )
+
+    assert results[0].info.usd_amount == Decimal("1.00")
+    assert isinstance(results[1].error, ValueError)
+    assert results[2].error is not None
+    assert parser.aliyun_ocr_client.word_requests == 1
+    assert parser.aliyun_ocr_client.requests == 2
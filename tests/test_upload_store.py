@@ -0,0 +1,79 @@
+# coding=utf-8
+import dataclasses
+import gc
+from decimal import Decimal
+
+import pytest
+
+from app.artifacts import open_document
+from app.common import PaymentItem
+from app.parse_invoice import InvoiceParser
+from app.reconcile import PaymentItemData
+from app.upload_store import UploadStore
+from tests.conftest import github_invoice_lines, make_pdf
+
+
+def test_upload_store_writes_once(tmp_path):
+    store = UploadStore(tmp_path)
+    content = make_pdf([github_invoice_lines("4.00")])
+    a = store.put("a.pdf", content)
+    b = store.put("b.pdf", memoryview(content))
+    with store.writer("c.pdf") as writer:
+        for start in range(0, len(content), 100):
+            writer.write(content[start : start + 100])
+        c = writer.commit()
+
+    assert a.digest == b.digest == c.digest
+    assert (a.name, b.name, c.name) == ("a.pdf", "b.pdf", "c.pdf")
+    assert len(store) == 1 and a.digest in store
+    assert a.path.read_bytes() == content
+
+    buffer = a.getvalue()
+    assert buffer.readonly and buffer == content
+    # PDF 按路径打开，不复制内存映射
+    parser = InvoiceParser()
+    assert parser.parse_info(open_document(a)) == parser.parse_info(content)
+
+    empty = store.put("empty.pdf", b"")
+    assert empty.getvalue() == b""
+
+
+def test_upload_store_retain_and_close(tmp_path):
+    store = UploadStore(tmp_path)
+    keep = store.put("keep.pdf", make_pdf([github_invoice_lines("4.00")]))
+    drop = store.put("drop.pdf", make_pdf([github_invoice_lines("5.00")]))
+    # 仍在使用中的文档不受删除文件影响
+    doc = open_document(drop)
+
+    store.retain({keep.digest})
+    assert keep.digest in store and drop.digest not in store
+    assert doc.page_count == 1
+
+    with pytest.raises(FileNotFoundError):
+        drop.getvalue()
+    with store.writer("partial.pdf") as writer:
+        writer.write(b"%PDF")
+    store.close()
+    assert store.closed and not store.directory.exists()
+    assert doc.page_count == 1
+
+
+def test_upload_store_cleanup_on_collect(tmp_path):
+    store = UploadStore(tmp_path)
+    file = store.put("a.png", b"content")
+    directory = store.directory
+    item = PaymentItemData(
+        payment_item=PaymentItem.GITHUB,
+        usd_amount=Decimal("1.00"),
+        rmb_amount=Decimal("7.20"),
+        service_start="2023.09.01",
+        service_through="2023.09.30",
+        invoice_files=[],
+        billing_files=[file],
+    )
+    # 文件句柄复制时返回自身，不会复制存储
+    assert dataclasses.asdict(item)["billing_files"][0] is file
+
+    del store, file, item
+    gc.collect()
+    assert not directory.exists()
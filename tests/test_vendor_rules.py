@@ -0,0 +1,57 @@
+# coding=utf-8
+from app.common import PaymentItem
+from app.vendor_rules import (
+    DEFAULT_RULES_PATH,
+    VENDOR_RULES,
+    KeywordMatcher,
+    load_vendor_rules,
+)
+
+
+def test_keyword_matcher_priority():
+    matcher = KeywordMatcher({"GitHub, Inc": "github", "Microsoft": "azure"})
+
+    assert matcher.match("Microsoft ... GitHub, Inc") == "github"
+    assert matcher.match("Microsoft Corporation") == "azure"
+    assert matcher.match("Mailgun") is None
+
+
+def test_keyword_matcher_overlapping():
+    matcher = KeywordMatcher({"pass": 1, "1password": 2})
+
+    assert matcher.match("1password") == 1
+
+
+def test_payment_item_from_rules():
+    assert [item.value for item in PaymentItem] == list(VENDOR_RULES)
+    assert PaymentItem.ONEPASSWD == "1password"
+    assert PaymentItem.ONEPASSWD.name == "1Password"
+    assert PaymentItem.GITHUB.printing_pages == (0,)
+
+
+def test_load_vendor_rules(tmp_path):
+    path = tmp_path / "rules.toml"
+    path.write_text(
+        DEFAULT_RULES_PATH.read_text()
+        + """
+[[vendor]]
+key = "slack"
+member = "SLACK"
+name = "Slack"
+description = "即时通讯"
+printing_pages = [0]
+invoice_keywords = ["Slack Technologies"]
+billing_keywords = ["slack"]
+paid_regex = 'Total \\$(\\d+\\.\\d{2})'
+service_start_regex = '(\\d{4}-\\d{2}-\\d{2}) -'
+service_through_regex = '- (\\d{4}-\\d{2}-\\d{2})'
+date_format = "YYYY-MM-DD"
+sort_text = false
+"""
+    )
+
+    rules = load_vendor_rules(path)
+    assert list(rules)[-1] == "slack"
+    assert rules["slack"].priority == len(rules) - 1
+    assert rules["slack"].paid_regex.search("Total $1.00").group(1) == "1.00"
+    assert not rules["slack"].sort_text
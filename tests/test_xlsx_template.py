@@ -0,0 +1,68 @@
+# coding=utf-8
+import zipfile
+from decimal import Decimal
+from io import BytesIO
+
+import openpyxl
+import pytest
+from openpyxl.styles import Font
+
+from app.xlsx_template import XlsxTemplate
+
+
+@pytest.fixture
+def template_content():
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "封面"
+    worksheet = workbook.create_sheet("日常报销单")
+    worksheet["C5"] = "报销人"
+    worksheet["C5"].font = Font(bold=True)
+    worksheet["A9"] = "序号"
+    worksheet["G20"] = "=SUM(G9:G19)"
+
+    fp = BytesIO()
+    workbook.save(fp)
+    with zipfile.ZipFile(fp, "a") as zf:
+        zf.writestr("xl/vbaProject.bin", b"\x00vba\xff")
+    return fp.getvalue()
+
+
+def test_render(template_content):
+    template = XlsxTemplate(template_content, "日常报销单")
+    data = template.render(
+        {
+            "C5": "张三 & <李四>",
+            "B9": "2023.08.01",
+            "G9": Decimal("28.80"),
+            "G10": 7,
+            "C42": "张三",
+        }
+    )
+
+    worksheet = openpyxl.load_workbook(BytesIO(data))["日常报销单"]
+    assert worksheet["C5"].value == "张三 & <李四>"
+    assert worksheet["C5"].font.b
+    assert worksheet["A9"].value == "序号"
+    assert worksheet["B9"].value == "2023.08.01"
+    assert worksheet["G9"].value == 28.8
+    assert worksheet["G10"].value == 7
+    assert worksheet["G20"].value == "=SUM(G9:G19)"
+    assert worksheet["C42"].value == "张三"
+
+    with zipfile.ZipFile(BytesIO(data)) as zf:
+        assert zf.read("xl/vbaProject.bin") == b"\x00vba\xff"
+        assert 'fullCalcOnLoad="1"' in zf.read("xl/workbook.xml").decode()
+
+
+def test_render_is_repeatable(template_content):
+    template = XlsxTemplate(template_content, "日常报销单")
+    template.render({"C5": "张三"})
+
+    data = template.render({})
+    worksheet = openpyxl.load_workbook(BytesIO(data))["日常报销单"]
+    assert worksheet["C5"].value == "报销人"
+
+
+def test_unknown_sheet(template_content):
+    with pytest.raises(KeyError):
+        XlsxTemplate(template_content, "不存在")